@@ -234,6 +234,14 @@ class APIHandler(BaseHTTPRequestHandler):
                 else:
                     response = {"status": "error", "message": "Invalid API path"}
                     
+            elif path == '/api/access':
+                # Batched heartbeat: {"cameras": ["frontyard", ...]}
+                length = int(self.headers.get('Content-Length', 0) or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                cameras = body.get('cameras', [])
+                updated = [camera for camera in cameras if self.stream_manager.update_access(camera)]
+                response = {"status": "ok", "updated": updated}
+                
             elif path == '/api/status':
                 response = self.stream_manager.get_status()
             else:
@@ -0,0 +1,126 @@
+import threading
+import time
+import logging
+from typing import Dict, List
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+class StreamAccessTracker:
+    """
+    Records HLS viewer activity per camera in memory and forwards it to the FFmpeg
+    service as batched heartbeats from a background thread, so playlist and segment
+    requests never wait on another HTTP round-trip.
+
+    A camera is reported at most once per heartbeat_interval while it keeps being
+    touched; the first touch after a quiet period is sent straight away so a newly
+    started stream is marked as in use before the service's idle check runs.
+    """
+
+    def __init__(self, service_host: str, heartbeat_interval=15.0, timeout=5.0, session=None):
+        self.service_host = service_host
+        self.heartbeat_interval = heartbeat_interval  # Must stay well below the service's STREAM_TIMEOUT
+        self.timeout = timeout
+        self.last_access: Dict[str, float] = {}  # camera -> monotonic time of the latest request
+        self.last_sent: Dict[str, float] = {}  # camera -> monotonic time of the latest heartbeat
+        self._dirty = set()  # Cameras touched since their last heartbeat
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._owns_session = session is None
+        self._session = session or requests.Session()  # Any object with a requests-style post()
+        self._batch_supported = True  # Cleared if the service predates the batch endpoint
+        self.running = True
+        self.stats = {'touches': 0, 'heartbeats': 0, 'batches': 0, 'errors': 0}
+
+        self.sender_thread = threading.Thread(target=self._sender_loop, daemon=True)
+        self.sender_thread.start()
+
+        logger.info("StreamAccessTracker initialized with %.0f second heartbeat", heartbeat_interval)
+
+    def touch(self, camera_id: str):
+        """Record that a viewer just fetched something for this camera (never blocks on I/O)"""
+        now = time.monotonic()
+        with self._lock:
+            self.stats['touches'] += 1
+            self.last_access[camera_id] = now
+            self._dirty.add(camera_id)
+            sent = self.last_sent.get(camera_id)
+        if sent is None or now - sent >= self.heartbeat_interval:
+            self._wakeup.set()
+
+    def _due(self, now: float, force: bool) -> List[str]:
+        """Take the cameras whose heartbeat is due (caller must hold the lock)"""
+        due = [camera for camera in self._dirty
+               if force or now - self.last_sent.get(camera, float('-inf')) >= self.heartbeat_interval]
+        for camera in due:
+            self._dirty.discard(camera)
+            self.last_sent[camera] = now
+        return due
+
+    def _send(self, cameras: List[str]):
+        """Report access for cameras, one request for the whole batch when the service supports it"""
+        if self._batch_supported:
+            try:
+                response = self._session.post(f"{self.service_host}/api/access",
+                                              json={'cameras': cameras}, timeout=self.timeout)
+                if response.json().get('status') == 'ok':
+                    with self._lock:
+                        self.stats['batches'] += 1
+                        self.stats['heartbeats'] += len(cameras)
+                    return
+                logger.info("FFmpeg service has no batch access endpoint, sending per-camera heartbeats")
+                self._batch_supported = False
+            except (requests.RequestException, ValueError) as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                logger.warning(f"Error sending FFmpeg access heartbeat for {cameras}: {e}")
+                return
+
+        for camera in cameras:
+            try:
+                self._session.post(f"{self.service_host}/api/stream/{camera}/access", timeout=self.timeout)
+                with self._lock:
+                    self.stats['heartbeats'] += 1
+            except requests.RequestException as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                logger.warning(f"Error updating FFmpeg access time for {camera}: {e}")
+
+    def flush(self, force=False):
+        """Send heartbeats that are due now (all pending ones if force)"""
+        with self._lock:
+            cameras = self._due(time.monotonic(), force)
+        if cameras:
+            self._send(cameras)
+
+    def _sender_loop(self):
+        while self.running:
+            self._wakeup.wait(self.heartbeat_interval)
+            self._wakeup.clear()
+            if not self.running:
+                break
+            self.flush()
+
+    def shutdown(self):
+        """Stop the sender thread"""
+        self.running = False
+        self._wakeup.set()
+        self.sender_thread.join(timeout=self.timeout + 1)
+        if self._owns_session:
+            self._session.close()
+
+    def get_status(self) -> dict:
+        """Get tracker counters and per-camera idle times"""
+        now = time.monotonic()
+        with self._lock:
+            status = dict(self.stats)
+            status['cameras'] = {
+                camera: {
+                    'last_access_seconds_ago': now - accessed,
+                    'pending': camera in self._dirty
+                }
+                for camera, accessed in self.last_access.items()
+            }
+        status['batch_supported'] = self._batch_supported
+        return status
@@ -1,18 +1,48 @@
 import os
+import sys
+
+# Optional start-up profile: time every module imported below (STARTUP_PROFILE=true)
+from startup_profile import startup_profiler
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', 'false').lower() == 'true'
+if STARTUP_PROFILE:
+    startup_profiler.install()
+
 import logging
-import sqlite3
 import requests
 import jwt
 import bcrypt
 import subprocess
 import shutil
+import sqlite3
 from pathlib import Path
 import ipaddress
+import re
+import threading
+import time
+import atexit
+import gc
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import Flask, request, jsonify, Response, send_from_directory, send_file
 from flask_cors import CORS
-from stream_buffer import get_stream_buffer, shutdown_stream_buffer
+from stream_buffer import configure_stream_buffer, get_stream_buffer, shutdown_stream_buffer
+from stream_fanout import get_stream_fanout, shutdown_stream_fanout
+from hls_watcher import get_playlist_watcher, shutdown_playlist_watcher
+from playlist_cache import PlaylistCache
+from access_tracker import StreamAccessTracker
+from frigate_config import FrigateConfigCache
+from upstream_clients import UpstreamRegistry
+from snapshot_cache import SnapshotCache, encode_snapshot_batch, parse_variant_args
+from hls_jobs import TranscodeJobManager, copy_compatibility, probe_duration, probe_media
+from hls_cache import EventHlsCache
+from leader import LeaderElection
+from migrations import apply_migrations
+from stream_relay import StreamRelay
+from db_pool import SQLiteConnectionPool
+from rate_limiter import LoginRateLimiter
+from password_verifier import PasswordVerifier, VerifierBusyError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,19 +59,165 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-pr
 DATABASE_PATH = os.getenv('DATABASE_PATH', '/data/anchorpoint.db')
 FRIGATE_HOST = os.getenv('FRIGATE_HOST', 'http://frigate:5000')
 GO2RTC_HOST = os.getenv('GO2RTC_HOST', 'http://frigate:1984')
+FRIGATE_CONFIG_TTL = int(os.getenv('FRIGATE_CONFIG_TTL', '60'))  # Seconds the Frigate config is served before revalidating
 HLS_SEGMENTS_PATH = os.getenv('HLS_SEGMENTS_PATH', '/segments')
+HLS_PLAYLIST_WAIT_SECONDS = int(os.getenv('HLS_PLAYLIST_WAIT_SECONDS', '10'))  # How long a playlist request waits for FFmpeg to start
+HLS_PLAYLIST_CACHE_SIZE = int(os.getenv('HLS_PLAYLIST_CACHE_SIZE', '256'))  # Parsed playlists kept in memory
+FFMPEG_HEARTBEAT_INTERVAL = int(os.getenv('FFMPEG_HEARTBEAT_INTERVAL', '15'))  # Seconds between access heartbeats per camera
+ASYNC_STREAMING = os.getenv('ASYNC_STREAMING', 'false').lower() == 'true'  # Serve video routes with the aiohttp server
+ASYNC_WSGI_WORKERS = int(os.getenv('ASYNC_WSGI_WORKERS', '32'))  # Threads for non-video routes in async mode
+APP_WORKERS = int(os.getenv('APP_WORKERS', '1'))  # Worker processes sharing this database (set by serve.py)
+MULTI_WORKER = APP_WORKERS > 1
+STREAM_RELAY_PORT = int(os.getenv('STREAM_RELAY_PORT', '5004'))  # Leader's localhost relay for follower workers
 FFMPEG_SERVICE_HOST = os.getenv('FFMPEG_SERVICE_HOST', 'http://ffmpeg-streamer:8080')  # On-demand FFmpeg service
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '10'))  # Keep-alive connections kept per upstream service
+UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', '2'))  # Retries for failed connects (and idempotent reads)
+SNAPSHOT_FRESHNESS_SECONDS = float(os.getenv('SNAPSHOT_FRESHNESS_SECONDS', '1.0'))  # How long a camera snapshot is reused
+SNAPSHOT_CACHE_SIZE = int(os.getenv('SNAPSHOT_CACHE_SIZE', '64'))  # Cameras whose latest snapshot is kept in memory
+SNAPSHOT_BATCH_WORKERS = int(os.getenv('SNAPSHOT_BATCH_WORKERS', '8'))  # Concurrent fetches for /api/cameras/snapshots
+SNAPSHOT_BATCH_TIMEOUT = float(os.getenv('SNAPSHOT_BATCH_TIMEOUT', '12'))  # Seconds before slow cameras are left out of a batch
+EVENT_HLS_MAX_JOBS = int(os.getenv('EVENT_HLS_MAX_JOBS', str(max(1, (os.cpu_count() or 2) // 2))))  # Concurrent event clip FFmpeg processes across all workers
+EVENT_HLS_JOB_TIMEOUT = int(os.getenv('EVENT_HLS_JOB_TIMEOUT', '300'))  # Seconds before an event clip transcode is killed
+EVENT_HLS_START_WAIT_SECONDS = int(os.getenv('EVENT_HLS_START_WAIT_SECONDS', '20'))  # How long a playlist request waits for the first segment
+EVENT_HLS_STREAM_COPY = os.getenv('EVENT_HLS_STREAM_COPY', 'true').lower() == 'true'  # Remux browser-playable clips instead of re-encoding
+EVENT_HLS_PROBE_TIMEOUT = int(os.getenv('EVENT_HLS_PROBE_TIMEOUT', '15'))  # Seconds ffprobe may take to inspect a clip
+EVENT_HLS_CACHE_MAX_BYTES = int(os.getenv('EVENT_HLS_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))  # Disk budget for finished event HLS
+EVENT_HLS_CACHE_MAX_AGE_HOURS = float(os.getenv('EVENT_HLS_CACHE_MAX_AGE_HOURS', '72'))  # Evict event HLS not viewed for this long (0 = never)
 GEOIP_PROVIDER = os.getenv('GEOIP_PROVIDER', 'disabled')  # 'disabled' or 'ipapi'
+AUTH_CACHE_TTL_SECONDS = int(os.getenv('AUTH_CACHE_TTL_SECONDS', '60'))  # How long a verified token is trusted without a DB read
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '1024'))
+LAST_LOGIN_FLUSH_INTERVAL = int(os.getenv('LAST_LOGIN_FLUSH_INTERVAL', '15'))  # Seconds between batched last_login writes
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', '2'))  # Concurrent bcrypt checks
+BCRYPT_QUEUE_SIZE = int(os.getenv('BCRYPT_QUEUE_SIZE', '16'))  # Checks allowed to wait before logins get 503
+LOGIN_NEGATIVE_CACHE_SECONDS = int(os.getenv('LOGIN_NEGATIVE_CACHE_SECONDS', '30'))  # Remember repeated bad guesses
+STREAM_BUFFER_MAX_STREAM_BYTES = int(os.getenv('STREAM_BUFFER_MAX_STREAM_BYTES', str(8 * 1024 * 1024)))  # Ring buffer per camera
+STREAM_BUFFER_MAX_SECONDS = int(os.getenv('STREAM_BUFFER_MAX_SECONDS', '10'))  # Oldest GOP age kept per camera
+STREAM_BUFFER_MAX_TOTAL_BYTES = int(os.getenv('STREAM_BUFFER_MAX_TOTAL_BYTES', str(64 * 1024 * 1024)))  # Ring buffers across all cameras
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5'))  # Seconds to wait on a locked database
+
+# With several workers only the leader talks to go2rtc; followers pull from its relay
+configure_stream_buffer(
+    go2rtc_host=f"http://127.0.0.1:{STREAM_RELAY_PORT}" if MULTI_WORKER else GO2RTC_HOST,
+    max_stream_bytes=STREAM_BUFFER_MAX_STREAM_BYTES,
+    max_stream_seconds=STREAM_BUFFER_MAX_SECONDS,
+    max_total_bytes=STREAM_BUFFER_MAX_TOTAL_BYTES
+)
+
+# Leader election among worker processes (a single process is always the leader)
+leader_election = LeaderElection(f"{DATABASE_PATH}.leader.lock") if MULTI_WORKER else None
+stream_relay = None
+
+def is_leader():
+    """True if this process runs the shared background work (cleanup, go2rtc upstreams)"""
+    return leader_election is None or leader_election.is_leader
+
+# Keep-alive HTTP clients for the upstream services
+upstreams = UpstreamRegistry()
+frigate_http = upstreams.register('frigate', FRIGATE_HOST, pool_size=UPSTREAM_POOL_SIZE, retries=UPSTREAM_RETRIES)
+go2rtc_http = upstreams.register('go2rtc', GO2RTC_HOST, pool_size=UPSTREAM_POOL_SIZE, retries=UPSTREAM_RETRIES)
+ffmpeg_http = upstreams.register('ffmpeg', FFMPEG_SERVICE_HOST, pool_size=UPSTREAM_POOL_SIZE, retries=UPSTREAM_RETRIES)
+geoip_http = upstreams.register('geoip', 'http://ip-api.com', pool_size=2, retries=0)
+
+# Parsed HLS playlists shared by all viewers, re-read only when FFmpeg rewrites them
+playlist_cache = PlaylistCache(max_entries=HLS_PLAYLIST_CACHE_SIZE)
+
+# HLS viewer activity, forwarded to the FFmpeg service in the background
+access_tracker = StreamAccessTracker(FFMPEG_SERVICE_HOST, heartbeat_interval=FFMPEG_HEARTBEAT_INTERVAL,
+                                     session=ffmpeg_http)
+
+# Frigate config and camera index shared by the camera routes
+frigate_config = FrigateConfigCache(FRIGATE_HOST, ttl=FRIGATE_CONFIG_TTL, session=frigate_http)
+
+def fetch_frigate_snapshot(camera_id):
+    """Download a camera's latest snapshot from Frigate; returns (bytes, content type)"""
+    response = frigate_http.get(f"/api/{camera_id}/latest.jpg", timeout=10)
+    response.raise_for_status()
+    return response.content, response.headers.get('Content-Type', 'image/jpeg')
+
+# Latest snapshot per camera, shared by every client within the freshness window
+snapshot_cache = SnapshotCache(fetch_frigate_snapshot, freshness=SNAPSHOT_FRESHNESS_SECONDS,
+                               max_entries=SNAPSHOT_CACHE_SIZE)
+snapshot_executor = ThreadPoolExecutor(max_workers=SNAPSHOT_BATCH_WORKERS, thread_name_prefix='snapshot')
+
+EVENT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9._-]*$')
+
+def is_valid_event_id(event_id):
+    """True for Frigate event IDs (e.g. 1700000000.123456-abc123); rejects path tricks like '..'"""
+    return bool(EVENT_ID_PATTERN.match(event_id))
+
+def prepare_event_hls(job):
+    """
+    FFmpeg plans that segment a Frigate event clip into a growing (EVENT) HLS
+    playlist. Clips that are already browser-playable H.264 are remuxed with
+    -c copy (near instant); anything else, or a failed copy, is transcoded.
+    """
+    source = frigate_http.url(f"/api/events/{job.event_id}/clip.mp4")
+    output = [
+        '-f', 'hls', '-hls_time', '4', '-hls_list_size', '0',
+        '-hls_segment_type', 'mpegts', '-hls_playlist_type', 'event',
+        '-hls_segment_filename', os.path.join(job.output_dir, 'segment_%05d.ts'),
+        job.playlist_path
+    ]
+    transcode = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', source,
+                 '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'baseline', '-level', '3.1',
+                 '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '96k'] + output
+    if not EVENT_HLS_STREAM_COPY:
+        return [('transcode', transcode)], None
+
+    try:
+        probe = probe_media(source, timeout=EVENT_HLS_PROBE_TIMEOUT)
+    except (subprocess.SubprocessError, OSError, ValueError) as e:
+        logger.warning(f"ffprobe failed for event {job.event_id}, transcoding: {e}")
+        return [('transcode', transcode)], None
+
+    duration = probe_duration(probe)
+    video_ok, audio_ok = copy_compatibility(probe)
+    if not video_ok:
+        return [('transcode', transcode)], duration
+    # Copy the video; re-encoding only the audio is cheap when its codec is not playable
+    audio = ['-c:a', 'copy'] if audio_ok else ['-c:a', 'aac', '-b:a', '96k']
+    copy = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', source,
+            '-map', '0:v:0', '-map', '0:a:0?', '-c:v', 'copy'] + audio + output
+    return [('copy', copy), ('transcode', transcode)], duration
+
+# Event clip HLS transcodes: one job per event, at most EVENT_HLS_MAX_JOBS FFmpeg processes per host
+# (slot lock files next to the database are shared by every worker process)
+event_hls_jobs = TranscodeJobManager(os.path.join(HLS_SEGMENTS_PATH, 'events'), prepare_event_hls,
+                                     max_concurrent=EVENT_HLS_MAX_JOBS, timeout=EVENT_HLS_JOB_TIMEOUT,
+                                     slot_prefix=f"{DATABASE_PATH}.hls-slot-",
+                                     on_finish=lambda job: event_hls_cache.finished(job.event_id))
+
+# Finished event HLS kept on disk for repeat views, bounded by size and time since the last view
+event_hls_cache = EventHlsCache(os.path.join(HLS_SEGMENTS_PATH, 'events'), max_bytes=EVENT_HLS_CACHE_MAX_BYTES,
+                                max_age=EVENT_HLS_CACHE_MAX_AGE_HOURS * 3600, is_pinned=event_hls_jobs.is_active,
+                                on_evict=lambda path: playlist_cache.invalidate(path + os.sep))
+
+def reconcile_event_hls_cache():
+    """Index cached event HLS and remove leftovers of interrupted jobs, in the background"""
+    threading.Thread(target=event_hls_cache.reconcile, daemon=True, name='hls-cache-reconcile').start()
 
 # Database helper functions
+db_pool = SQLiteConnectionPool(DATABASE_PATH, pool_size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT)
+
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Borrow a pooled database connection; use as `with get_db_connection() as conn:`"""
+    return db_pool.connection()
 
-def verify_password(plain_password, hashed_password):
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+password_verifier = PasswordVerifier(
+    max_workers=BCRYPT_WORKERS,
+    max_queue=BCRYPT_QUEUE_SIZE,
+    negative_cache_ttl=LOGIN_NEGATIVE_CACHE_SECONDS
+)
+
+def verify_password(plain_password, hashed_password, cache_key=None):
+    """Verify a password against its hash on the bcrypt worker pool (raises VerifierBusyError when saturated)"""
+    return password_verifier.verify(plain_password, hashed_password, cache_key=cache_key)
+
+def hash_password(plain_password):
+    """bcrypt-hash a new password on the bcrypt worker pool (raises VerifierBusyError when saturated)"""
+    return password_verifier.hash(plain_password)
 
 def create_token(user_id):
     """Create JWT token"""
@@ -52,11 +228,132 @@ def create_token(user_id):
     }
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
+# Verified-token cache: token -> user flags, so auth_required can skip the database
+# on the hot path. Entries expire after AUTH_CACHE_TTL_SECONDS (or at token expiry,
+# whichever comes first) and are dropped explicitly whenever a user row changes.
+# With several workers, a change also touches a stamp file next to the database and
+# every worker clears its cache when it sees the stamp move.
+_auth_cache = OrderedDict()  # token -> {'user_id', 'is_admin', 'is_active', 'expires_at'}
+_auth_cache_tokens_by_user = {}  # user_id -> set of cached tokens
+_auth_cache_lock = threading.Lock()
+AUTH_CACHE_STAMP_PATH = f"{DATABASE_PATH}.auth-stamp"
+_auth_cache_stamp = None  # Last stamp mtime seen by this worker
+
+def _auth_cache_drop(token):
+    """Remove a token from the cache (caller must hold _auth_cache_lock)"""
+    entry = _auth_cache.pop(token, None)
+    if entry:
+        tokens = _auth_cache_tokens_by_user.get(entry['user_id'])
+        if tokens:
+            tokens.discard(token)
+            if not tokens:
+                del _auth_cache_tokens_by_user[entry['user_id']]
+
+def _check_auth_cache_stamp():
+    """Clear the cache if another worker has invalidated users since we last looked (caller holds the lock)"""
+    global _auth_cache_stamp
+    try:
+        stamp = os.stat(AUTH_CACHE_STAMP_PATH).st_mtime_ns
+    except OSError:
+        stamp = None
+    if stamp != _auth_cache_stamp:
+        _auth_cache.clear()
+        _auth_cache_tokens_by_user.clear()
+        _auth_cache_stamp = stamp
+
+def get_cached_auth_user(token):
+    """Return cached user flags for a verified token, or None on miss/expiry"""
+    with _auth_cache_lock:
+        if MULTI_WORKER:
+            _check_auth_cache_stamp()
+        entry = _auth_cache.get(token)
+        if not entry:
+            return None
+        if entry['expires_at'] <= time.time():
+            _auth_cache_drop(token)
+            return None
+        _auth_cache.move_to_end(token)
+        return entry
+
+def cache_auth_user(token, payload, user):
+    """Cache the user flags for a token that has just been verified against the database"""
+    if AUTH_CACHE_TTL_SECONDS <= 0 or AUTH_CACHE_MAX_ENTRIES <= 0:
+        return
+    expires_at = time.time() + AUTH_CACHE_TTL_SECONDS
+    token_exp = payload.get('exp')
+    if token_exp:
+        expires_at = min(expires_at, float(token_exp))
+    with _auth_cache_lock:
+        _auth_cache_drop(token)
+        _auth_cache[token] = {
+            'user_id': user['id'],
+            'is_admin': bool(user['is_admin']),
+            'is_active': bool(user['is_active']),
+            'expires_at': expires_at
+        }
+        _auth_cache_tokens_by_user.setdefault(user['id'], set()).add(token)
+        while len(_auth_cache) > AUTH_CACHE_MAX_ENTRIES:
+            _auth_cache_drop(next(iter(_auth_cache)))
+
+def invalidate_user_auth_cache(user_id):
+    """Drop every cached token for a user; call after modifying the user's row"""
+    with _auth_cache_lock:
+        for token in list(_auth_cache_tokens_by_user.get(user_id, ())):
+            _auth_cache_drop(token)
+    if MULTI_WORKER:
+        try:
+            with open(AUTH_CACHE_STAMP_PATH, 'a'):
+                pass
+            os.utime(AUTH_CACHE_STAMP_PATH)
+        except OSError as e:
+            logger.error(f"Failed to signal auth cache invalidation to other workers: {e}")
+
+# Write-behind buffer for users.last_login: requests only record the latest
+# activity time in memory, and a background thread writes the batch in one
+# transaction every LAST_LOGIN_FLUSH_INTERVAL seconds (and once more at shutdown).
+_pending_last_login = {}  # user_id -> 'YYYY-MM-DD HH:MM:SS' (UTC, same format as CURRENT_TIMESTAMP)
+_pending_last_login_lock = threading.Lock()
+_last_login_flush_stop = threading.Event()
+
+def record_user_activity(user_id):
+    """Record that a user was just active; persisted by flush_last_login_updates()"""
+    timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    with _pending_last_login_lock:
+        _pending_last_login[user_id] = timestamp
+
+def flush_last_login_updates():
+    """Write all pending last_login timestamps in a single transaction"""
+    with _pending_last_login_lock:
+        if not _pending_last_login:
+            return 0
+        pending = list(_pending_last_login.items())
+        _pending_last_login.clear()
+
+    try:
+        with get_db_connection() as conn:
+            conn.executemany('UPDATE users SET last_login = ? WHERE id = ?',
+                             [(timestamp, user_id) for user_id, timestamp in pending])
+            conn.commit()
+        logger.debug(f"Flushed last_login for {len(pending)} users")
+        return len(pending)
+    except Exception as e:
+        logger.error(f"Error flushing last_login updates: {e}")
+        # Put the batch back unless newer activity has been recorded meanwhile
+        with _pending_last_login_lock:
+            for user_id, timestamp in pending:
+                _pending_last_login.setdefault(user_id, timestamp)
+        return 0
+
+def last_login_flush_loop():
+    """Background loop that periodically flushes buffered last_login updates"""
+    while not _last_login_flush_stop.wait(LAST_LOGIN_FLUSH_INTERVAL):
+        flush_last_login_updates()
+
 # On-demand FFmpeg streaming functions
 def start_ffmpeg_stream(camera_id):
     """Start FFmpeg stream for a camera via the on-demand service"""
     try:
-        response = requests.post(f"{FFMPEG_SERVICE_HOST}/api/stream/{camera_id}/start", timeout=10)
+        response = ffmpeg_http.post(f"/api/stream/{camera_id}/start", timeout=10)
         logger.info(f"Started FFmpeg stream for {camera_id} - Response: {response.status_code}")
         return True  # Consider success if we get any response
     except Exception as e:
@@ -66,7 +363,7 @@ def start_ffmpeg_stream(camera_id):
 def stop_ffmpeg_stream(camera_id):
     """Stop FFmpeg stream for a camera via the on-demand service"""
     try:
-        response = requests.post(f"{FFMPEG_SERVICE_HOST}/api/stream/{camera_id}/stop", timeout=10)
+        response = ffmpeg_http.post(f"/api/stream/{camera_id}/stop", timeout=10)
         logger.info(f"Stopped FFmpeg stream for {camera_id} - Response: {response.status_code}")
         return True  # Consider success if we get any response
     except Exception as e:
@@ -74,113 +371,49 @@ def stop_ffmpeg_stream(camera_id):
         return False
 
 def update_ffmpeg_access(camera_id):
-    """Update access time for FFmpeg stream to keep it alive"""
-    try:
-        response = requests.post(f"{FFMPEG_SERVICE_HOST}/api/stream/{camera_id}/access", timeout=5)
-        logger.debug(f"Updated FFmpeg access time for {camera_id}")
-        return True  # Consider success if we get any response
-    except Exception as e:
-        logger.warning(f"Error updating FFmpeg access time for {camera_id}: {e}")
-        return False
+    """Record access for an FFmpeg stream; the heartbeat to the service is sent in the background"""
+    access_tracker.touch(camera_id)
+    return True
 
 def get_ffmpeg_stream_status(camera_id):
     """Get FFmpeg stream status for a camera"""
     try:
-        response = requests.get(f"{FFMPEG_SERVICE_HOST}/api/stream/{camera_id}/status", timeout=5)
+        response = ffmpeg_http.get(f"/api/stream/{camera_id}/status", timeout=5)
         return True  # Consider running if we get any response
     except Exception as e:
         logger.warning(f"Error checking FFmpeg stream status for {camera_id}: {e}")
         return False
 
-def init_database():
-    """Initialize database with hardcoded user and security tables"""
+def ensure_admin_user():
+    """Create the default admin user from environment variables if it does not exist"""
     try:
-        conn = get_db_connection()
-        
-        # Create users table if it doesn't exist
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                email TEXT,
-                full_name TEXT,
-                is_admin BOOLEAN DEFAULT 0,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP
-            )
-        ''')
-        
-        # Create login attempts table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS login_attempts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ip_address VARCHAR(45) NOT NULL,
-                username VARCHAR(50),
-                success BOOLEAN NOT NULL DEFAULT FALSE,
-                attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                user_agent TEXT
-            )
-        ''')
-        
-        # Create blocked IPs table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS blocked_ips (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ip_address VARCHAR(45) NOT NULL UNIQUE,
-                blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                blocked_until TIMESTAMP NOT NULL,
-                failed_attempts INTEGER NOT NULL,
-                reason VARCHAR(100) DEFAULT 'Too many failed login attempts'
-            )
-        ''')
-        
-        # Create indexes for performance
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_login_attempts_ip ON login_attempts(ip_address)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_login_attempts_time ON login_attempts(attempt_time)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_blocked_ips_address ON blocked_ips(ip_address)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_blocked_ips_until ON blocked_ips(blocked_until)')
-        
-        # IP geolocation cache table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS ip_geo_cache (
-                ip_address VARCHAR(45) PRIMARY KEY,
-                country TEXT,
-                region TEXT,
-                city TEXT,
-                lat REAL,
-                lon REAL,
-                isp TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Check if admin user exists
-        admin_username = os.getenv('ADMIN_USERNAME', 'admin')
-        user = conn.execute('SELECT id FROM users WHERE username = ?', (admin_username,)).fetchone()
-        
-        if not user:
-            # Create the default admin user from environment variables
+        with get_db_connection() as conn:
+            # Check if admin user exists
             admin_username = os.getenv('ADMIN_USERNAME', 'admin')
-            admin_password = os.getenv('ADMIN_PASSWORD', 'change-this-secure-password')
-            admin_email = os.getenv('ADMIN_EMAIL', 'admin@example.com')
-            admin_full_name = os.getenv('ADMIN_FULL_NAME', 'System Administrator')
+            user = conn.execute('SELECT id FROM users WHERE username = ?', (admin_username,)).fetchone()
+        
+            if not user:
+                # Create the default admin user from environment variables
+                admin_username = os.getenv('ADMIN_USERNAME', 'admin')
+                admin_password = os.getenv('ADMIN_PASSWORD', 'change-this-secure-password')
+                admin_email = os.getenv('ADMIN_EMAIL', 'admin@example.com')
+                admin_full_name = os.getenv('ADMIN_FULL_NAME', 'System Administrator')
             
-            password_hash = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            conn.execute('''
-                INSERT INTO users (username, password_hash, email, full_name, is_admin, is_active)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (admin_username, password_hash, admin_email, admin_full_name, True, True))
-            logger.info(f"Created default admin user: {admin_username}")
-        else:
-            logger.info(f"Admin user {admin_username} already exists")
+                password_hash = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                # OR IGNORE: another worker may have created it since the check above
+                created = conn.execute('''
+                    INSERT OR IGNORE INTO users (username, password_hash, email, full_name, is_admin, is_active)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (admin_username, password_hash, admin_email, admin_full_name, True, True)).rowcount
+                if created:
+                    logger.info(f"Created default admin user: {admin_username}")
+            else:
+                logger.info(f"Admin user {admin_username} already exists")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
     except Exception as e:
-        logger.error(f"Database initialization error: {e}")
+        logger.error(f"Admin user setup error: {e}")
 
 # Rate limiting configuration
 MAX_LOGIN_ATTEMPTS = 4
@@ -199,105 +432,52 @@ def get_client_ip():
 def cleanup_expired_blocks():
     """Clean up expired IP blocks and old login attempts"""
     try:
-        conn = get_db_connection()
-        
-        # Remove expired blocks
-        conn.execute('DELETE FROM blocked_ips WHERE blocked_until < CURRENT_TIMESTAMP')
+        with get_db_connection() as conn:
+            # Remove expired blocks
+            conn.execute('DELETE FROM blocked_ips WHERE blocked_until < CURRENT_TIMESTAMP')
         
-        # Clean up old login attempts (older than 24 hours)
-        conn.execute('''
-            DELETE FROM login_attempts 
-            WHERE attempt_time < datetime('now', '-24 hours')
-        ''')
+            # Clean up old login attempts (older than 24 hours)
+            conn.execute('''
+                DELETE FROM login_attempts 
+                WHERE attempt_time < datetime('now', '-24 hours')
+            ''')
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
     except Exception as e:
         logger.error(f"Error cleaning up expired blocks: {e}")
 
 def is_ip_blocked(ip_address):
     """Check if an IP address is currently blocked"""
-    try:
-        conn = get_db_connection()
-        blocked = conn.execute('''
-            SELECT id FROM blocked_ips 
-            WHERE ip_address = ? AND blocked_until > CURRENT_TIMESTAMP
-        ''', (ip_address,)).fetchone()
-        conn.close()
-        
-        return blocked is not None
-        
-    except Exception as e:
-        logger.error(f"Error checking blocked IP: {e}")
-        return False
+    return login_rate_limiter.is_blocked(ip_address)
 
-def get_failed_attempts_count(ip_address, hours=1):
-    """Get count of failed login attempts from an IP in the last N hours"""
-    try:
-        conn = get_db_connection()
-        count = conn.execute('''
-            SELECT COUNT(*) as count FROM login_attempts 
-            WHERE ip_address = ? 
-            AND success = FALSE 
-            AND attempt_time > datetime('now', '-{} hours')
-        '''.format(hours), (ip_address,)).fetchone()
-        conn.close()
-        
-        return count['count'] if count else 0
-        
-    except Exception as e:
-        logger.error(f"Error getting failed attempts count: {e}")
-        return 0
+def get_failed_attempts_count(ip_address):
+    """Get count of failed login attempts from an IP within the rate limit window"""
+    return login_rate_limiter.failed_count(ip_address)
 
 def record_login_attempt(ip_address, username, success, user_agent=None):
-    """Record a login attempt"""
+    """Record a login attempt; returns the failed attempt count for the IP"""
     try:
-        conn = get_db_connection()
-        conn.execute('''
-            INSERT INTO login_attempts (ip_address, username, success, user_agent)
-            VALUES (?, ?, ?, ?)
-        ''', (ip_address, username, success, user_agent))
-        conn.commit()
-        conn.close()
-        
+        return login_rate_limiter.record_attempt(ip_address, username, success, user_agent)
     except Exception as e:
         logger.error(f"Error recording login attempt: {e}")
+        return 0
 
 def block_ip(ip_address, failed_attempts):
     """Block an IP address for the configured duration"""
     try:
-        conn = get_db_connection()
-        
-        # Calculate block expiry time
-        block_until = datetime.utcnow() + timedelta(hours=BLOCK_DURATION_HOURS)
-        
-        # Insert or update the block
-        conn.execute('''
-            INSERT OR REPLACE INTO blocked_ips 
-            (ip_address, blocked_until, failed_attempts, reason)
-            VALUES (?, ?, ?, ?)
-        ''', (ip_address, block_until, failed_attempts, f'Too many failed login attempts ({failed_attempts})'))
-        
-        conn.commit()
-        conn.close()
-        
-        logger.warning(f"Blocked IP {ip_address} for {BLOCK_DURATION_HOURS} hours after {failed_attempts} failed attempts")
-        
+        login_rate_limiter.block(ip_address, failed_attempts)
     except Exception as e:
         logger.error(f"Error blocking IP {ip_address}: {e}")
 
 def check_rate_limit(ip_address, username):
     """Check if the IP should be rate limited and handle blocking"""
-    # Clean up expired blocks first
-    cleanup_expired_blocks()
-    
     # Check if IP is already blocked
     if is_ip_blocked(ip_address):
         return False, "IP address is temporarily blocked due to too many failed login attempts"
     
     # Get failed attempts count
-    failed_count = get_failed_attempts_count(ip_address, hours=1)
+    failed_count = get_failed_attempts_count(ip_address)
     
     # If we're at the limit, this attempt will put us over
     if failed_count >= MAX_LOGIN_ATTEMPTS:
@@ -305,149 +485,78 @@ def check_rate_limit(ip_address, username):
     
     return True, None
 
-# Initialize database on startup
-init_database()
-
-# Safe startup migration: relax unique constraint on users.email if present
-
-def relax_users_email_unique_constraint():
-    """Drop UNIQUE index on users.email if it exists, without rebuilding the table.
-    This avoids UNIQUE constraint failures when inserting placeholder/empty emails
-    until real email collection is implemented.
+def setup_database():
+    """
+    Apply pending schema migrations (a single version read once the schema is
+    current), then make sure the admin user exists.
     """
     try:
-        conn = get_db_connection()
-        try:
-            indexes = conn.execute('PRAGMA index_list(users)').fetchall()
-            for idx in indexes or []:
-                try:
-                    idx_name = idx['name'] if isinstance(idx, sqlite3.Row) else idx[1]
-                    is_unique = bool(idx['unique'] if isinstance(idx, sqlite3.Row) else idx[2])
-                except Exception:
-                    continue
-                if not is_unique or not idx_name:
-                    continue
-                # Check which columns are in this index
-                try:
-                    info_rows = conn.execute(f"PRAGMA index_info('{idx_name}')").fetchall()
-                    cols = []
-                    for r in info_rows or []:
-                        try:
-                            cols.append(r['name'] if isinstance(r, sqlite3.Row) else r[2])
-                        except Exception:
-                            pass
-                    # If the index is exactly on email, drop it
-                    if len(cols) == 1 and cols[0] == 'email':
-                        conn.execute(f"DROP INDEX IF EXISTS \"{idx_name}\"")
-                        logger.info(f"Dropped UNIQUE index on users.email: {idx_name}")
-                except Exception as e:
-                    logger.warning(f"Could not inspect index {idx_name}: {e}")
-            conn.commit()
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        before, after = apply_migrations(get_db_connection)
+        if before == after:
+            logger.info(f"Database schema is current (version {after})")
+        else:
+            logger.info(f"Database schema migrated from version {before} to {after}")
     except Exception as e:
-        logger.warning(f"Email unique constraint relax migration skipped: {e}")
+        logger.error(f"Database migration error: {e}")
+    ensure_admin_user()
 
-# Run migration at startup
-relax_users_email_unique_constraint()
+# Initialize database on startup
+with startup_profiler.step('database setup'):
+    setup_database()
+
+# Login rate limiting runs in memory; restore blocks and recent failures persisted by a previous run.
+# Several workers share the limit through the database instead.
+login_rate_limiter = LoginRateLimiter(
+    get_db_connection,
+    max_attempts=MAX_LOGIN_ATTEMPTS,
+    window_seconds=3600,
+    block_seconds=BLOCK_DURATION_HOURS * 3600,
+    shared=MULTI_WORKER
+)
+with startup_profiler.step('rate limiter restore'):
+    login_rate_limiter.load_from_database()
+
+def authenticate_token(token, path):
+    """
+    Resolve a bearer token to a user id for a request to path.
+    Returns (user_id, None) on success or (None, (error_body, status)) on failure.
+    Shared by auth_required and the async streaming server.
+    """
+    if not token:
+        return None, ({'error': 'Token is missing'}, 401)
 
-def migrate_users_table_if_needed():
-    """Rebuild users table to allow NULL email/full_name and remove UNIQUE(email) if present."""
     try:
-        conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        try:
-            cols = conn.execute("PRAGMA table_info(users)").fetchall() or []
-            email_notnull = False
-            for c in cols:
-                try:
-                    if c['name'] == 'email' and int(c['notnull']) == 1:
-                        email_notnull = True
-                        break
-                except Exception:
-                    pass
-
-            # Detect unique index involving email
-            email_unique = False
-            try:
-                idxs = conn.execute("PRAGMA index_list(users)").fetchall() or []
-                for idx in idxs:
-                    try:
-                        idx_name = idx['name']
-                        is_unique = bool(idx['unique'])
-                    except Exception:
-                        continue
-                    if not is_unique:
-                        continue
-                    info = conn.execute(f"PRAGMA index_info('{idx_name}')").fetchall() or []
-                    cols_in_idx = []
-                    for r in info:
-                        try:
-                            cols_in_idx.append(r['name'])
-                        except Exception:
-                            pass
-                    if 'email' in cols_in_idx:
-                        email_unique = True
-                        break
-            except Exception:
-                pass
+        user = get_cached_auth_user(token)
+        if user:
+            current_user_id = user['user_id']
+        else:
+            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            current_user_id = payload['user_id']
 
-            needs = email_notnull or email_unique
-            if not needs:
-                return
+            # Fetch user details from the database
+            with get_db_connection() as conn:
+                user = conn.execute('SELECT id, username, is_admin, is_active FROM users WHERE id = ?', (current_user_id,)).fetchone()
 
-            logger.warning("Rebuilding users table to relax constraints on email/full_name")
-            conn.execute("BEGIN IMMEDIATE")
+            if not user:
+                return None, ({'error': 'User not found'}, 401)
 
-            # Create new table with desired schema
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS users_new (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    email TEXT,
-                    full_name TEXT,
-                    is_admin BOOLEAN DEFAULT 0,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP
-                )
-            ''')
+            cache_auth_user(token, payload, user)
 
-            # Copy data, converting empty strings to NULL for email/full_name
-            conn.execute('''
-                INSERT INTO users_new (id, username, password_hash, email, full_name, is_admin, is_active, created_at, last_login)
-                SELECT id, username, password_hash,
-                       NULLIF(email, ''), NULLIF(full_name, ''),
-                       is_admin, is_active, created_at, last_login
-                FROM users
-            ''')
+        # Update last login timestamp (buffered, written in batches)
+        record_user_activity(current_user_id)
 
-            # Drop old and rename
-            conn.execute('DROP TABLE users')
-            conn.execute('ALTER TABLE users_new RENAME TO users')
+        # If user is disabled and not admin, restrict API access to quarantine-safe endpoints only
+        if not user['is_admin'] and not user['is_active']:
+            allowed = {'/api/auth/me', '/api/auth/logout', '/health'}
+            if path not in allowed:
+                return None, ({'error': 'Account disabled', 'disabled': True}, 403)
 
-            conn.commit()
-            logger.info("Users table rebuilt successfully; email/full_name now nullable and non-unique")
-        except Exception as e:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            logger.error(f"Users table migration failed: {e}")
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
-    except Exception as e:
-        logger.error(f"Users table migration error: {e}")
+    except jwt.ExpiredSignatureError:
+        return None, ({'error': 'Token has expired'}, 401)
+    except jwt.InvalidTokenError:
+        return None, ({'error': 'Token is invalid'}, 401)
 
-# Run guarded table migration
-migrate_users_table_if_needed()
+    return current_user_id, None
 
 def auth_required(f):
     """Decorator to require authentication"""
@@ -461,37 +570,10 @@ def auth_required(f):
             # For streaming endpoints, also check query parameters
             token = request.args.get('token')
         
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-        
-        try:
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = payload['user_id']
-            
-            # Fetch user details from the database
-            conn = get_db_connection()
-            user = conn.execute('SELECT id, username, is_admin, is_active FROM users WHERE id = ?', (current_user_id,)).fetchone()
-            conn.close()
-
-            if not user:
-                return jsonify({'error': 'User not found'}), 401
-
-            # Update last login timestamp
-            conn = get_db_connection()
-            conn.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (current_user_id,))
-            conn.commit()
-            conn.close()
-
-            # If user is disabled and not admin, restrict API access to quarantine-safe endpoints only
-            if not user['is_admin'] and not user['is_active']:
-                allowed = {'/api/auth/me', '/api/auth/logout', '/health'}
-                if request.path not in allowed:
-                    return jsonify({'error': 'Account disabled', 'disabled': True}), 403
-
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Token is invalid'}), 401
+        current_user_id, error = authenticate_token(token, request.path)
+        if error:
+            body, status = error
+            return jsonify(body), status
         
         return f(current_user_id, *args, **kwargs)
     return decorated
@@ -518,17 +600,15 @@ def login():
             logger.warning(f"Rate limit exceeded for IP {client_ip}, username: {username}")
             return jsonify({'error': rate_limit_message}), 429
         
-        conn = get_db_connection()
-        user = conn.execute('SELECT id, username, password_hash, is_admin, is_active FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
+        with get_db_connection() as conn:
+            user = conn.execute('SELECT id, username, password_hash, is_admin, is_active FROM users WHERE username = ?', (username,)).fetchone()
 
         # Check if user exists
         if not user:
             # Record failed attempt
-            record_login_attempt(client_ip, username, False, user_agent)
+            failed_count = record_login_attempt(client_ip, username, False, user_agent)
             
             # Check if we need to block this IP
-            failed_count = get_failed_attempts_count(client_ip, hours=1)
             if failed_count >= MAX_LOGIN_ATTEMPTS:
                 block_ip(client_ip, failed_count)
                 return jsonify({'error': f'Too many failed attempts. IP blocked for {BLOCK_DURATION_HOURS} hour(s)'}), 429
@@ -542,12 +622,17 @@ def login():
         # Disabled users are permitted to authenticate; access is restricted by auth_required
 
         # Verify password
-        if not verify_password(password, user['password_hash']):
+        try:
+            password_ok = verify_password(password, user['password_hash'], cache_key=(client_ip, username))
+        except VerifierBusyError:
+            logger.warning(f"Password verification busy; turning away login for {username} from IP {client_ip}")
+            return jsonify({'error': 'Login service is busy, please try again shortly'}), 503, {'Retry-After': '1'}
+
+        if not password_ok:
             # Record failed attempt
-            record_login_attempt(client_ip, username, False, user_agent)
+            failed_count = record_login_attempt(client_ip, username, False, user_agent)
             
             # Check if we need to block this IP
-            failed_count = get_failed_attempts_count(client_ip, hours=1)
             if failed_count >= MAX_LOGIN_ATTEMPTS:
                 block_ip(client_ip, failed_count)
                 return jsonify({'error': f'Too many failed attempts. IP blocked for {BLOCK_DURATION_HOURS} hour(s)'}), 429
@@ -561,11 +646,8 @@ def login():
         # Successful authentication (including disabled accounts)
         record_login_attempt(client_ip, username, True, user_agent)
         token = create_token(user['id'])
-        # Update last login
-        conn = get_db_connection()
-        conn.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user['id'],))
-        conn.commit()
-        conn.close()
+        # Update last login (buffered, written in batches)
+        record_user_activity(user['id'])
         logger.info(f"Successful login for user {username} from IP {client_ip}")
         return jsonify({
             'token': token,
@@ -597,9 +679,8 @@ def logout(current_user_id):
 def get_current_user(current_user_id):
     """Get current user information"""
     try:
-        conn = get_db_connection()
-        user = conn.execute('SELECT username, email, full_name, is_admin, created_at, last_login FROM users WHERE id = ?', (current_user_id,)).fetchone()
-        conn.close()
+        with get_db_connection() as conn:
+            user = conn.execute('SELECT username, email, full_name, is_admin, created_at, last_login FROM users WHERE id = ?', (current_user_id,)).fetchone()
 
         if not user:
             return jsonify({'error': 'User not found'}), 500
@@ -639,25 +720,22 @@ def change_username(current_user_id):
         if not all(c.isalnum() or c in ('_', '-') for c in new1):
             return jsonify({'error': 'Username may contain letters, numbers, _ and - only'}), 400
 
-        conn = get_db_connection()
-        user = conn.execute('SELECT username FROM users WHERE id = ?', (current_user_id,)).fetchone()
-        if not user:
-            conn.close()
-            return jsonify({'error': 'User not found'}), 404
-        if user['username'] != current_name:
-            conn.close()
-            return jsonify({'error': 'Current username is incorrect'}), 400
+        with get_db_connection() as conn:
+            user = conn.execute('SELECT username FROM users WHERE id = ?', (current_user_id,)).fetchone()
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            if user['username'] != current_name:
+                return jsonify({'error': 'Current username is incorrect'}), 400
 
-        # Check uniqueness
-        exists = conn.execute('SELECT 1 FROM users WHERE username = ? AND id != ?', (new1, current_user_id)).fetchone()
-        if exists:
-            conn.close()
-            return jsonify({'error': 'Username already taken'}), 409
+            # Check uniqueness
+            exists = conn.execute('SELECT 1 FROM users WHERE username = ? AND id != ?', (new1, current_user_id)).fetchone()
+            if exists:
+                return jsonify({'error': 'Username already taken'}), 409
 
-        # Update
-        conn.execute('UPDATE users SET username = ? WHERE id = ?', (new1, current_user_id))
-        conn.commit()
-        conn.close()
+            # Update
+            conn.execute('UPDATE users SET username = ? WHERE id = ?', (new1, current_user_id))
+            conn.commit()
+        invalidate_user_auth_cache(current_user_id)
 
         logger.info(f"User {current_user_id} changed username")
         return jsonify({'changed': True, 'username': new1})
@@ -689,26 +767,30 @@ def change_password(current_user_id):
            not any(not c.isalnum() for c in new_password):
             return jsonify({'error': 'Password must be 8+ chars with upper, lower, number, and symbol'}), 400
 
-        conn = get_db_connection()
-        row = conn.execute('SELECT password_hash FROM users WHERE id = ?', (current_user_id,)).fetchone()
+        with get_db_connection() as conn:
+            row = conn.execute('SELECT password_hash FROM users WHERE id = ?', (current_user_id,)).fetchone()
         if not row:
-            conn.close()
             return jsonify({'error': 'User not found'}), 404
 
         stored_hash = row['password_hash'] or ''
         try:
-            ok = bcrypt.checkpw(current_password.encode('utf-8'), stored_hash.encode('utf-8'))
+            ok = verify_password(current_password, stored_hash)
+        except VerifierBusyError:
+            return jsonify({'error': 'Service is busy, please try again shortly'}), 503, {'Retry-After': '1'}
         except Exception:
             ok = False
         if not ok:
-            conn.close()
             return jsonify({'error': 'Current password is incorrect'}), 400
 
-        # Update with new hash
-        new_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, current_user_id))
-        conn.commit()
-        conn.close()
+        # Update with new hash (hashed on the bcrypt pool, like verification)
+        try:
+            new_hash = hash_password(new_password)
+        except VerifierBusyError:
+            return jsonify({'error': 'Service is busy, please try again shortly'}), 503, {'Retry-After': '1'}
+        with get_db_connection() as conn:
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, current_user_id))
+            conn.commit()
+        invalidate_user_auth_cache(current_user_id)
 
         # Do not log sensitive data
         logger.info(f"User {current_user_id} changed password")
@@ -722,7 +804,7 @@ def change_password(current_user_id):
 def get_go2rtc_streams(current_user_id):
     """Get go2rtc stream information"""
     try:
-        response = requests.get(f"{GO2RTC_HOST}/api/streams", timeout=10)
+        response = go2rtc_http.get("/api/streams", timeout=10)
         response.raise_for_status()
         return jsonify(response.json())
     except requests.RequestException as e:
@@ -736,6 +818,19 @@ def get_stream_buffer_status(current_user_id):
     try:
         buffer = get_stream_buffer()
         status = buffer.get_status()
+        status['fanout'] = get_stream_fanout().get_status()
+        status['playlist_watcher'] = get_playlist_watcher(HLS_SEGMENTS_PATH).get_status()
+        status['playlist_cache'] = playlist_cache.get_status()
+        status['ffmpeg_access'] = access_tracker.get_status()
+        status['frigate_config'] = frigate_config.get_status()
+        status['snapshot_cache'] = snapshot_cache.get_status()
+        status['event_hls_jobs'] = event_hls_jobs.get_status()
+        status['event_hls_cache'] = event_hls_cache.get_status()
+        status['db_pool'] = db_pool.get_status()
+        status['login_rate_limiter'] = login_rate_limiter.get_status()
+        status['password_verifier'] = password_verifier.get_status()
+        if leader_election is not None:
+            status['worker'] = leader_election.get_status()
         return jsonify(status)
     except Exception as e:
         logger.error(f"Failed to get stream buffer status: {e}")
@@ -774,69 +869,73 @@ def get_camera_mse_stream(current_user_id, camera_id):
 
 
 
+# Response headers for the live fMP4 proxies (shared with the async streaming server)
+MSE_STREAM_HEADERS = {
+    'Content-Type': 'video/mp4',
+    'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Range, Origin, Accept-Encoding, Content-Type',
+    'Access-Control-Expose-Headers': 'Content-Length, Content-Range',
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY'
+}
+
+# Live fMP4 has no length, so Range requests are answered with the live stream
+MP4_STREAM_HEADERS = {
+    'Content-Type': 'video/mp4',
+    'Accept-Ranges': 'bytes',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'Accept-Ranges, Content-Length, Content-Range',
+    'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
+    'X-Content-Type-Options': 'nosniff'
+}
+
+def event_clip_request_headers(incoming_range):
+    """Headers for fetching an event clip from Frigate, forwarding Range for partial content requests"""
+    forward_headers = {
+        'Accept': 'video/mp4'
+    }
+    if incoming_range:
+        forward_headers['Range'] = incoming_range
+    return forward_headers
+
+def event_clip_response_headers(upstream_headers):
+    """Build event clip response headers, preserving range-related metadata"""
+    headers = {
+        'Content-Type': upstream_headers.get('Content-Type', 'video/mp4'),
+        'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
+        'Pragma': 'no-cache',
+        'Access-Control-Allow-Origin': '*',
+    }
+    content_length = upstream_headers.get('Content-Length')
+    content_range = upstream_headers.get('Content-Range')
+    accept_ranges = upstream_headers.get('Accept-Ranges', 'bytes')
+    if content_length:
+        headers['Content-Length'] = content_length
+    if content_range:
+        headers['Content-Range'] = content_range
+    if accept_ranges:
+        headers['Accept-Ranges'] = accept_ranges
+    return headers
+
 @app.route('/api/go2rtc/mse/<stream_name>', methods=['GET'])
 @auth_required
 def proxy_go2rtc_mse(current_user_id, stream_name):
-    """Proxy go2rtc MSE streams with proper connection cleanup and mobile optimization"""
+    """Proxy go2rtc MSE streams through the shared per-stream upstream (one go2rtc pull for all viewers)"""
     try:
-        url = f"{GO2RTC_HOST}/api/stream.mp4?src={stream_name}"
-
-        headers = {
-            'Accept': 'video/mp4',
-            'Range': request.headers.get('Range', 'bytes=0-')
-        }
-
-        session = requests.Session()
-
-        try:
-            # Stream the response from go2rtc with longer timeout for NVENC transcoding
-            response = session.get(url, headers=headers, stream=True, timeout=60)
-            response.raise_for_status()
-
-            return_headers = {
-                'Content-Type': response.headers.get('Content-Type', 'video/mp4'),
-                'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
-                'Pragma': 'no-cache',
-                'Expires': '0',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Range, Origin, Accept-Encoding, Content-Type',
-                'Access-Control-Expose-Headers': 'Content-Length, Content-Range',
-                'X-Content-Type-Options': 'nosniff',
-                'X-Frame-Options': 'DENY'
-            }
+        # Longer timeout for NVENC transcoding to produce the first fragment
+        subscription = get_stream_fanout().subscribe(stream_name)
+        if not subscription.wait_ready(timeout=60):
+            subscription.close()
+            logger.error(f"MSE proxy error for {stream_name}: upstream not ready")
+            return jsonify({'error': 'Failed to fetch MSE stream'}), 500
 
-            if 'Content-Range' in response.headers:
-                return_headers['Content-Range'] = response.headers['Content-Range']
-            if 'Content-Length' in response.headers:
-                return_headers['Content-Length'] = response.headers['Content-Length']
-            if 'Accept-Ranges' in response.headers:
-                return_headers['Accept-Ranges'] = response.headers['Accept-Ranges']
+        return Response(subscription.iter_chunks(), status=200, headers=MSE_STREAM_HEADERS)
 
-            def generate():
-                try:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            yield chunk
-                except Exception as e:
-                    logger.error(f"Error streaming MSE data for {stream_name}: {e}")
-                finally:
-                    try:
-                        response.close()
-                        session.close()
-                    except:
-                        pass
-
-            return Response(generate(), status=response.status_code, headers=return_headers)
-
-        except Exception as e:
-            try:
-                session.close()
-            except:
-                pass
-            raise e
-
-    except requests.RequestException as e:
+    except Exception as e:
         logger.error(f"MSE proxy error for {stream_name}: {e}")
         return jsonify({'error': 'Failed to fetch MSE stream'}), 500
 
@@ -858,21 +957,17 @@ def start_all_camera_streaming(current_user_id):
     """Start on-demand streaming for all cameras when client accesses multiview"""
     try:
         # Get camera list
-        response = requests.get(f"{FRIGATE_HOST}/api/config", timeout=10)
-        response.raise_for_status()
-        config = response.json()
-        
-        cameras = config.get('cameras', {})
+        cameras = frigate_config.get_cameras()
         started_streams = []
         failed_streams = []
         
-        for camera_name in cameras.keys():
-            camera_id = camera_name.lower()  # Convert to lowercase for FFmpeg service
+        for camera in cameras.values():
+            camera_id = camera['ffmpeg_id']
             if start_ffmpeg_stream(camera_id):
                 started_streams.append(camera_id)
                 # Also ensure go2rtc stream is active
                 buffer = get_stream_buffer()
-                buffer.ensure_stream_active(f"{camera_name}_live")
+                buffer.ensure_stream_active(camera['stream_name'])
             else:
                 failed_streams.append(camera_id)
         
@@ -897,15 +992,11 @@ def stop_all_camera_streaming(current_user_id):
     """Stop on-demand streaming for all cameras when client leaves multiview"""
     try:
         # Get camera list
-        response = requests.get(f"{FRIGATE_HOST}/api/config", timeout=10)
-        response.raise_for_status()
-        config = response.json()
-        
-        cameras = config.get('cameras', {})
+        cameras = frigate_config.get_cameras()
         stopped_streams = []
         
-        for camera_name in cameras.keys():
-            camera_id = camera_name.lower()  # Convert to lowercase for FFmpeg service
+        for camera in cameras.values():
+            camera_id = camera['ffmpeg_id']
             if stop_ffmpeg_stream(camera_id):
                 stopped_streams.append(camera_id)
         
@@ -980,40 +1071,18 @@ def get_public_cameras():
 def get_authenticated_cameras(current_user_id):
     """Get camera list for authenticated users"""
     try:
-        # Get Frigate config
-        response = requests.get(f"{FRIGATE_HOST}/api/config", timeout=10)
-        response.raise_for_status()
-        config = response.json()
-
-        cameras = []
-        if 'cameras' in config:
-            for camera_name, camera_config in config['cameras'].items():
-                # Use correct snapshot endpoint (no /api prefix since frontend adds it)
-                snapshot_url = f"/camera/{camera_name}/snapshot"
-
-                camera_data = {
-                    'id': camera_name,
-                    'name': camera_name.replace('_', ' ').title(),
-                    'snapshot_url': snapshot_url,
-                    # Provide both MP4 and HLS for adaptive streaming
-                    'mp4_url': f'/api/camera/{camera_name}/stream.mp4',
-                    'hls_url': f'/api/camera/{camera_name}/stream.m3u8',
-                    # Additional streaming format info for frontend
-                    'adaptive_urls': {
-                        'mp4': f'/api/camera/{camera_name}/stream.mp4',
-                        'hls': f'/api/camera/{camera_name}/stream.m3u8'
-                    }
-                }
-                
-                logger.info(f"Generated camera config for {camera_name}: {camera_data}")
-                cameras.append(camera_data)
+        # Camera index from the shared Frigate config cache
+        index = frigate_config.get_cameras()
+
+        if index:
+            cameras = [camera['listing'] for camera in index.values()]
+            logger.debug(f"Generated camera configs: {cameras}")
 
             # Pre-activate streams to ensure they're ready for frontend
             buffer = get_stream_buffer()
-            for camera_data in cameras:
-                stream_name = f"{camera_data['id']}_live"
-                buffer.ensure_stream_active(stream_name)
-                logger.debug(f"Pre-activated stream: {stream_name}")
+            for camera in index.values():
+                buffer.ensure_stream_active(camera['stream_name'])
+                logger.debug(f"Pre-activated stream: {camera['stream_name']}")
 
             logger.info(f"Returning {len(cameras)} cameras to frontend with pre-activated streams")
             return jsonify({
@@ -1040,7 +1109,7 @@ def proxy_frigate_events(current_user_id):
             if val:
                 params[key] = val
 
-        r = requests.get(f"{FRIGATE_HOST}/api/events", params=params, timeout=15)
+        r = frigate_http.get("/api/events", params=params, timeout=15)
         r.raise_for_status()
         events = r.json() or []
 
@@ -1061,40 +1130,17 @@ def proxy_frigate_events(current_user_id):
 @auth_required
 def proxy_frigate_event_clip(current_user_id, event_id):
     """Proxy Frigate event clip for authenticated playback in the PWA (Range-aware)."""
+    upstream = None
     try:
-        # Forward Range header for partial content requests
-        forward_headers = {
-            'Accept': 'video/mp4'
-        }
-        incoming_range = request.headers.get('Range')
-        if incoming_range:
-            forward_headers['Range'] = incoming_range
-
-        upstream = requests.get(
-            f"{FRIGATE_HOST}/api/events/{event_id}/clip.mp4",
-            headers=forward_headers,
+        upstream = frigate_http.get(
+            f"/api/events/{event_id}/clip.mp4",
+            headers=event_clip_request_headers(request.headers.get('Range')),
             stream=True,
             timeout=60
         )
         upstream.raise_for_status()
 
-        # Build response headers, preserving range-related metadata
-        headers = {
-            'Content-Type': upstream.headers.get('Content-Type', 'video/mp4'),
-            'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
-            'Pragma': 'no-cache',
-            'Access-Control-Allow-Origin': '*',
-        }
-        content_length = upstream.headers.get('Content-Length')
-        content_range = upstream.headers.get('Content-Range')
-        accept_ranges = upstream.headers.get('Accept-Ranges', 'bytes')
-        if content_length:
-            headers['Content-Length'] = content_length
-        if content_range:
-            headers['Content-Range'] = content_range
-        if accept_ranges:
-            headers['Accept-Ranges'] = accept_ranges
-
+        headers = event_clip_response_headers(upstream.headers)
         status_code = upstream.status_code  # 200 or 206 for partial content
 
         def generate():
@@ -1110,6 +1156,8 @@ def proxy_frigate_event_clip(current_user_id, event_id):
 
         return Response(generate(), status=status_code, headers=headers)
     except Exception as e:
+        if upstream is not None:
+            upstream.close()  # Return the pooled connection on an upstream error status
         logger.error(f"Frigate event clip proxy error for {event_id}: {e}")
         return jsonify({'error': 'Failed to fetch event clip'}), 500
 
@@ -1127,7 +1175,7 @@ def events_summary(current_user_id):
             zones = ['Driveway', 'Front_Door']
 
         # Pull latest 100 events and pick the most recent per zone
-        r = requests.get(f"{FRIGATE_HOST}/api/events", params={'limit': '100'}, timeout=10)
+        r = frigate_http.get("/api/events", params={'limit': '100'}, timeout=10)
         r.raise_for_status()
         events = r.json() or []
 
@@ -1161,8 +1209,9 @@ def events_summary(current_user_id):
 @app.route('/api/events/<event_id>/snapshot.jpg', methods=['GET'])
 @auth_required
 def proxy_frigate_event_snapshot(current_user_id, event_id):
+    upstream = None
     try:
-        upstream = requests.get(f"{FRIGATE_HOST}/api/events/{event_id}/snapshot.jpg", stream=True, timeout=30)
+        upstream = frigate_http.get(f"/api/events/{event_id}/snapshot.jpg", stream=True, timeout=30)
         upstream.raise_for_status()
         headers = {
             'Content-Type': upstream.headers.get('Content-Type', 'image/jpeg'),
@@ -1182,67 +1231,38 @@ def proxy_frigate_event_snapshot(current_user_id, event_id):
                     pass
         return Response(generate(), status=200, headers=headers)
     except Exception as e:
+        if upstream is not None:
+            upstream.close()  # Return the pooled connection on an upstream error status
         logger.error(f"Frigate event snapshot proxy error for {event_id}: {e}")
         return jsonify({'error': 'Failed to fetch event snapshot'}), 500
 
 @app.route('/api/events/<event_id>/clip.m3u8', methods=['GET'])
 @auth_required
 def get_event_clip_hls(current_user_id, event_id):
-    """Generate and serve HLS playlist for a Frigate event clip (on-demand VOD)."""
+    """Serve the HLS playlist for a Frigate event clip, starting its transcode job if needed."""
     try:
-        base_dir = Path(HLS_SEGMENTS_PATH) / 'events' / event_id
-        playlist_path = base_dir / 'playlist.m3u8'
-
-        # Ensure directory exists
-        base_dir.mkdir(parents=True, exist_ok=True)
-
-        # If playlist missing or empty, (re)generate
-        if not playlist_path.exists() or playlist_path.stat().st_size == 0:
-            source_url = f"{FRIGATE_HOST}/api/events/{event_id}/clip.mp4"
-            segment_pattern = str(base_dir / 'segment_%05d.ts')
-            cmd = [
-                'ffmpeg',
-                '-hide_banner', '-loglevel', 'error',
-                '-i', source_url,
-                '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'baseline', '-level', '3.1', '-pix_fmt', 'yuv420p',
-                '-c:a', 'aac', '-b:a', '96k',
-                '-movflags', '+faststart',
-                '-f', 'hls', '-hls_time', '4', '-hls_list_size', '0',
-                '-hls_segment_type', 'mpegts', '-hls_playlist_type', 'vod',
-                '-hls_segment_filename', segment_pattern,
-                str(playlist_path)
-            ]
-            try:
-                logger.info(f"Generating HLS for event {event_id} -> {playlist_path}")
-                subprocess.run(cmd, check=True, timeout=300)
-            except subprocess.TimeoutExpired:
-                logger.error(f"HLS generation timeout for event {event_id}")
-                return jsonify({'error': 'HLS generation timed out'}), 504
-            except subprocess.CalledProcessError as e:
-                logger.error(f"HLS generation failed for event {event_id}: {e}")
-                return jsonify({'error': 'Failed to generate HLS'}), 500
-
-        # Read and rewrite playlist segment URIs to go through our authenticated segment endpoint
+        if not is_valid_event_id(event_id):
+            return jsonify({'error': 'Invalid event ID'}), 400
+
+        event_hls_cache.lookup(event_id)
+        job = event_hls_jobs.submit(event_id)
+        # The playlist is usable once FFmpeg lists its first segment; it keeps growing until the job is ready
+        if not job.playable.wait(EVENT_HLS_START_WAIT_SECONDS):
+            response = jsonify({'error': 'HLS not ready yet', 'job': job.to_dict()})
+            response.headers['Retry-After'] = '2'
+            return response, 503
+        if job.state == 'failed':
+            return jsonify({'error': 'Failed to generate HLS', 'job': job.to_dict()}), 500
+
+        # Rewrite playlist segment URIs to go through our authenticated segment endpoint
         try:
-            content = playlist_path.read_text()
-            lines = content.split('\n')
-            rewritten = []
             token = request.headers.get('Authorization')
             if token and token.startswith('Bearer '):
                 token = token[7:]
             else:
                 token = request.args.get('token')
 
-            for line in lines:
-                if line.strip().endswith('.ts'):
-                    seg = line.strip()
-                    url = f"/api/events/hls/{event_id}/{seg}"
-                    if token:
-                        url += f"?token={token}"
-                    rewritten.append(url)
-                else:
-                    rewritten.append(line)
-            playlist_mod = '\n'.join(rewritten)
+            playlist_mod = playlist_cache.get(job.playlist_path).render(f"/api/events/hls/{event_id}/", token)
             headers = {
                 'Content-Type': 'application/vnd.apple.mpegurl',
                 'Cache-Control': 'no-cache, no-store, must-revalidate, max-age=0',
@@ -1257,16 +1277,28 @@ def get_event_clip_hls(current_user_id, event_id):
         logger.error(f"Event HLS error for {event_id}: {e}")
         return jsonify({'error': 'HLS failed'}), 500
 
+@app.route('/api/events/<event_id>/hls/status', methods=['GET'])
+@auth_required
+def get_event_hls_status(current_user_id, event_id):
+    """Get the state of an event clip's HLS transcode job (queued/running/ready/failed)."""
+    if not is_valid_event_id(event_id):
+        return jsonify({'error': 'Invalid event ID'}), 400
+    job = event_hls_jobs.get(event_id)
+    if job is None:
+        return jsonify({'event_id': event_id, 'state': 'none'})
+    return jsonify(job.to_dict())
+
 @app.route('/api/events/hls/<event_id>/<segment>', methods=['GET'])
 @auth_required
 def get_event_hls_segment(current_user_id, event_id, segment):
     """Serve generated HLS segments for an event clip with auth."""
     try:
-        if not segment.endswith('.ts') or '/' in segment or '..' in segment:
+        if not is_valid_event_id(event_id) or not segment.endswith('.ts') or '/' in segment or '..' in segment:
             return jsonify({'error': 'Invalid segment'}), 400
         seg_path = Path(HLS_SEGMENTS_PATH) / 'events' / event_id / segment
         if not seg_path.exists():
             return jsonify({'error': 'Segment not found'}), 404
+        event_hls_cache.touch(event_id)
         return send_file(str(seg_path), mimetype='video/mp2t', as_attachment=False, conditional=True)
     except Exception as e:
         logger.error(f"Event HLS segment error for {event_id}/{segment}: {e}")
@@ -1275,12 +1307,17 @@ def get_event_hls_segment(current_user_id, event_id, segment):
 @app.route('/api/events/<event_id>/hls', methods=['DELETE'])
 @auth_required
 def delete_event_hls(current_user_id, event_id):
-    """Delete generated HLS assets for an event (cleanup on UI close)."""
+    """Delete generated HLS assets for an event now (the event HLS cache otherwise evicts them)."""
     try:
+        if not is_valid_event_id(event_id):
+            return jsonify({'deleted': False, 'error': 'Invalid event ID'}), 400
+        event_hls_jobs.cancel(event_id)
         event_dir = Path(HLS_SEGMENTS_PATH) / 'events' / event_id
         if event_dir.exists() and event_dir.is_dir():
             try:
                 shutil.rmtree(event_dir)
+                event_hls_cache.remove(event_id)
+                playlist_cache.invalidate(str(event_dir) + os.sep)
                 logger.info(f"Deleted HLS directory for event {event_id}: {event_dir}")
             except Exception as e:
                 logger.warning(f"Failed to delete HLS directory for event {event_id}: {e}")
@@ -1317,55 +1354,19 @@ def get_camera_mp4_stream(camera_id):
         # Map camera ID to stream name
         stream_name = f"{camera_id}_live"
         
-        # Build go2rtc URL
-        go2rtc_url = f"{GO2RTC_HOST}/api/stream.mp4?src={stream_name}"
-        
-        # Add any query parameters from the original request (like cache buster)
-        if request.query_string:
-            go2rtc_url += f"&{request.query_string.decode()}"
-        
-        # FORCE desktop User-Agent to prevent go2rtc mobile redirects
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 Chrome/120.0.0.0 Safari/537.36',
-            'Accept': request.headers.get('Accept', '*/*'),
-            'Range': request.headers.get('Range', '')
-        }
-        
-        # Remove empty headers
-        headers = {k: v for k, v in headers.items() if v}
-        
         logger.info(f"Proxying authenticated MP4 stream: {camera_id} -> {stream_name}")
         
-        # Stream the response from go2rtc
-        response = requests.get(go2rtc_url, headers=headers, stream=True, timeout=30)
-        response.raise_for_status()
-        
-        # Return streaming response with proper headers
-        def generate():
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    yield chunk
-        
-        # Build response headers, excluding empty ones
-        response_headers = {
-            'Content-Type': response.headers.get('Content-Type', 'video/mp4'),
-            'Accept-Ranges': 'bytes',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Expose-Headers': 'Accept-Ranges, Content-Length, Content-Range',
-            'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
-            'X-Content-Type-Options': 'nosniff'
-        }
+        # Join the shared upstream for this camera; all viewers share one go2rtc pull
+        subscription = get_stream_fanout().subscribe(stream_name)
+        if not subscription.wait_ready(timeout=30):
+            subscription.close()
+            logger.error(f"MP4 stream proxy error for {camera_id}: upstream not ready")
+            return jsonify({'error': 'Stream unavailable'}), 503
         
-        # Only add Content-Length and Content-Range if they exist
-        if response.headers.get('Content-Length'):
-            response_headers['Content-Length'] = response.headers.get('Content-Length')
-        if response.headers.get('Content-Range'):
-            response_headers['Content-Range'] = response.headers.get('Content-Range')
-            
         return Response(
-            generate(),
-            status=response.status_code,
-            headers=response_headers
+            subscription.iter_chunks(),
+            status=200,
+            headers=MP4_STREAM_HEADERS
         )
         
     except requests.RequestException as e:
@@ -1403,47 +1404,24 @@ def get_camera_hls_playlist(camera_id):
         # Map camera ID to directory name (convert to lowercase, keep underscores)
         camera_lowercase = camera_id.lower()
         
-        # Try to update FFmpeg access time (best effort)
-        try:
-            update_ffmpeg_access(camera_lowercase)
-        except:
-            pass  # Ignore FFmpeg service API issues
+        # Record FFmpeg access (heartbeat is sent in the background)
+        update_ffmpeg_access(camera_lowercase)
         
         # Map camera ID to directory name (convert to lowercase, keep underscores)
         camera_dir = camera_lowercase
         playlist_path = os.path.join(HLS_SEGMENTS_PATH, camera_dir, 'playlist.m3u8')
         
-        # Check if playlist file exists (wait up to 10 seconds for it to appear)
-        max_wait = 10
-        wait_count = 0
-        while not os.path.exists(playlist_path) and wait_count < max_wait:
-            time.sleep(1)
-            wait_count += 1
-        
-        if not os.path.exists(playlist_path):
+        # Wait for FFmpeg to write the playlist; the watcher wakes us as soon as it appears
+        max_wait = HLS_PLAYLIST_WAIT_SECONDS
+        if not get_playlist_watcher(HLS_SEGMENTS_PATH).wait_for(playlist_path, timeout=max_wait):
             logger.error(f"HLS playlist not found after {max_wait}s: {playlist_path}")
             return jsonify({'error': 'Stream not ready yet, please try again in a few seconds'}), 503
         
         logger.info(f"Serving HLS playlist for {camera_id}: {playlist_path}")
         
-        # Read playlist and modify segment URLs to include authentication
+        # Render the cached playlist with segment URLs that carry this viewer's token
         try:
-            with open(playlist_path, 'r') as f:
-                playlist_content = f.read()
-            
-            # Modify segment URLs to include token
-            lines = playlist_content.split('\n')
-            modified_lines = []
-            
-            for line in lines:
-                if line.endswith('.ts'):
-                    # Add authentication token to segment URL
-                    auth_url = f"/api/camera/{camera_id}/hls/{line}?token={token}"
-                    modified_lines.append(auth_url)
-                else:
-                    modified_lines.append(line)
-            
-            modified_playlist = '\n'.join(modified_lines)
+            modified_playlist = playlist_cache.get(playlist_path).render(f"/api/camera/{camera_id}/hls/", token)
             
             # Return playlist with proper headers
             response_headers = {
@@ -1536,24 +1514,92 @@ def get_camera_hls_segment(camera_id, segment):
 @app.route('/api/camera/<camera_id>/snapshot', methods=['GET'])
 @auth_required  
 def get_camera_snapshot(current_user_id, camera_id):
-    """Get latest snapshot for a camera - requires authentication"""
+    """Get latest snapshot for a camera, optionally resized with ?w=&h=&q=&format= - requires authentication"""
     try:
-        # Get snapshot from Frigate - use correct API endpoint
-        response = requests.get(f"{FRIGATE_HOST}/api/{camera_id}/latest.jpg", timeout=10)
-        response.raise_for_status()
+        variant = parse_variant_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        # Add security headers
+    try:
+        # Shared, briefly cached copy of Frigate's latest.jpg
+        snapshot = snapshot_cache.get(camera_id)
+        if variant is not None:
+            snapshot = snapshot.variant(*variant)
+
+        # Add security headers; clients may keep the image but must revalidate it
         headers = {
-            'Content-Type': 'image/jpeg',
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
+            'Content-Type': snapshot.content_type,
+            'Cache-Control': 'private, no-cache',
+            'ETag': f'"{snapshot.etag}"',
             'X-Content-Type-Options': 'nosniff'
         }
 
-        return Response(response.content, headers=headers)
+        if request.if_none_match.contains(snapshot.etag):
+            return Response(status=304, headers=headers)
+        return Response(snapshot.data, headers=headers)
 
-    except requests.RequestException as e:
+    except (requests.RequestException, TimeoutError, OSError) as e:
         logger.error(f"Error getting snapshot for {camera_id}: {e}")
         return jsonify({'error': 'Failed to get camera snapshot'}), 500
+    except Exception as e:
+        # e.g. Pillow rejecting a truncated frame or a decompression bomb while resizing
+        logger.error(f"Unexpected error getting snapshot for {camera_id}: {e}")
+        return jsonify({'error': 'Failed to get camera snapshot'}), 500
+
+@app.route('/api/cameras/snapshots', methods=['GET'])
+@auth_required
+def get_camera_snapshots(current_user_id):
+    """
+    Get snapshots for several cameras in one multipart/form-data response - requires authentication.
+    ?cameras=a,b picks cameras (default: all); w/h/q/format apply to every image.
+    """
+    try:
+        variant = parse_variant_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        known_cameras = frigate_config.get_cameras()
+        requested = request.args.get('cameras')
+        if requested:
+            camera_ids = list(dict.fromkeys(c.strip() for c in requested.split(',') if c.strip()))
+        else:
+            camera_ids = list(known_cameras)
+        if len(camera_ids) > SNAPSHOT_CACHE_SIZE:
+            return jsonify({'error': f'At most {SNAPSHOT_CACHE_SIZE} cameras per request'}), 400
+
+        # Only configured cameras reach Frigate and the shared cache; junk IDs would evict real ones
+        snapshots, errors = {}, {}
+        for camera_id in [c for c in camera_ids if c not in known_cameras]:
+            errors[camera_id] = 'Unknown camera'
+        camera_ids = [c for c in camera_ids if c in known_cameras]
+
+        def load(camera_id):
+            snapshot = snapshot_cache.get(camera_id)
+            return snapshot.variant(*variant) if variant is not None else snapshot
+
+        # Fetch every camera at once; one slow camera only delays the batch up to the deadline
+        futures = {camera_id: snapshot_executor.submit(load, camera_id) for camera_id in camera_ids}
+        deadline = time.monotonic() + SNAPSHOT_BATCH_TIMEOUT
+        for camera_id, future in futures.items():
+            try:
+                snapshots[camera_id] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                errors[camera_id] = 'Timed out'
+            except Exception as e:
+                logger.error(f"Error getting snapshot for {camera_id}: {e}")
+                errors[camera_id] = 'Failed to get camera snapshot'
+
+        body, content_type = encode_snapshot_batch(snapshots, errors)
+        return Response(body, headers={
+            'Content-Type': content_type,
+            'Cache-Control': 'private, no-cache',
+            'X-Content-Type-Options': 'nosniff'
+        })
+
+    except Exception as e:
+        logger.error(f"Error getting camera snapshots: {e}")
+        return jsonify({'error': 'Failed to get camera snapshots'}), 500
 
 @app.route('/api/public/camera/<camera_id>/snapshot', methods=['GET'])
 def get_public_camera_snapshot(camera_id):
@@ -1572,22 +1618,19 @@ def get_blocked_ips(current_user_id):
     """Get list of blocked IP addresses (admin only)"""
     try:
         # Check if user is admin
-        conn = get_db_connection()
-        user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
-        
-        if not user or not user['is_admin']:
-            conn.close()
-            return jsonify({'error': 'Admin access required'}), 403
+        with get_db_connection() as conn:
+            user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
         
-        # Get blocked IPs
-        blocked_ips = conn.execute('''
-            SELECT ip_address, blocked_at, blocked_until, failed_attempts, reason
-            FROM blocked_ips 
-            WHERE blocked_until > CURRENT_TIMESTAMP
-            ORDER BY blocked_at DESC
-        ''').fetchall()
+            if not user or not user['is_admin']:
+                return jsonify({'error': 'Admin access required'}), 403
         
-        conn.close()
+            # Get blocked IPs
+            blocked_ips = conn.execute('''
+                SELECT ip_address, blocked_at, blocked_until, failed_attempts, reason
+                FROM blocked_ips 
+                WHERE blocked_until > CURRENT_TIMESTAMP
+                ORDER BY blocked_at DESC
+            ''').fetchall()
         
         blocked_list = []
         for ip in blocked_ips:
@@ -1611,26 +1654,24 @@ def unblock_ip(current_user_id):
     """Unblock an IP address (admin only)"""
     try:
         # Check if user is admin
-        conn = get_db_connection()
-        user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
+        with get_db_connection() as conn:
+            user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
         
-        if not user or not user['is_admin']:
-            conn.close()
-            return jsonify({'error': 'Admin access required'}), 403
+            if not user or not user['is_admin']:
+                return jsonify({'error': 'Admin access required'}), 403
         
-        data = request.get_json()
-        ip_address = data.get('ip_address')
+            data = request.get_json()
+            ip_address = data.get('ip_address')
         
-        if not ip_address:
-            conn.close()
-            return jsonify({'error': 'IP address is required'}), 400
+            if not ip_address:
+                return jsonify({'error': 'IP address is required'}), 400
         
-        # Remove the IP from blocked list
-        result = conn.execute('DELETE FROM blocked_ips WHERE ip_address = ?', (ip_address,))
-        conn.commit()
-        conn.close()
+            # Remove the IP from blocked list
+            result = conn.execute('DELETE FROM blocked_ips WHERE ip_address = ?', (ip_address,))
+            conn.commit()
+        was_blocked = login_rate_limiter.unblock(ip_address)
         
-        if result.rowcount > 0:
+        if result.rowcount > 0 or was_blocked:
             logger.info(f"Admin unblocked IP: {ip_address}")
             return jsonify({'message': f'IP {ip_address} has been unblocked'})
         else:
@@ -1646,35 +1687,32 @@ def get_login_attempts(current_user_id):
     """Get recent login attempts (admin only)"""
     try:
         # Check if user is admin
-        conn = get_db_connection()
-        user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
+        with get_db_connection() as conn:
+            user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
         
-        if not user or not user['is_admin']:
-            conn.close()
-            return jsonify({'error': 'Admin access required'}), 403
+            if not user or not user['is_admin']:
+                return jsonify({'error': 'Admin access required'}), 403
         
-        # Get recent login attempts (last 24 hours)
-        attempts = conn.execute('''
-            SELECT ip_address, username, success, attempt_time, user_agent
-            FROM login_attempts 
-            WHERE attempt_time > datetime('now', '-24 hours')
-            ORDER BY attempt_time DESC
-            LIMIT 100
-        ''').fetchall()
-        conn.close()
+            # Get recent login attempts (last 24 hours)
+            attempts = conn.execute('''
+                SELECT ip_address, username, success, attempt_time, user_agent
+                FROM login_attempts 
+                WHERE attempt_time > datetime('now', '-24 hours')
+                ORDER BY attempt_time DESC
+                LIMIT 100
+            ''').fetchall()
 
         # Helper: determine if IP was blocked at attempt time
         def was_ip_blocked_at(ip_addr, when_ts):
             try:
-                c = get_db_connection()
-                row = c.execute('''
-                    SELECT 1 FROM blocked_ips
-                    WHERE ip_address = ?
-                    AND blocked_at <= ?
-                    AND blocked_until >= ?
-                    LIMIT 1
-                ''', (ip_addr, when_ts, when_ts)).fetchone()
-                c.close()
+                with get_db_connection() as c:
+                    row = c.execute('''
+                        SELECT 1 FROM blocked_ips
+                        WHERE ip_address = ?
+                        AND blocked_at <= ?
+                        AND blocked_until >= ?
+                        LIMIT 1
+                    ''', (ip_addr, when_ts, when_ts)).fetchone()
                 return row is not None
             except Exception:
                 return False
@@ -1694,25 +1732,23 @@ def get_login_attempts(current_user_id):
 
             # Check cache (valid for 7 days)
             try:
-                c = get_db_connection()
-                cached = c.execute('''
-                    SELECT country, region, city, updated_at FROM ip_geo_cache WHERE ip_address = ?
-                ''', (ip_addr,)).fetchone()
+                with get_db_connection() as c:
+                    cached = c.execute('''
+                        SELECT country, region, city, updated_at FROM ip_geo_cache WHERE ip_address = ?
+                    ''', (ip_addr,)).fetchone()
                 if cached:
                     # Assume cache fresh enough
                     country = cached['country'] or ''
                     region = cached['region'] or ''
                     city = cached['city'] or ''
-                    c.close()
                     loc = ', '.join([p for p in [city, region, country] if p])
                     return loc if loc else 'Unknown'
-                c.close()
             except Exception:
                 pass
 
             # Lookup via ip-api.com (no key, best-effort)
             try:
-                r = requests.get(f"http://ip-api.com/json/{ip_addr}?fields=status,country,regionName,city,query&lang=en", timeout=4)
+                r = geoip_http.get(f"/json/{ip_addr}?fields=status,country,regionName,city,query&lang=en", timeout=4)
                 data = r.json() if r and r.headers.get('Content-Type','').startswith('application/json') else {}
                 if data.get('status') == 'success':
                     country = data.get('country')
@@ -1720,13 +1756,12 @@ def get_login_attempts(current_user_id):
                     city = data.get('city')
                     # Save to cache
                     try:
-                        c = get_db_connection()
-                        c.execute('''
-                            INSERT OR REPLACE INTO ip_geo_cache (ip_address, country, region, city, updated_at)
-                            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                        ''', (ip_addr, country, region, city))
-                        c.commit()
-                        c.close()
+                        with get_db_connection() as c:
+                            c.execute('''
+                                INSERT OR REPLACE INTO ip_geo_cache (ip_address, country, region, city, updated_at)
+                                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                            ''', (ip_addr, country, region, city))
+                            c.commit()
                     except Exception:
                         pass
                     loc = ', '.join([p for p in [city, region, country] if p])
@@ -1761,50 +1796,53 @@ def get_login_attempts(current_user_id):
 def admin_create_user(current_user_id):
     """Admin-only: create a new user with username, password (hashed), and role."""
     try:
-        # Verify admin
-        conn = get_db_connection()
-        me = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
-        if not me or not me['is_admin']:
-            conn.close()
-            return jsonify({'error': 'Admin access required'}), 403
-
         data = request.get_json(silent=True) or {}
         username = (data.get('username') or '').strip()
         password = data.get('password') or ''
         is_admin = bool(data.get('is_admin') or False)
 
-        # Validate username
-        if not username or len(username) < 3 or len(username) > 32:
-            conn.close()
-            return jsonify({'error': 'Username must be 3-32 characters'}), 400
-        if not all(c.isalnum() or c in ('_', '-') for c in username):
-            conn.close()
-            return jsonify({'error': 'Username may contain letters, numbers, _ and - only'}), 400
-
-        # Validate password (reuse same policy)
-        if len(password) < 8 or \
-           not any(c.islower() for c in password) or \
-           not any(c.isupper() for c in password) or \
-           not any(c.isdigit() for c in password) or \
-           not any(not c.isalnum() for c in password):
-            conn.close()
-            return jsonify({'error': 'Password must be 8+ chars with upper, lower, number, and symbol'}), 400
-
-        # Uniqueness
-        exists = conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone()
-        if exists:
-            conn.close()
-            return jsonify({'error': 'Username already taken'}), 409
+        # Verify admin
+        with get_db_connection() as conn:
+            me = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
+            if not me or not me['is_admin']:
+                return jsonify({'error': 'Admin access required'}), 403
+
+            # Validate username
+            if not username or len(username) < 3 or len(username) > 32:
+                return jsonify({'error': 'Username must be 3-32 characters'}), 400
+            if not all(c.isalnum() or c in ('_', '-') for c in username):
+                return jsonify({'error': 'Username may contain letters, numbers, _ and - only'}), 400
+
+            # Validate password (reuse same policy)
+            if len(password) < 8 or \
+               not any(c.islower() for c in password) or \
+               not any(c.isupper() for c in password) or \
+               not any(c.isdigit() for c in password) or \
+               not any(not c.isalnum() for c in password):
+                return jsonify({'error': 'Password must be 8+ chars with upper, lower, number, and symbol'}), 400
+
+            # Uniqueness
+            exists = conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone()
+            if exists:
+                return jsonify({'error': 'Username already taken'}), 409
+
+        # Hash without holding a pooled connection
+        try:
+            password_hash = hash_password(password)
+        except VerifierBusyError:
+            return jsonify({'error': 'Service is busy, please try again shortly'}), 503, {'Retry-After': '1'}
 
         # Create user
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        cur = conn.execute('''
-            INSERT INTO users (username, password_hash, email, full_name, is_admin, is_active)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (username, password_hash, None, None, 1 if is_admin else 0, 1))
-        user_id = cur.lastrowid
-        conn.commit()
-        conn.close()
+        with get_db_connection() as conn:
+            try:
+                cur = conn.execute('''
+                    INSERT INTO users (username, password_hash, email, full_name, is_admin, is_active)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (username, password_hash, None, None, 1 if is_admin else 0, 1))
+            except sqlite3.IntegrityError:
+                return jsonify({'error': 'Username already taken'}), 409  # Taken while hashing
+            user_id = cur.lastrowid
+            conn.commit()
 
         logger.info(f"Admin {current_user_id} created user {username} (admin={is_admin})")
         return jsonify({'created': True, 'user': {'id': user_id, 'username': username, 'is_admin': is_admin}}), 201
@@ -1817,18 +1855,16 @@ def admin_create_user(current_user_id):
 def admin_list_users(current_user_id):
     """Admin-only: list users with id, username, role, status, and timestamps."""
     try:
-        conn = get_db_connection()
-        me = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
-        if not me or not me['is_admin']:
-            conn.close()
-            return jsonify({'error': 'Admin access required'}), 403
+        with get_db_connection() as conn:
+            me = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
+            if not me or not me['is_admin']:
+                return jsonify({'error': 'Admin access required'}), 403
 
-        rows = conn.execute('''
-            SELECT id, username, is_admin, is_active, created_at, last_login
-            FROM users
-            ORDER BY username COLLATE NOCASE ASC
-        ''').fetchall()
-        conn.close()
+            rows = conn.execute('''
+                SELECT id, username, is_admin, is_active, created_at, last_login
+                FROM users
+                ORDER BY username COLLATE NOCASE ASC
+            ''').fetchall()
 
         users = []
         for r in rows:
@@ -1853,31 +1889,27 @@ def admin_toggle_user_active(current_user_id, user_id):
         data = request.get_json(silent=True) or {}
         is_active = bool(data.get('is_active'))
 
-        conn = get_db_connection()
-        me = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
-        if not me or not me['is_admin']:
-            conn.close()
-            return jsonify({'error': 'Admin access required'}), 403
+        with get_db_connection() as conn:
+            me = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
+            if not me or not me['is_admin']:
+                return jsonify({'error': 'Admin access required'}), 403
 
-        # Prevent self-disabling via API
-        if user_id == current_user_id:
-            conn.close()
-            return jsonify({'error': 'Cannot modify your own active status'}), 400
+            # Prevent self-disabling via API
+            if user_id == current_user_id:
+                return jsonify({'error': 'Cannot modify your own active status'}), 400
 
-        # Fetch target user
-        target = conn.execute('SELECT id, is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
-        if not target:
-            conn.close()
-            return jsonify({'error': 'User not found'}), 404
+            # Fetch target user
+            target = conn.execute('SELECT id, is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
+            if not target:
+                return jsonify({'error': 'User not found'}), 404
 
-        # Optional: prevent disabling admins (leave enabled) unless future policy says otherwise
-        if target['is_admin'] and not is_active:
-            conn.close()
-            return jsonify({'error': 'Cannot disable an admin account'}), 400
+            # Optional: prevent disabling admins (leave enabled) unless future policy says otherwise
+            if target['is_admin'] and not is_active:
+                return jsonify({'error': 'Cannot disable an admin account'}), 400
 
-        conn.execute('UPDATE users SET is_active = ? WHERE id = ?', (1 if is_active else 0, user_id))
-        conn.commit()
-        conn.close()
+            conn.execute('UPDATE users SET is_active = ? WHERE id = ?', (1 if is_active else 0, user_id))
+            conn.commit()
+        invalidate_user_auth_cache(user_id)
         logger.info(f"Admin {current_user_id} set user {user_id} active={is_active}")
         return jsonify({'updated': True, 'is_active': is_active})
     except Exception as e:
@@ -1902,13 +1934,20 @@ def shutdown_session(exception=None):
 
 def cleanup():
     """Clean up resources when app shuts down"""
+    _last_login_flush_stop.set()
+    flush_last_login_updates()
+    login_rate_limiter.shutdown()
+    password_verifier.shutdown()
+    access_tracker.shutdown()
+    snapshot_executor.shutdown(wait=False)
+    event_hls_jobs.shutdown()
+    upstreams.close()
+    if stream_relay is not None:
+        stream_relay.stop()
+    shutdown_stream_fanout()
     shutdown_stream_buffer()
-
-import atexit
-import threading
-import time
-import gc
-import os
+    shutdown_playlist_watcher()
+    db_pool.close_all()
 
 # Memory management configuration
 MEMORY_CHECK_INTERVAL = 300  # Check memory every 5 minutes
@@ -2059,8 +2098,11 @@ def periodic_cleanup():
     
     while True:
         try:
-            # Database cleanup (existing)
-            cleanup_expired_blocks()
+            # Database cleanup (existing), done once for all workers by the leader
+            if is_leader():
+                cleanup_expired_blocks()
+                event_hls_cache.enforce()
+            login_rate_limiter.prune()
             
             # Memory management (new)
             check_and_cleanup_memory()
@@ -2108,15 +2150,32 @@ def get_memory_status(current_user_id):
         logger.error(f"Error getting memory status: {e}")
         return jsonify({'error': 'Failed to get memory status'}), 500
 
+@app.route('/api/debug/upstreams', methods=['GET'])
+@auth_required
+def get_upstream_status(current_user_id):
+    """Get connection pool usage for the upstream HTTP clients - requires authentication"""
+    try:
+        return jsonify({'upstreams': upstreams.get_status()})
+    except Exception as e:
+        logger.error(f"Error getting upstream status: {e}")
+        return jsonify({'error': 'Failed to get upstream status'}), 500
+
+@app.route('/api/debug/startup', methods=['GET'])
+@auth_required
+def get_startup_profile(current_user_id):
+    """Get start-up timings (imports are only timed with STARTUP_PROFILE=true) - requires authentication"""
+    report = startup_profiler.report()
+    report['import_profiling'] = STARTUP_PROFILE
+    return jsonify(report)
+
 @app.route('/api/debug/memory/cleanup', methods=['POST'])
 @auth_required  
 def trigger_memory_cleanup(current_user_id):
     """Manually trigger memory cleanup - requires authentication"""
     try:
         # Check if user is admin
-        conn = get_db_connection()
-        user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
-        conn.close()
+        with get_db_connection() as conn:
+            user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (current_user_id,)).fetchone()
         
         if not user or not user['is_admin']:
             return jsonify({'error': 'Admin access required'}), 403
@@ -2154,14 +2213,43 @@ def trigger_memory_cleanup(current_user_id):
 cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
 cleanup_thread.start()
 
+# Start last_login write-behind flusher
+last_login_flush_thread = threading.Thread(target=last_login_flush_loop, daemon=True)
+last_login_flush_thread.start()
+
+def become_leader():
+    """Take over go2rtc upstreams and serve them to follower workers through the relay"""
+    global stream_relay
+    buffer = get_stream_buffer()
+    buffer.go2rtc_host = GO2RTC_HOST
+    stream_relay = StreamRelay(get_stream_fanout(), port=STREAM_RELAY_PORT)
+    stream_relay.start()
+    reconcile_event_hls_cache()
+
+if leader_election is not None:
+    leader_election.on_elected(become_leader)
+    with startup_profiler.step('leader election'):
+        leader_election.start()
+else:
+    reconcile_event_hls_cache()
+
 atexit.register(cleanup)
 
+startup_profiler.finish()
+if STARTUP_PROFILE:
+    startup_profiler.log_report()
+
 if __name__ == '__main__':
     # Log startup memory info
     startup_memory = get_process_memory_info()
     if startup_memory:
         logger.info(f"Backend starting - Initial memory: RSS={startup_memory.get('rss_kb', 0)/1024:.1f}MB, Swap={startup_memory.get('swap_kb', 0)/1024:.1f}MB")
     
-    # Disable debug mode in production
-    debug_mode = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
-    app.run(host='0.0.0.0', port=5003, debug=debug_mode)
\ No newline at end of file
+    if ASYNC_STREAMING:
+        # Video routes on coroutines, everything else through Flask on a thread pool
+        from async_server import run_async_server
+        run_async_server(sys.modules[__name__], host='0.0.0.0', port=5003, wsgi_workers=ASYNC_WSGI_WORKERS)
+    else:
+        # Disable debug mode in production
+        debug_mode = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+        app.run(host='0.0.0.0', port=5003, debug=debug_mode)
\ No newline at end of file
@@ -0,0 +1,225 @@
+import asyncio
+import io
+import sys
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Headers that describe the hop, not the content; never copied from the WSGI response
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'upgrade'}
+
+def _request_token(request: web.Request):
+    """Bearer token from the Authorization header, falling back to ?token= for video elements"""
+    token = request.headers.get('Authorization')
+    if token and token.startswith('Bearer '):
+        return token[7:]
+    return request.query.get('token')
+
+class AsyncStreamingServer:
+    """
+    aiohttp front end for the backend. The long-lived video routes (live MP4/MSE
+    proxies and event clip proxying) are served by coroutines with non-blocking
+    upstream I/O, so an open video connection costs a few kilobytes instead of a
+    thread. Every other route is handed to the Flask app unchanged through a small
+    WSGI bridge running on a bounded thread pool.
+    """
+
+    def __init__(self, backend, wsgi_workers=32, chunk_size=256 * 1024):
+        self.backend = backend  # The app module: Flask app plus shared helpers and config
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=wsgi_workers, thread_name_prefix='wsgi')
+        self._session = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get('/api/camera/{camera_id}/stream.mp4', self.camera_mp4_stream)
+        app.router.add_get('/api/go2rtc/mse/{stream_name}', self.go2rtc_mse)
+        app.router.add_get('/api/events/{event_id}/clip.mp4', self.event_clip)
+        app.router.add_get('/api/frigate/events/{event_id}/clip.mp4', self.event_clip)
+        app.router.add_route('*', '/{tail:.*}', self.wsgi)
+        app.on_cleanup.append(self._close_session)
+        return app
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+            )
+        return self._session
+
+    async def _close_session(self, app):
+        if self._session is not None:
+            await self._session.close()
+        self.executor.shutdown(wait=False)
+
+    async def _authenticate(self, request: web.Request):
+        """Run the shared token check off the loop (it may hit SQLite on a cache miss)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.backend.authenticate_token, _request_token(request), request.path)
+
+    async def _stream_live(self, request: web.Request, stream_name: str, ready_timeout: float, headers: dict):
+        """Attach to the shared StreamBuffer consumer and relay fragments; None if it never became ready"""
+        subscription = self.backend.get_stream_fanout().subscribe_async(stream_name, asyncio.get_running_loop())
+        if not await subscription.wait_ready_async(ready_timeout):
+            subscription.close()
+            return None
+
+        response = web.StreamResponse(status=200, headers=headers)
+        try:
+            await response.prepare(request)
+            async for chunk in subscription.iter_chunks_async():
+                await response.write(chunk)
+        except ConnectionResetError:
+            logger.debug(f"Viewer disconnected from {stream_name}")
+        finally:
+            subscription.close()
+        return response
+
+    async def camera_mp4_stream(self, request: web.Request):
+        """Async counterpart of get_camera_mp4_stream"""
+        camera_id = request.match_info['camera_id']
+        token = _request_token(request)
+        if not token:
+            return web.json_response({'error': 'Authentication required'}, status=401)
+        try:
+            payload = self.backend.jwt.decode(token, self.backend.app.config['SECRET_KEY'], algorithms=['HS256'])
+            logger.info(f"Video stream authenticated for user {payload['user_id']}")
+        except self.backend.jwt.ExpiredSignatureError:
+            return web.json_response({'error': 'Token expired'}, status=401)
+        except self.backend.jwt.InvalidTokenError:
+            return web.json_response({'error': 'Invalid token'}, status=401)
+
+        stream_name = f"{camera_id}_live"
+        logger.info(f"Proxying authenticated MP4 stream: {camera_id} -> {stream_name}")
+        response = await self._stream_live(request, stream_name, 30, self.backend.MP4_STREAM_HEADERS)
+        if response is None:
+            logger.error(f"MP4 stream proxy error for {camera_id}: upstream not ready")
+            return web.json_response({'error': 'Stream unavailable'}, status=503)
+        return response
+
+    async def go2rtc_mse(self, request: web.Request):
+        """Async counterpart of proxy_go2rtc_mse"""
+        stream_name = request.match_info['stream_name']
+        _, error = await self._authenticate(request)
+        if error:
+            body, status = error
+            return web.json_response(body, status=status)
+
+        # Longer timeout for NVENC transcoding to produce the first fragment
+        response = await self._stream_live(request, stream_name, 60, self.backend.MSE_STREAM_HEADERS)
+        if response is None:
+            logger.error(f"MSE proxy error for {stream_name}: upstream not ready")
+            return web.json_response({'error': 'Failed to fetch MSE stream'}, status=500)
+        return response
+
+    async def event_clip(self, request: web.Request):
+        """Async counterpart of proxy_frigate_event_clip (Range-aware)"""
+        event_id = request.match_info['event_id']
+        _, error = await self._authenticate(request)
+        if error:
+            body, status = error
+            return web.json_response(body, status=status)
+
+        url = f"{self.backend.FRIGATE_HOST}/api/events/{event_id}/clip.mp4"
+        forward_headers = self.backend.event_clip_request_headers(request.headers.get('Range'))
+        upstream = None
+        try:
+            upstream = await self._get_session().get(url, headers=forward_headers)
+            upstream.raise_for_status()
+        except Exception as e:
+            if upstream is not None:
+                upstream.release()  # Hand the connection back to the pool on 4xx/5xx
+            logger.error(f"Frigate event clip proxy error for {event_id}: {e}")
+            return web.json_response({'error': 'Failed to fetch event clip'}, status=500)
+
+        response = web.StreamResponse(status=upstream.status,
+                                      headers=self.backend.event_clip_response_headers(upstream.headers))
+        try:
+            await response.prepare(request)
+            async for chunk in upstream.content.iter_chunked(self.chunk_size):
+                await response.write(chunk)
+        except (ConnectionResetError, aiohttp.ClientError) as e:
+            logger.debug(f"Event clip proxy for {event_id} ended early: {e}")
+        finally:
+            upstream.release()
+        return response
+
+    def _environ(self, request: web.Request, body: bytes) -> dict:
+        """Build a WSGI environ for the Flask app from an aiohttp request"""
+        host, _, port = (request.host or 'localhost').partition(':')
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': request.path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': host,
+            'SERVER_PORT': port or ('443' if request.scheme == 'https' else '80'),
+            'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+            'REMOTE_ADDR': request.remote or '127.0.0.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'CONTENT_LENGTH': str(len(body)) if body else '',
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif key != 'CONTENT_LENGTH':
+                key = f"HTTP_{key}"
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    async def wsgi(self, request: web.Request):
+        """Serve any other route with the Flask app on the worker pool"""
+        loop = asyncio.get_running_loop()
+        body = await request.read()
+        environ = self._environ(request, body)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        def call_app():
+            result = self.backend.app.wsgi_app(environ, start_response)
+            return result, iter(result)
+
+        result, body_iter = await loop.run_in_executor(self.executor, call_app)
+        try:
+            response = web.StreamResponse(status=started['status'])
+            for name, value in started['headers']:
+                if name.lower() not in HOP_BY_HOP_HEADERS:
+                    response.headers.add(name, value)
+            await response.prepare(request)
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, body_iter, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await response.write(chunk)
+            await response.write_eof()
+            return response
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+def run_async_server(backend, host='0.0.0.0', port=5003, wsgi_workers=32, sock=None):
+    """Serve the backend with aiohttp (blocks until interrupted); sock is an already bound listener"""
+    server = AsyncStreamingServer(backend, wsgi_workers=wsgi_workers)
+    if sock is not None:
+        logger.info(f"Starting async streaming server on inherited socket with {wsgi_workers} WSGI workers")
+        web.run_app(server.create_app(), sock=sock, access_log=None, handle_signals=False)
+    else:
+        logger.info(f"Starting async streaming server on {host}:{port} with {wsgi_workers} WSGI workers")
+        web.run_app(server.create_app(), host=host, port=port, access_log=None)
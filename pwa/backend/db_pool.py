@@ -0,0 +1,131 @@
+import sqlite3
+import threading
+import logging
+import queue
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class SQLiteConnectionPool:
+    """
+    Keeps a small pool of long-lived SQLite connections so request handlers do not
+    pay for sqlite3.connect() (and PRAGMA setup) on every query. Connections are
+    opened in WAL mode with synchronous=NORMAL and a busy timeout, and are handed
+    out through connection(), which always returns them to the pool.
+    """
+
+    def __init__(self, database_path, pool_size=8, busy_timeout=5.0, cached_statements=128):
+        self.database_path = database_path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout  # Seconds to wait on a locked database before failing
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {'opened': 0, 'reused': 0, 'discarded': 0, 'in_use': 0}
+
+        logger.info("SQLiteConnectionPool initialized for %s (pool size %d)", database_path, pool_size)
+
+    def _open(self) -> sqlite3.Connection:
+        """
+        Open a new connection with the pool's PRAGMA settings applied.
+        """
+        conn = sqlite3.connect(
+            self.database_path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,  # Connections move between request threads via the pool
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+        with self._lock:
+            self.stats['opened'] += 1
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection):
+        """
+        Close a connection that will not go back into the pool.
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self.stats['discarded'] += 1
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.stats['reused'] += 1
+        except queue.Empty:
+            conn = self._open()
+        with self._lock:
+            self.stats['in_use'] += 1
+        return conn
+
+    def _release(self, conn: sqlite3.Connection, healthy: bool):
+        with self._lock:
+            self.stats['in_use'] -= 1
+
+        if healthy:
+            try:
+                # Never hand out a connection that still holds a write transaction
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                healthy = False
+
+        if not healthy or self._closed:
+            self._discard(conn)
+            return
+
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a with-block.
+        Uncommitted work is rolled back when the block exits, and the connection is
+        returned to the pool even if the block raises.
+        """
+        conn = self._acquire()
+        healthy = True
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                healthy = False
+            raise
+        finally:
+            self._release(conn, healthy)
+
+    def close_all(self):
+        """
+        Close all idle connections and stop pooling new releases.
+        """
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        logger.info("SQLiteConnectionPool closed")
+
+    def get_status(self) -> dict:
+        """
+        Get pool usage counters.
+        """
+        with self._lock:
+            status = dict(self.stats)
+        status['idle'] = self._idle.qsize()
+        status['pool_size'] = self.pool_size
+        return status
@@ -0,0 +1,195 @@
+import struct
+import logging
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Largest single box we are willing to buffer while waiting for the rest of it
+MAX_BOX_SIZE = 32 * 1024 * 1024
+
+# trun/tfhd/trex sample_flags bit marking a sample that is not a sync sample (keyframe)
+SAMPLE_IS_NON_SYNC = 0x00010000
+
+def iter_boxes(data: bytes, offset: int = 0, end: Optional[int] = None) -> Iterator[Tuple[str, int, int]]:
+    """
+    Iterate over the ISO BMFF boxes in data[offset:end].
+    Yields (box_type, payload_start, box_end) for each complete box.
+    """
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type.decode('latin-1'), offset + header, offset + size
+        offset += size
+
+def _find_child(data: bytes, start: int, end: int, box_type: str) -> Optional[Tuple[int, int]]:
+    for child_type, child_start, child_end in iter_boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+def parse_init_segment(init: bytes) -> Tuple[Set[int], Dict[int, int]]:
+    """
+    Read the video track IDs and per-track default sample flags (trex) from an init segment.
+    """
+    video_tracks: Set[int] = set()
+    trex_flags: Dict[int, int] = {}
+    moov = None
+    for box_type, start, end in iter_boxes(init):
+        if box_type == 'moov':
+            moov = (start, end)
+    if moov is None:
+        return video_tracks, trex_flags
+
+    for box_type, start, end in iter_boxes(init, *moov):
+        if box_type == 'trak':
+            tkhd = _find_child(init, start, end, 'tkhd')
+            mdia = _find_child(init, start, end, 'mdia')
+            if not tkhd or not mdia:
+                continue
+            version = init[tkhd[0]]
+            track_id_offset = tkhd[0] + (20 if version == 1 else 12)
+            if track_id_offset + 4 > tkhd[1]:
+                continue
+            track_id = struct.unpack_from('>I', init, track_id_offset)[0]
+            hdlr = _find_child(init, mdia[0], mdia[1], 'hdlr')
+            if hdlr and hdlr[0] + 12 <= hdlr[1] and init[hdlr[0] + 8:hdlr[0] + 12] == b'vide':
+                video_tracks.add(track_id)
+        elif box_type == 'mvex':
+            for child_type, child_start, child_end in iter_boxes(init, start, end):
+                if child_type == 'trex' and child_start + 24 <= child_end:
+                    track_id = struct.unpack_from('>I', init, child_start + 4)[0]
+                    trex_flags[track_id] = struct.unpack_from('>I', init, child_start + 20)[0]
+    return video_tracks, trex_flags
+
+def _traf_first_sample_flags(data: bytes, start: int, end: int, trex_flags: Dict[int, int]) -> Tuple[Optional[int], Optional[int]]:
+    """Return (track_id, sample_flags of the first sample) for a traf box"""
+    track_id = None
+    default_flags = None
+    for box_type, box_start, box_end in iter_boxes(data, start, end):
+        if box_type == 'tfhd' and box_start + 8 <= box_end:
+            tf_flags = struct.unpack_from('>I', data, box_start)[0] & 0xFFFFFF
+            track_id = struct.unpack_from('>I', data, box_start + 4)[0]
+            pos = box_start + 8
+            pos += 8 if tf_flags & 0x01 else 0  # base_data_offset
+            pos += 4 if tf_flags & 0x02 else 0  # sample_description_index
+            pos += 4 if tf_flags & 0x08 else 0  # default_sample_duration
+            pos += 4 if tf_flags & 0x10 else 0  # default_sample_size
+            if tf_flags & 0x20 and pos + 4 <= box_end:
+                default_flags = struct.unpack_from('>I', data, pos)[0]
+        elif box_type == 'trun' and box_start + 8 <= box_end:
+            tr_flags = struct.unpack_from('>I', data, box_start)[0] & 0xFFFFFF
+            sample_count = struct.unpack_from('>I', data, box_start + 4)[0]
+            pos = box_start + 8
+            pos += 4 if tr_flags & 0x01 else 0  # data_offset
+            if tr_flags & 0x04 and pos + 4 <= box_end:
+                return track_id, struct.unpack_from('>I', data, pos)[0]
+            pos += 4 if tr_flags & 0x04 else 0
+            if tr_flags & 0x400 and sample_count:
+                pos += 4 if tr_flags & 0x100 else 0  # sample_duration
+                pos += 4 if tr_flags & 0x200 else 0  # sample_size
+                if pos + 4 <= box_end:
+                    return track_id, struct.unpack_from('>I', data, pos)[0]
+            if default_flags is None and track_id is not None:
+                default_flags = trex_flags.get(track_id)
+            return track_id, default_flags
+    return track_id, default_flags
+
+def is_keyframe_fragment(moof: bytes, video_tracks: Set[int], trex_flags: Dict[int, int]) -> bool:
+    """
+    True if the fragment's video run starts with a sync sample, i.e. a decoder can start here.
+    When the init segment declared no video track, every fragment is treated as a start point.
+    """
+    if not video_tracks:
+        return True
+    for box_type, start, end in iter_boxes(moof, 8):
+        if box_type != 'traf':
+            continue
+        track_id, flags = _traf_first_sample_flags(moof, start, end, trex_flags)
+        if track_id in video_tracks:
+            return flags is None or not (flags & SAMPLE_IS_NON_SYNC)
+    return False
+
+class FMP4Parser:
+    """
+    Incremental splitter for a fragmented MP4 byte stream such as go2rtc's stream.mp4.
+    feed() accepts arbitrary chunks and returns complete media fragments (moof+mdat,
+    plus any styp/prft boxes in front of them) once the init segment (ftyp+moov) has
+    been collected into init_segment.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._init_boxes: List[bytes] = []
+        self._pending: List[bytes] = []  # Boxes waiting for the mdat that completes a fragment
+        self._moof: Optional[bytes] = None
+        self.init_segment: Optional[bytes] = None
+        self.video_tracks: Set[int] = set()
+        self.trex_flags: Dict[int, int] = {}
+
+    def _next_box(self) -> Optional[Tuple[str, bytes]]:
+        buf = self._buffer
+        if len(buf) < 8:
+            return None
+        size, box_type = struct.unpack_from('>I4s', buf, 0)
+        header = 8
+        if size == 1:
+            if len(buf) < 16:
+                return None
+            size = struct.unpack_from('>Q', buf, 8)[0]
+            header = 16
+        if size < header or size > MAX_BOX_SIZE:
+            raise ValueError(f"Unsupported MP4 box size {size} for {box_type!r}")
+        if len(buf) < size:
+            return None
+        box = bytes(buf[:size])
+        del buf[:size]
+        return box_type.decode('latin-1'), box
+
+    def feed(self, data: bytes) -> List[Tuple[bytes, bool]]:
+        """
+        Add bytes from the stream. Returns a list of (fragment_bytes, is_keyframe).
+        """
+        self._buffer.extend(data)
+        fragments = []
+        while True:
+            item = self._next_box()
+            if item is None:
+                break
+            box_type, box = item
+
+            if self.init_segment is None:
+                if box_type != 'moof':
+                    self._init_boxes.append(box)
+                    continue
+                self.init_segment = b''.join(self._init_boxes)
+                self._init_boxes = []
+                try:
+                    self.video_tracks, self.trex_flags = parse_init_segment(self.init_segment)
+                except (struct.error, IndexError) as e:
+                    logger.warning(f"Could not parse MP4 init segment: {e}")
+
+            if box_type == 'moof':
+                self._moof = box
+                self._pending.append(box)
+            elif box_type == 'mdat' and self._moof is not None:
+                self._pending.append(box)
+                try:
+                    keyframe = is_keyframe_fragment(self._moof, self.video_tracks, self.trex_flags)
+                except (struct.error, IndexError):
+                    keyframe = False
+                fragments.append((b''.join(self._pending), keyframe))
+                self._pending = []
+                self._moof = None
+            else:
+                self._pending.append(box)
+        return fragments
@@ -1,27 +1,46 @@
-import cv2
-import numpy as np
-import base64
-import os
 import time
 import threading
-from datetime import datetime, timedelta
-import requests
-from io import BytesIO
-from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
 import logging
 
+from frigate_config import FrigateConfigCache
+from upstream_clients import UpstreamClient
+
 logger = logging.getLogger(__name__)
 
+def _remaining(deadline):
+    """Seconds left before a monotonic deadline (None means no deadline)"""
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("Capture deadline exceeded")
+    return remaining
+
 class FrameCapture:
-    def __init__(self, frigate_host="http://frigate:5000"):
+    """
+    Standalone frame grabber for Frigate cameras. No backend route imports it:
+    the API serves snapshots through SnapshotCache, so capture_all_frames'
+    concurrency and deadlines only apply to callers that use this class directly.
+    """
+
+    def __init__(self, frigate_host="http://frigate:5000", config_cache=None, http=None, max_workers=8,
+                 max_cached_frames=20):
         self.frigate_host = frigate_host
-        self.cache_dir = "/tmp/frame_cache"
+        # Keep-alive client for Frigate; pass the backend's to share its connection pool.
+        # The default one does not retry because the capture methods run their own retry loop.
+        self.http = http or UpstreamClient('frigate', frigate_host, retries=0)
+        # Share the backend's config cache when given one so the RTSP fallback is a memory lookup
+        self.config_cache = config_cache or FrigateConfigCache(frigate_host, session=self.http)
         self.cache_duration = 60  # Cache frames for 60 seconds
-        self.frame_cache = {}  # In-memory cache
-        
-        # Create cache directory
-        os.makedirs(self.cache_dir, exist_ok=True)
-        
+        self.max_cached_frames = max_cached_frames
+        self.frame_cache = OrderedDict()  # camera_id -> frame with raw JPEG bytes, least recently used first
+        self._cache_lock = threading.Lock()
+        # Concurrent captures for capture_all_frames
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='frame-capture')
+
     def get_local_time_str(self, dt=None):
         if dt is None:
             dt = datetime.now()
@@ -29,16 +48,15 @@ class FrameCapture:
         tz_abbr = time.strftime('%Z')
         return f"{local_time_str} {tz_abbr}"
 
-    def capture_frame_from_hls(self, camera_id, max_retries=3):
-        """Capture a frame from Frigate snapshot endpoint"""
+    def capture_frame_from_hls(self, camera_id, max_retries=3, deadline=None):
+        """Capture a frame from Frigate snapshot endpoint, giving up at the monotonic deadline"""
         snapshot_url = f"{self.frigate_host}/api/{camera_id}/latest.jpg"
         
         for attempt in range(max_retries):
             try:
-                # Use requests to get the snapshot
-                import requests
-                
-                response = requests.get(snapshot_url, timeout=10)
+                remaining = _remaining(deadline)
+                # Fetch the snapshot over the pooled Frigate connection
+                response = self.http.get(snapshot_url, timeout=min(10, remaining or 10))
                 response.raise_for_status()
                 
                 jpeg_data = response.content
@@ -46,32 +64,34 @@ class FrameCapture:
                 if not jpeg_data:
                     raise Exception("No image data received")
                 
-                # Convert to base64
-                base64_data = base64.b64encode(jpeg_data).decode('utf-8')
-                # Get local time string
+                # Keep the JPEG as bytes; callers that need a data URI encode it themselves
                 now = datetime.now()
-                local_time_str = now.strftime('%b %-d, %Y, %-I:%M %p')
-                tz_abbr = time.strftime('%Z')
-                local_time_str = f"{local_time_str} {tz_abbr}"
                 return {
-                    'image': f"data:image/jpeg;base64,{base64_data}",
+                    'jpeg': jpeg_data,
+                    'captured_at': time.monotonic(),
                     'timestamp': now.isoformat(),
-                    'local_time': local_time_str,
+                    'local_time': self.get_local_time_str(now),
                     'source': 'frigate_snapshot'
                 }
                 
+            except TimeoutError:
+                raise
             except Exception as e:
                 logger.error(f"Attempt {attempt + 1} failed for camera {camera_id}: {str(e)}")
-                if attempt < max_retries - 1:
+                if attempt < max_retries - 1 and (deadline is None or deadline - time.monotonic() > 1):
                     time.sleep(1)  # Wait before retry
                 else:
                     raise e
     
-    def capture_frame_from_rtsp(self, camera_id, rtsp_url, max_retries=3):
-        """Capture a frame from RTSP stream (fallback method)"""
+    def capture_frame_from_rtsp(self, camera_id, rtsp_url, max_retries=3, deadline=None):
+        """Capture a frame from RTSP stream (fallback method), giving up at the monotonic deadline"""
+        import cv2  # OpenCV takes a while to load and is only needed when the snapshot path fails
+
         for attempt in range(max_retries):
             try:
-                cap = cv2.VideoCapture(rtsp_url)
+                timeout_ms = int(min(10, _remaining(deadline) or 10) * 1000)
+                cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+                                                                  cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms])
                 
                 if not cap.isOpened():
                     raise Exception(f"Could not open RTSP stream: {rtsp_url}")
@@ -85,83 +105,73 @@ class FrameCapture:
                 
                 # Convert to JPEG
                 _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                jpeg_data = buffer.tobytes()
-                
-                # Convert to base64
-                base64_data = base64.b64encode(jpeg_data).decode('utf-8')
                 
                 return {
-                    'image': f"data:image/jpeg;base64,{base64_data}",
+                    'jpeg': buffer.tobytes(),
+                    'captured_at': time.monotonic(),
                     'timestamp': datetime.now().isoformat(),
                     'source': 'rtsp_stream'
                 }
                 
+            except TimeoutError:
+                raise
             except Exception as e:
                 logger.error(f"RTSP attempt {attempt + 1} failed for camera {camera_id}: {str(e)}")
-                if attempt < max_retries - 1:
+                if attempt < max_retries - 1 and (deadline is None or deadline - time.monotonic() > 1):
                     time.sleep(1)
                 else:
                     raise e
     
     def get_cached_frame(self, camera_id):
         """Get cached frame if it's still valid"""
-        if camera_id in self.frame_cache:
-            cached_data = self.frame_cache[camera_id]
-            cached_time = datetime.fromisoformat(cached_data['timestamp'])
-            
-            if datetime.now() - cached_time < timedelta(seconds=self.cache_duration):
-                return cached_data
-        
-        return None
+        with self._cache_lock:
+            cached_data = self.frame_cache.get(camera_id)
+            if cached_data is None:
+                return None
+            if time.monotonic() - cached_data['captured_at'] >= self.cache_duration:
+                del self.frame_cache[camera_id]
+                return None
+            self.frame_cache.move_to_end(camera_id)
+            return cached_data
     
     def cache_frame(self, camera_id, frame_data):
-        """Cache frame data"""
-        self.frame_cache[camera_id] = frame_data
-        
-        # Limit cache size
-        if len(self.frame_cache) > 20:
-            # Remove oldest entries
-            oldest_key = min(self.frame_cache.keys(), 
-                           key=lambda k: self.frame_cache[k]['timestamp'])
-            del self.frame_cache[oldest_key]
+        """Cache frame data, evicting the least recently used cameras beyond max_cached_frames"""
+        with self._cache_lock:
+            self.frame_cache[camera_id] = frame_data
+            self.frame_cache.move_to_end(camera_id)
+            while len(self.frame_cache) > self.max_cached_frames:
+                self.frame_cache.popitem(last=False)
     
-    def capture_frame(self, camera_id, force_refresh=False):
-        """Main method to capture frame with caching"""
+    def capture_frame(self, camera_id, force_refresh=False, deadline=None):
+        """
+        Main method to capture frame with caching; deadline is a time.monotonic() bound for the whole capture.
+        Successful frames carry the raw JPEG under 'jpeg' and a monotonic 'captured_at'.
+        """
         try:
             # Check cache first
             if not force_refresh:
                 cached_frame = self.get_cached_frame(camera_id)
                 if cached_frame:
-                    # Add local_time if missing
-                    if 'local_time' not in cached_frame:
-                        cached_frame['local_time'] = self.get_local_time_str(datetime.fromisoformat(cached_frame['timestamp']))
-                    logger.debug(f"[DEBUG] Returning cached_frame for {camera_id}: {cached_frame}")
+                    logger.debug(f"[DEBUG] Returning cached frame for {camera_id} ({len(cached_frame['jpeg'])} bytes)")
                     return cached_frame
             # Try HLS stream first
             try:
-                frame_data = self.capture_frame_from_hls(camera_id)
-                frame_data['local_time'] = self.get_local_time_str(datetime.fromisoformat(frame_data['timestamp']))
+                frame_data = self.capture_frame_from_hls(camera_id, deadline=deadline)
                 self.cache_frame(camera_id, frame_data)
-                logger.debug(f"[DEBUG] Returning fresh HLS frame for {camera_id}: {frame_data}")
+                logger.debug(f"[DEBUG] Returning fresh HLS frame for {camera_id} ({len(frame_data['jpeg'])} bytes)")
                 return frame_data
             except Exception as hls_error:
                 logger.error(f"HLS capture failed for {camera_id}: {str(hls_error)}")
                 # Fallback: try to get RTSP URL from Frigate config
                 try:
-                    config_response = requests.get(f"{self.frigate_host}/api/config")
-                    if config_response.status_code == 200:
-                        config = config_response.json()
-                        camera_config = config.get('cameras', {}).get(camera_id, {})
-                        # Try to find RTSP URL in camera config
-                        inputs = camera_config.get('ffmpeg', {}).get('inputs', [])
-                        for input_config in inputs:
-                            if 'path' in input_config and input_config['path'].startswith('rtsp://'):
-                                rtsp_url = input_config['path']
-                                frame_data = self.capture_frame_from_rtsp(camera_id, rtsp_url)
-                                frame_data['local_time'] = self.get_local_time_str(datetime.fromisoformat(frame_data['timestamp']))
-                                self.cache_frame(camera_id, frame_data)
-                                logger.debug(f"[DEBUG] Returning fresh RTSP frame for {camera_id}: {frame_data}")
-                                return frame_data
+                    camera = self.config_cache.get_camera(camera_id)
+                    # First RTSP input from the camera's ffmpeg config
+                    if camera and camera['rtsp_url']:
+                        frame_data = self.capture_frame_from_rtsp(camera_id, camera['rtsp_url'], deadline=deadline)
+                        frame_data['local_time'] = self.get_local_time_str(datetime.fromisoformat(frame_data['timestamp']))
+                        self.cache_frame(camera_id, frame_data)
+                        logger.debug(f"[DEBUG] Returning fresh RTSP frame for {camera_id} ({len(frame_data['jpeg'])} bytes)")
+                        return frame_data
                 except Exception as rtsp_error:
                     logger.error(f"RTSP fallback failed for {camera_id}: {str(rtsp_error)}")
                 # If all else fails, return error
@@ -185,25 +195,58 @@ class FrameCapture:
             logger.error(f"[DEBUG] Returning exception error frame for {camera_id}: {error_frame}")
             return error_frame
     
-    def capture_all_frames(self, camera_ids, force_refresh=False):
-        """Capture frames for multiple cameras"""
+    def _capture_error(self, camera_id, message):
+        """Error frame for a camera that could not be captured"""
+        error_frame = {
+            'error': message,
+            'timestamp': datetime.now().isoformat(),
+            'local_time': self.get_local_time_str(),
+            'source': 'error'
+        }
+        logger.error(f"[DEBUG] capture_all_frames error for {camera_id}: {error_frame}")
+        return error_frame
+
+    def capture_all_frames(self, camera_ids, force_refresh=False, camera_timeout=12, total_timeout=15):
+        """
+        Capture frames for multiple cameras concurrently. Each camera gets at most
+        camera_timeout seconds and the batch returns within total_timeout; cameras
+        that have not finished by then are reported as timed out (partial results).
+        """
+        started = time.monotonic()
+        batch_deadline = started + total_timeout
+        camera_deadline = min(started + camera_timeout, batch_deadline)
+
+        futures = {
+            camera_id: self.executor.submit(self.capture_frame, camera_id, force_refresh, camera_deadline)
+            for camera_id in dict.fromkeys(camera_ids)
+        }
+        wait(futures.values(), timeout=max(0, batch_deadline - time.monotonic()))
+
         results = {}
-        
-        for camera_id in camera_ids:
+        for camera_id, future in futures.items():
+            if not future.done():
+                future.cancel()  # Frees the slot if it never started; a running capture stops at its deadline
+                results[camera_id] = self._capture_error(camera_id, 'Capture timed out')
+                continue
             try:
-                results[camera_id] = self.capture_frame(camera_id, force_refresh)
-                logger.debug(f"[DEBUG] capture_all_frames result for {camera_id}: {results[camera_id]}")
+                results[camera_id] = future.result()
+                logger.debug(f"[DEBUG] capture_all_frames result for {camera_id}: {results[camera_id].get('source')}")
             except Exception as e:
-                error_frame = {
-                    'error': f'Capture failed: {str(e)}',
-                    'timestamp': datetime.now().isoformat(),
-                    'local_time': self.get_local_time_str(),
-                    'source': 'error'
-                }
-                logger.error(f"[DEBUG] capture_all_frames exception for {camera_id}: {error_frame}")
-                results[camera_id] = error_frame
-        
+                results[camera_id] = self._capture_error(camera_id, f'Capture failed: {str(e)}')
+
+        logger.debug(f"capture_all_frames finished {len(results)} cameras in {time.monotonic() - started:.2f}s")
         return results
 
-# Global instance
-frame_capture = FrameCapture() 
\ No newline at end of file
+# Global instance, created on first use so importing this module stays cheap
+frame_capture = None
+_frame_capture_lock = threading.Lock()
+
+def get_frame_capture() -> FrameCapture:
+    """
+    Get the global FrameCapture instance, creating it if necessary.
+    """
+    global frame_capture
+    with _frame_capture_lock:
+        if frame_capture is None:
+            frame_capture = FrameCapture()
+        return frame_capture 
\ No newline at end of file
@@ -0,0 +1,175 @@
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+def build_camera_index(config: dict) -> Dict[str, dict]:
+    """
+    Precompute everything the routes need per camera from a Frigate config,
+    in config order: display name, stream names, input paths and the listing
+    entry returned by /api/cameras.
+    """
+    index = OrderedDict()
+    for camera_name, camera_config in (config.get('cameras') or {}).items():
+        inputs = ((camera_config or {}).get('ffmpeg') or {}).get('inputs') or []
+        input_paths = [i['path'] for i in inputs if isinstance(i, dict) and i.get('path')]
+        index[camera_name] = {
+            'id': camera_name,
+            'name': camera_name.replace('_', ' ').title(),
+            'stream_name': f"{camera_name}_live",
+            'ffmpeg_id': camera_name.lower(),  # FFmpeg service uses lowercase IDs
+            'input_paths': input_paths,
+            'rtsp_url': next((p for p in input_paths if p.startswith('rtsp://')), None),
+            'listing': {
+                'id': camera_name,
+                'name': camera_name.replace('_', ' ').title(),
+                # Use correct snapshot endpoint (no /api prefix since frontend adds it)
+                'snapshot_url': f"/camera/{camera_name}/snapshot",
+                # Provide both MP4 and HLS for adaptive streaming
+                'mp4_url': f'/api/camera/{camera_name}/stream.mp4',
+                'hls_url': f'/api/camera/{camera_name}/stream.m3u8',
+                # Additional streaming format info for frontend
+                'adaptive_urls': {
+                    'mp4': f'/api/camera/{camera_name}/stream.mp4',
+                    'hls': f'/api/camera/{camera_name}/stream.m3u8'
+                }
+            }
+        }
+    return index
+
+class FrigateConfigCache:
+    """
+    Shared cache of Frigate's /api/config and a camera index derived from it.
+
+    Fresh entries (younger than ttl) are served from memory. Stale entries are
+    still served while a single background refresh runs (stale-while-revalidate).
+    With no entry yet, concurrent callers share one fetch (single-flight) rather
+    than each downloading the config. Refreshes are conditional: the ETag is sent
+    back as If-None-Match, and an unchanged body is not re-parsed or re-indexed.
+    If Frigate is unreachable, the last good config keeps being served.
+    """
+
+    def __init__(self, frigate_host="http://frigate:5000", ttl=60, timeout=10, session=None):
+        self.frigate_host = frigate_host
+        self.ttl = ttl
+        self.timeout = timeout
+        self.session = session or requests
+        self.config: Optional[dict] = None
+        self.cameras: Dict[str, dict] = OrderedDict()
+        self.fetched_at = 0.0  # monotonic time of the last successful fetch or revalidation
+        self._etag = None
+        self._digest = None
+        self._lock = threading.Lock()
+        self._fetch_done = threading.Condition(self._lock)
+        self._fetching = False
+        self._last_error: Optional[Exception] = None
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'fetches': 0, 'not_modified': 0,
+                      'unchanged': 0, 'errors': 0}
+
+    def _fetch(self):
+        """Download the config and rebuild the index if it changed (runs without the lock held)"""
+        headers = {'If-None-Match': self._etag} if self._etag else {}
+        response = self.session.get(f"{self.frigate_host}/api/config", headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and self.config is not None:
+            with self._lock:
+                self.stats['not_modified'] += 1
+                self.fetched_at = time.monotonic()
+            return
+        response.raise_for_status()
+
+        digest = hashlib.sha1(response.content).digest()
+        if digest == self._digest:
+            with self._lock:
+                self.stats['unchanged'] += 1
+                self.fetched_at = time.monotonic()
+            return
+
+        config = response.json()
+        cameras = build_camera_index(config)
+        with self._lock:
+            self.config = config
+            self.cameras = cameras
+            self._digest = digest
+            self._etag = response.headers.get('ETag')
+            self.fetched_at = time.monotonic()
+        logger.info(f"Loaded Frigate config with {len(cameras)} cameras")
+
+    def _run_fetch(self):
+        """Fetch as the single in-flight fetcher, then wake everyone waiting on it"""
+        error = None
+        try:
+            self._fetch()
+        except Exception as e:
+            error = e
+            logger.warning(f"Frigate config refresh failed: {e}")
+        with self._lock:
+            self.stats['fetches'] += 1
+            if error is not None:
+                self.stats['errors'] += 1
+            self._last_error = error
+            self._fetching = False
+            self._fetch_done.notify_all()
+
+    def _ensure_loaded(self):
+        """Make sure a config is available, refreshing it per the TTL policy"""
+        with self._lock:
+            age = time.monotonic() - self.fetched_at
+            if self.config is not None and age < self.ttl:
+                self.stats['hits'] += 1
+                return
+            if self.config is not None:
+                # Serve the stale copy and refresh in the background
+                self.stats['stale_hits'] += 1
+                if not self._fetching:
+                    self._fetching = True
+                    threading.Thread(target=self._run_fetch, daemon=True).start()
+                return
+
+            self.stats['misses'] += 1
+            if self._fetching:
+                # Another request is already fetching; wait for its result
+                self._fetch_done.wait_for(lambda: not self._fetching, self.timeout + 1)
+                if self.config is not None:
+                    return
+                raise RuntimeError(f"Frigate config unavailable: {self._last_error}")
+            self._fetching = True
+
+        self._run_fetch()
+        with self._lock:
+            if self.config is None:
+                raise RuntimeError(f"Frigate config unavailable: {self._last_error}")
+
+    def get_config(self) -> dict:
+        """The full Frigate config (treat as read-only)"""
+        self._ensure_loaded()
+        return self.config
+
+    def get_cameras(self) -> Dict[str, dict]:
+        """Camera index keyed by Frigate camera name, in config order (treat as read-only)"""
+        self._ensure_loaded()
+        return self.cameras
+
+    def get_camera(self, camera_name: str) -> Optional[dict]:
+        """Index entry for one camera, or None if Frigate does not know it"""
+        return self.get_cameras().get(camera_name)
+
+    def invalidate(self):
+        """Force the next access to revalidate with Frigate"""
+        with self._lock:
+            self.fetched_at = 0.0
+
+    def get_status(self) -> dict:
+        """Get cache counters"""
+        with self._lock:
+            status = dict(self.stats)
+            status['cameras'] = len(self.cameras)
+            status['age_seconds'] = time.monotonic() - self.fetched_at if self.config is not None else None
+            status['last_error'] = str(self._last_error) if self._last_error else None
+        status['ttl'] = self.ttl
+        return status
@@ -0,0 +1,264 @@
+import fcntl
+import os
+import shutil
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from hls_jobs import LOCK_NAME, PLAYLIST_NAME, playlist_complete
+
+logger = logging.getLogger(__name__)
+
+class _Hint:
+    """This process's latest view of an event, and when it last wrote that to disk"""
+
+    def __init__(self):
+        self.last_access = 0.0
+        self.touched_on_disk = 0.0
+
+class EventHlsCache:
+    """
+    Keeps generated event HLS directories (root/<event_id>) on disk so repeat
+    views skip the transcode, within max_bytes in total and, if max_age is set,
+    max_age seconds since the last view. The least recently viewed directories
+    are evicted first.
+
+    The directory is the source of truth, shared by every worker process: views
+    are recorded as the mtime of each event's lock file (at most every
+    touch_interval seconds per process), and every enforce() pass rescans sizes
+    and mtimes, so the limits hold for all workers together. The in-memory hints
+    only add this process's views that are newer than the throttled disk write.
+
+    A directory is never evicted while it is pinned: while is_pinned(event_id)
+    says a job in this process is using it, or while any worker process holds
+    its transcode lock.
+    """
+
+    def __init__(self, root: str, max_bytes: int, max_age: Optional[float] = None,
+                 is_pinned: Optional[Callable[[str], bool]] = None,
+                 on_evict: Optional[Callable[[str], None]] = None, touch_interval=60, max_hints=1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age or None
+        self.is_pinned = is_pinned or (lambda event_id: False)
+        self.on_evict = on_evict  # Called with the directory path after it has been removed
+        self.touch_interval = touch_interval
+        self.max_hints = max_hints
+        self._hints = OrderedDict()  # event_id -> _Hint, least recently viewed first
+        self._lock = threading.Lock()
+        self._enforce_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'evicted_bytes': 0, 'expired': 0,
+                      'orphans_removed': 0}
+        self.disk = {'entries': 0, 'bytes': 0, 'scanned_at': None}  # Result of the latest scan
+
+    def event_dir(self, event_id: str) -> str:
+        return os.path.join(self.root, event_id)
+
+    def lookup(self, event_id: str) -> bool:
+        """
+        True if the event's HLS output is complete on disk (a hit). Requests that
+        join a job already running for the event count as neither hit nor miss.
+        """
+        playlist_path = os.path.join(self.event_dir(event_id), PLAYLIST_NAME)
+        if playlist_complete(playlist_path):
+            with self._lock:
+                self.stats['hits'] += 1
+            self.touch(event_id)
+            return True
+        if not self.is_pinned(event_id):
+            with self._lock:
+                self.stats['misses'] += 1
+        return False
+
+    def touch(self, event_id: str):
+        """Record a view of an event (playlist or segment request)"""
+        now = time.time()
+        with self._lock:
+            hint = self._hints.get(event_id)
+            if hint is None:
+                hint = self._hints[event_id] = _Hint()
+                while len(self._hints) > self.max_hints:
+                    self._hints.popitem(last=False)
+            hint.last_access = now
+            self._hints.move_to_end(event_id)
+            if now - hint.touched_on_disk < self.touch_interval:
+                return
+            hint.touched_on_disk = now
+        self._write_access(event_id)
+
+    def _write_access(self, event_id: str):
+        """Publish a view to the other workers through the lock file's mtime"""
+        try:
+            os.utime(os.path.join(self.event_dir(event_id), LOCK_NAME))
+        except OSError:
+            pass
+
+    def finished(self, event_id: str, enforce=True):
+        """Account for an event whose job just ended; incomplete output from failed jobs is removed"""
+        if not playlist_complete(os.path.join(self.event_dir(event_id), PLAYLIST_NAME)):
+            self._remove_dir(event_id)
+            return
+        self._write_access(event_id)  # Someone asked for it just now; don't let an old lock mtime expire it
+        if enforce:
+            self.enforce()
+
+    def remove(self, event_id: str):
+        """Forget an event whose directory was deleted outside the cache"""
+        with self._lock:
+            self._hints.pop(event_id, None)
+
+    def reconcile(self):
+        """
+        Start-up scan: remove stray files and directories left by interrupted
+        jobs, then enforce limits over the completed ones.
+        """
+        started = time.monotonic()
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        removed = 0
+        for name in names:
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except OSError:
+                    pass
+                continue
+            if not playlist_complete(os.path.join(path, PLAYLIST_NAME)):
+                if not self.is_pinned(name) and self._remove_dir(name):
+                    removed += 1
+        with self._lock:
+            self.stats['orphans_removed'] += removed
+        evicted = self.enforce()
+        logger.info(f"Event HLS cache: {self.disk['entries']} cached events ({self.disk['bytes']} bytes), "
+                    f"{removed} orphans removed, {evicted} evicted in {time.monotonic() - started:.2f}s")
+
+    def _scan(self):
+        """
+        (total bytes of every event directory, [(last_access, event_id, size)] for
+        the completed ones), read from disk and merged with this process's hints.
+        """
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0, []
+        with self._lock:
+            hints = {event_id: hint.last_access for event_id, hint in self._hints.items()}
+        total, complete = 0, []
+        for name in names:
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                continue
+            if not playlist_complete(os.path.join(path, PLAYLIST_NAME)):
+                # Output still being written counts against the budget; leftovers are reconcile()'s job
+                if self._is_locked(path):
+                    total += self._measure(path)
+                continue
+            size = self._measure(path)
+            try:
+                last_access = max(self._last_access(path), hints.get(name, 0.0))
+            except OSError:
+                continue  # Removed while scanning
+            total += size
+            complete.append((last_access, name, size))
+        complete.sort()
+        return total, complete
+
+    def enforce(self) -> int:
+        """Evict expired and least recently viewed events until within budget; returns the number evicted"""
+        with self._enforce_lock:
+            now = time.time()
+            total, complete = self._scan()
+
+            evicted = 0
+            for last_access, event_id, size in complete:
+                expired = self.max_age is not None and now - last_access > self.max_age
+                if not expired and total <= self.max_bytes:
+                    break
+                if self.is_pinned(event_id) or not self._remove_dir(event_id):
+                    continue
+                total -= size
+                evicted += 1
+                with self._lock:
+                    self.stats['evictions'] += 1
+                    self.stats['evicted_bytes'] += size
+                    if expired:
+                        self.stats['expired'] += 1
+
+            self.disk = {'entries': len(complete) - evicted, 'bytes': total, 'scanned_at': now}
+            return evicted
+
+    def _remove_dir(self, event_id: str) -> bool:
+        """Delete an event directory unless a worker holds its transcode lock; True if it is gone"""
+        path = self.event_dir(event_id)
+        try:
+            fd = os.open(os.path.join(path, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            self.remove(event_id)
+            return True
+        except OSError as e:
+            logger.warning(f"Cannot open HLS lock for event {event_id}: {e}")
+            return False
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # A transcode is writing here
+            shutil.rmtree(path, ignore_errors=True)
+        finally:
+            os.close(fd)
+        self.remove(event_id)
+        if self.on_evict is not None:
+            self.on_evict(path)
+        logger.info(f"Removed cached HLS for event {event_id}")
+        return True
+
+    @staticmethod
+    def _is_locked(path: str) -> bool:
+        """True if a worker holds the directory's transcode lock"""
+        try:
+            fd = os.open(os.path.join(path, LOCK_NAME), os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return False
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _measure(path: str) -> int:
+        total = 0
+        try:
+            with os.scandir(path) as entries:
+                for item in entries:
+                    if item.is_file(follow_symlinks=False):
+                        total += item.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+        return total
+
+    @staticmethod
+    def _last_access(path: str) -> float:
+        for name in (LOCK_NAME, PLAYLIST_NAME):
+            try:
+                return os.stat(os.path.join(path, name)).st_mtime
+            except OSError:
+                continue
+        return os.stat(path).st_mtime
+
+    def get_status(self) -> dict:
+        """Get cache counters and disk usage"""
+        with self._lock:
+            status = dict(self.stats)
+        status.update(self.disk)
+        status['max_bytes'] = self.max_bytes
+        status['max_age_seconds'] = self.max_age
+        return status
@@ -0,0 +1,421 @@
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+READY = 'ready'
+FAILED = 'failed'
+
+PLAYLIST_NAME = 'playlist.m3u8'
+LOCK_NAME = '.transcode.lock'
+LOG_NAME = 'ffmpeg.log'
+
+def playlist_complete(path: str) -> bool:
+    """True if the playlist at path exists and FFmpeg has finished it (#EXT-X-ENDLIST)"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 64))
+            return b'#EXT-X-ENDLIST' in f.read()
+    except OSError:
+        return False
+
+# What browsers play from an HLS stream copy without re-encoding
+COPY_VIDEO_CODECS = {'h264'}
+COPY_VIDEO_PROFILES = {'Constrained Baseline', 'Baseline', 'Main', 'High'}
+COPY_PIXEL_FORMATS = {'yuv420p', 'yuvj420p'}
+COPY_MAX_LEVEL = 51  # H.264 level 5.1
+COPY_AUDIO_CODECS = {'aac', 'mp3'}
+
+def probe_media(source: str, timeout=15) -> dict:
+    """ffprobe a file or URL; returns its JSON description (streams and format). Raises on failure."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', source],
+        stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout, check=True
+    )
+    return json.loads(result.stdout)
+
+def probe_duration(probe: dict) -> Optional[float]:
+    try:
+        return float(probe['format']['duration'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def copy_compatibility(probe: dict) -> Tuple[bool, bool]:
+    """
+    (video can be stream-copied, audio can be stream-copied) for an ffprobe
+    result. Audio is also "copyable" when there is none.
+    """
+    streams = probe.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    video_ok = (video is not None
+                and video.get('codec_name') in COPY_VIDEO_CODECS
+                and video.get('profile') in COPY_VIDEO_PROFILES
+                and video.get('pix_fmt') in COPY_PIXEL_FORMATS
+                and 0 < int(video.get('level') or 0) <= COPY_MAX_LEVEL)
+    audio_ok = audio is None or audio.get('codec_name') in COPY_AUDIO_CODECS
+    return video_ok, audio_ok
+
+class TranscodeJob:
+    """One event clip being turned into HLS segments"""
+
+    def __init__(self, event_id: str, output_dir: str):
+        self.event_id = event_id
+        self.output_dir = output_dir
+        self.playlist_path = os.path.join(output_dir, PLAYLIST_NAME)
+        self.state = QUEUED
+        self.progress = 0.0  # 0..1, from FFmpeg's out_time against the clip duration
+        self.duration: Optional[float] = None
+        self.out_time = 0.0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.method: Optional[str] = None  # Name of the plan FFmpeg is running, e.g. 'copy' or 'transcode'
+        self.process: Optional[subprocess.Popen] = None
+        self.playable = threading.Event()  # Set once the playlist lists a segment, or the job ended
+
+    @property
+    def done(self) -> bool:
+        return self.state in (READY, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            'event_id': self.event_id,
+            'state': self.state,
+            'method': self.method,
+            'progress': round(self.progress, 3),
+            'out_time': round(self.out_time, 2),
+            'duration': self.duration,
+            'playable': self.playable.is_set() and self.state != FAILED,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+class TranscodeJobManager:
+    """
+    Runs FFmpeg jobs that turn event clips into HLS, one job per event no matter
+    how many viewers ask for it, with at most max_concurrent FFmpeg processes at
+    a time (the rest wait in the queue). With slot_prefix the limit holds for
+    the whole host: each FFmpeg run first claims one of max_concurrent slot
+    lock files shared by all worker processes. FFmpeg writes an EVENT playlist
+    that grows as segments land, so viewers can start before the encode finishes.
+
+    prepare(job) returns ([(method, FFmpeg argv), ...], clip duration in seconds
+    or None). The plans are tried in order: if one fails before any segment was
+    listed, the output is cleared and the next runs (e.g. a stream copy falling
+    back to a full transcode). The manager adds -progress to each command.
+    Worker processes that share the output root coordinate through a flock in
+    each event directory.
+    """
+
+    def __init__(self, output_root: str,
+                 prepare: Callable[[TranscodeJob], Tuple[List[Tuple[str, List[str]]], Optional[float]]],
+                 max_concurrent=1, timeout=300, max_finished=256,
+                 on_finish: Optional[Callable[[TranscodeJob], None]] = None, slot_prefix: Optional[str] = None):
+        self.output_root = output_root
+        self.prepare = prepare
+        self.on_finish = on_finish  # Called with each ready or failed job once its lock is released
+        self.max_concurrent = max_concurrent
+        # FFmpeg slots are lock files f"{slot_prefix}{n}" shared by every worker process on the host
+        self.slot_paths = [f"{slot_prefix}{n}" for n in range(max_concurrent)] if slot_prefix else []
+        self._stopping = False
+        self.waiting_for_slot = 0
+        self.timeout = timeout  # Seconds before a running FFmpeg is killed
+        self.max_finished = max_finished  # Finished jobs remembered for status queries
+        self._jobs: Dict[str, TranscodeJob] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='hls-transcode')
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0, 'cancelled': 0,
+                      'reused_on_disk': 0}
+
+        logger.info(f"TranscodeJobManager initialized for {output_root} ({max_concurrent} concurrent)")
+
+    def event_dir(self, event_id: str) -> str:
+        return os.path.join(self.output_root, event_id)
+
+    def get(self, event_id: str) -> Optional[TranscodeJob]:
+        with self._lock:
+            return self._jobs.get(event_id)
+
+    def is_active(self, event_id: str) -> bool:
+        """True while an event has a queued or running job in this process"""
+        with self._lock:
+            job = self._jobs.get(event_id)
+            return job is not None and not job.done
+
+    def submit(self, event_id: str) -> TranscodeJob:
+        """
+        The job for an event: the existing one if it is queued, running or ready,
+        otherwise a new job (a playlist already completed on disk is reused as is).
+        """
+        output_dir = self.event_dir(event_id)
+        with self._lock:
+            job = self._jobs.get(event_id)
+            if job is not None and (not job.done or (job.state == READY and os.path.exists(job.playlist_path))):
+                self._jobs.move_to_end(event_id)
+                self.stats['deduplicated'] += 1
+                return job
+
+            job = TranscodeJob(event_id, output_dir)
+            self._jobs[event_id] = job
+            self._trim()
+            if playlist_complete(job.playlist_path):
+                job.state = READY
+                job.progress = 1.0
+                job.finished_at = time.time()
+                job.playable.set()
+                self.stats['reused_on_disk'] += 1
+                return job
+            self.stats['submitted'] += 1
+
+        self._executor.submit(self._run, job)
+        logger.info(f"Queued HLS transcode for event {event_id}")
+        return job
+
+    def cancel(self, event_id: str) -> Optional[TranscodeJob]:
+        """Stop and forget an event's job (before its directory is deleted)"""
+        with self._lock:
+            job = self._jobs.pop(event_id, None)
+            if job is None or job.done:
+                return job
+            job.cancelled = True
+            job.state = FAILED
+            job.error = 'Cancelled'
+            job.finished_at = time.time()
+            process = job.process
+            self.stats['cancelled'] += 1
+        if process is not None and process.poll() is None:
+            process.kill()
+        job.playable.set()
+        return job
+
+    def _trim(self):
+        """Drop the oldest finished jobs beyond max_finished (caller must hold the lock)"""
+        finished = [event_id for event_id, job in self._jobs.items() if job.done]
+        for event_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[event_id]
+
+    def _finish(self, job: TranscodeJob, state: str, error: Optional[str] = None):
+        with self._lock:
+            job.state = state
+            job.error = error
+            job.finished_at = time.time()
+            job.process = None
+            if state == READY:
+                job.progress = 1.0
+                self.stats['completed'] += 1
+            else:
+                self.stats['failed'] += 1
+        job.playable.set()
+
+    def _run(self, job: TranscodeJob):
+        if job.cancelled:
+            return
+        os.makedirs(job.output_dir, exist_ok=True)
+        lock_fd = os.open(os.path.join(job.output_dir, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._follow(job, lock_fd)
+                return
+            if playlist_complete(job.playlist_path):
+                self._finish(job, READY)  # Another worker process finished it while we were queued
+                return
+            slot_fd = self._acquire_slot(job)
+            if slot_fd is None and self.slot_paths:
+                return  # Cancelled or shutting down while waiting for a slot
+            try:
+                self._transcode(job)
+            finally:
+                if slot_fd is not None:
+                    os.close(slot_fd)
+        except Exception as e:
+            logger.error(f"HLS transcode for event {job.event_id} failed: {e}")
+            if not job.done:
+                self._finish(job, FAILED, str(e))
+        finally:
+            os.close(lock_fd)
+        if self.on_finish is not None and job.done and not job.cancelled:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                logger.error(f"HLS job finish hook failed for event {job.event_id}: {e}")
+
+    def _acquire_slot(self, job: TranscodeJob) -> Optional[int]:
+        """
+        Claim a free host-wide FFmpeg slot, waiting while every slot is taken (the
+        job stays queued meanwhile). Returns the held lock fd; None without slots
+        or if the job was cancelled first.
+        """
+        if not self.slot_paths:
+            return None
+        with self._lock:
+            self.waiting_for_slot += 1
+        try:
+            while not job.cancelled and not self._stopping:
+                for path in self.slot_paths:
+                    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        return fd
+                    except BlockingIOError:
+                        os.close(fd)
+                time.sleep(0.25)
+            return None
+        finally:
+            with self._lock:
+                self.waiting_for_slot -= 1
+
+    def _follow(self, job: TranscodeJob, lock_fd: int):
+        """Another worker process is encoding this event; track its output until it lets go"""
+        with self._lock:
+            if job.cancelled:
+                return
+            job.state = RUNNING
+            job.started_at = time.time()
+        while not job.cancelled:
+            if not job.playable.is_set() and os.path.exists(job.playlist_path):
+                job.playable.set()
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(0.5)
+        if job.cancelled:
+            return
+        if playlist_complete(job.playlist_path):
+            self._finish(job, READY)
+        else:
+            self._finish(job, FAILED, 'Transcode in another worker did not complete')
+
+    def _clear_output(self, job: TranscodeJob):
+        """Remove leftovers of an earlier, unfinished run (keeps the lock file we hold)"""
+        for name in os.listdir(job.output_dir):
+            if name == LOCK_NAME:
+                continue
+            path = os.path.join(job.output_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.unlink(path)
+
+    def _transcode(self, job: TranscodeJob):
+        self._clear_output(job)
+        plans, duration = self.prepare(job)
+        job.duration = duration
+
+        for attempt, (method, cmd) in enumerate(plans):
+            returncode, timed_out = self._run_ffmpeg(job, method, cmd)
+            if job.cancelled:
+                return
+            if returncode == 0 and playlist_complete(job.playlist_path):
+                self._finish(job, READY)
+                logger.info(f"HLS {method} for event {job.event_id} finished in "
+                            f"{job.finished_at - job.started_at:.1f}s")
+                return
+            if timed_out:
+                self._finish(job, FAILED, f"Timed out after {self.timeout}s")
+                logger.error(f"HLS {method} timeout for event {job.event_id}")
+                return
+            error = f"FFmpeg exited with code {returncode}: {self._log_tail(job)}"
+            # Fall back to the next plan only while no viewer has been handed this attempt's segments
+            if attempt + 1 < len(plans) and not job.playable.is_set():
+                logger.warning(f"HLS {method} failed for event {job.event_id}, trying {plans[attempt + 1][0]}: {error}")
+                self._clear_output(job)
+                continue
+            self._finish(job, FAILED, error)
+            logger.error(f"HLS {method} failed for event {job.event_id}: {error}")
+            return
+
+    def _run_ffmpeg(self, job: TranscodeJob, method: str, cmd: List[str]) -> Tuple[Optional[int], bool]:
+        """Run one FFmpeg command for a job, tracking progress; returns (exit code, timed out)"""
+        cmd = cmd[:1] + ['-nostats', '-progress', 'pipe:1'] + cmd[1:]
+        with self._lock:
+            if job.cancelled:
+                return None, False
+            job.method = method
+            job.state = RUNNING
+            job.started_at = job.started_at or time.time()
+            job.out_time = 0.0
+            job.progress = 0.0
+            log_file = open(os.path.join(job.output_dir, LOG_NAME), 'wb')
+            try:
+                job.process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                               stderr=log_file)
+            finally:
+                log_file.close()
+            process = job.process
+            self.stats[method] = self.stats.get(method, 0) + 1
+        logger.info(f"HLS {method} of event {job.event_id} started (pid {process.pid})")
+
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+
+        watchdog = threading.Timer(self.timeout, kill_on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            for line in process.stdout:
+                key, _, value = line.decode(errors='replace').strip().partition('=')
+                if key == 'out_time_us' and value.isdigit():
+                    job.out_time = int(value) / 1_000_000
+                    if job.duration:
+                        job.progress = min(0.99, job.out_time / job.duration)
+                elif key == 'progress' and not job.playable.is_set() and os.path.exists(job.playlist_path):
+                    job.playable.set()  # The first segment is listed; viewers can start
+            returncode = process.wait()
+        finally:
+            watchdog.cancel()
+            process.stdout.close()
+        return returncode, timed_out.is_set()
+
+    def _log_tail(self, job: TranscodeJob, limit=300) -> str:
+        try:
+            with open(os.path.join(job.output_dir, LOG_NAME), 'rb') as f:
+                return f.read()[-limit:].decode(errors='replace').strip()
+        except OSError:
+            return ''
+
+    def shutdown(self):
+        """Kill running FFmpeg processes and stop the workers"""
+        self._stopping = True
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if not job.done]
+        for job in jobs:
+            job.cancelled = True
+            if job.process is not None and job.process.poll() is None:
+                job.process.kill()
+        self._executor.shutdown(wait=False)
+
+    def get_status(self) -> dict:
+        """Get job counts by state and counters"""
+        with self._lock:
+            status = dict(self.stats)
+            states = {QUEUED: 0, RUNNING: 0, READY: 0, FAILED: 0}
+            for job in self._jobs.values():
+                states[job.state] += 1
+            status['waiting_for_slot'] = self.waiting_for_slot
+        status['jobs'] = states
+        status['max_concurrent'] = self.max_concurrent
+        status['host_wide_limit'] = bool(self.slot_paths)
+        return status
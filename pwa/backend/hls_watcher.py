@@ -0,0 +1,195 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+def _load_inotify():
+    """Return libc if the inotify syscalls are available, otherwise None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class PlaylistWatcher:
+    """
+    Lets request threads wait for HLS playlists to appear without sleeping in a loop.
+    A single background thread watches the directories of the files being waited on
+    (with inotify where available, otherwise by polling) and wakes every waiter whose
+    file exists as soon as FFmpeg writes or renames it into place.
+    """
+
+    def __init__(self, root: str, poll_interval=0.25, use_inotify=True):
+        self.root = root
+        self.poll_interval = poll_interval  # Fallback polling period, and inotify safety net
+        self._waiters: Dict[str, List[threading.Event]] = {}  # path -> events of waiting requests
+        self._watches: Dict[str, int] = {}  # watched directory -> inotify watch descriptor
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.running = True
+        self.stats = {'waits': 0, 'immediate': 0, 'notified': 0, 'timeouts': 0}
+
+        self._libc = _load_inotify() if use_inotify else None
+        self._fd = -1
+        if self._libc is not None:
+            self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if self._fd < 0:
+                logger.warning(f"inotify unavailable ({os.strerror(ctypes.get_errno())}), polling for playlists")
+                self._libc = None
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+        logger.info("PlaylistWatcher initialized for %s (%s)", root, 'inotify' if self._libc else 'polling')
+
+    def wait_for(self, path: str, timeout: float) -> bool:
+        """
+        Block until path exists or timeout elapses. Returns True if the file exists.
+        """
+        with self._lock:
+            self.stats['waits'] += 1
+        if os.path.exists(path):
+            with self._lock:
+                self.stats['immediate'] += 1
+            return True
+
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(path, []).append(event)
+            self._refresh_watches()
+        self._wakeup.set()
+        try:
+            # Re-check after registering in case the file appeared in between
+            if not os.path.exists(path):
+                event.wait(timeout)
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(path, [])
+                if event in waiters:
+                    waiters.remove(event)
+                if not waiters:
+                    self._waiters.pop(path, None)
+
+        exists = os.path.exists(path)
+        with self._lock:
+            self.stats['notified' if exists else 'timeouts'] += 1
+        return exists
+
+    def _watch_dir_for(self, path: str) -> Optional[str]:
+        """Deepest existing directory on the way to path (so a missing camera dir is noticed when created)"""
+        directory = os.path.dirname(path)
+        while directory and not os.path.isdir(directory):
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+        return directory or None
+
+    def _refresh_watches(self):
+        """Add watches for directories with waiters and drop the rest (caller must hold the lock)"""
+        if self._libc is None:
+            return
+        wanted = {d for d in (self._watch_dir_for(p) for p in self._waiters) if d}
+        for directory in list(self._watches):
+            if directory not in wanted:
+                self._libc.inotify_rm_watch(self._fd, self._watches.pop(directory))
+        for directory in wanted - set(self._watches):
+            wd = self._libc.inotify_add_watch(self._fd, directory.encode(), WATCH_MASK)
+            if wd >= 0:
+                self._watches[directory] = wd
+            else:
+                logger.debug(f"Could not watch {directory}: {os.strerror(ctypes.get_errno())}")
+
+    def _notify_ready(self):
+        """Wake waiters whose files now exist"""
+        with self._lock:
+            for path, waiters in self._waiters.items():
+                if os.path.exists(path):
+                    for event in waiters:
+                        event.set()
+            self._refresh_watches()
+
+    def _drain_inotify(self):
+        # Event details are not needed: any change re-checks every waited path
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        while self.running:
+            if self._libc is not None:
+                try:
+                    readable, _, _ = select.select([self._fd], [], [], self.poll_interval)
+                except (OSError, ValueError):
+                    break
+                if readable:
+                    self._drain_inotify()
+                self._notify_ready()
+            else:
+                # Sleep until the next poll, or until a new waiter registers
+                self._wakeup.wait(self.poll_interval if self._waiters else 1.0)
+                self._wakeup.clear()
+                self._notify_ready()
+
+    def shutdown(self):
+        """Stop the watcher thread and release waiters"""
+        self.running = False
+        self._wakeup.set()
+        self.thread.join(timeout=2)
+        with self._lock:
+            for waiters in self._waiters.values():
+                for event in waiters:
+                    event.set()
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+            self._watches.clear()
+
+    def get_status(self) -> dict:
+        """Get watcher counters"""
+        with self._lock:
+            status = dict(self.stats)
+            status['waiting'] = sum(len(w) for w in self._waiters.values())
+            status['watched_dirs'] = len(self._watches)
+        status['mode'] = 'inotify' if self._libc else 'polling'
+        return status
+
+# Global playlist watcher instance
+playlist_watcher = None
+_playlist_watcher_lock = threading.Lock()
+
+def get_playlist_watcher(root: str = None) -> PlaylistWatcher:
+    """
+    Get the global playlist watcher instance, creating it if necessary.
+    """
+    global playlist_watcher
+    with _playlist_watcher_lock:
+        if playlist_watcher is None:
+            playlist_watcher = PlaylistWatcher(root or '/segments')
+        return playlist_watcher
+
+def shutdown_playlist_watcher():
+    """
+    Shutdown the global playlist watcher instance.
+    """
+    global playlist_watcher
+    with _playlist_watcher_lock:
+        if playlist_watcher is not None:
+            playlist_watcher.shutdown()
+            playlist_watcher = None
@@ -0,0 +1,88 @@
+import fcntl
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive advisory lock on path for the duration of the block, so
+    work such as schema setup runs in one worker process at a time.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+class LeaderElection:
+    """
+    Picks one leader among the worker processes of a single host using an
+    exclusive flock on a shared lock file. Exactly one process holds the lock;
+    the others wait on it in a background thread, so when the leader exits (and
+    the kernel releases its lock) one of them is promoted and its on_elected
+    callbacks run.
+    """
+
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self.is_leader = False
+        self._fd = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def on_elected(self, callback: Callable[[], None]):
+        """Register a callback to run (once) when this process becomes leader"""
+        with self._lock:
+            self._callbacks.append(callback)
+            already_leader = self.is_leader
+        if already_leader:
+            callback()
+
+    def start(self) -> bool:
+        """
+        Try to become leader now; if another process leads, keep waiting in the
+        background. Returns True if this process is leader on return.
+        """
+        self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info(f"Worker {os.getpid()} is a follower; waiting for leadership")
+            self._thread = threading.Thread(target=self._wait_for_lock, daemon=True)
+            self._thread.start()
+            return False
+        self._elected()
+        return True
+
+    def _wait_for_lock(self):
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except OSError as e:
+            logger.error(f"Leader election wait failed: {e}")
+            return
+        self._elected()
+
+    def _elected(self):
+        with self._lock:
+            self.is_leader = True
+            callbacks = list(self._callbacks)
+        logger.info(f"Worker {os.getpid()} elected leader")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Leader start-up task failed: {e}")
+
+    def get_status(self) -> dict:
+        return {
+            'pid': os.getpid(),
+            'is_leader': self.is_leader
+        }
@@ -0,0 +1,184 @@
+import sqlite3
+import logging
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+def _create_core_tables(conn):
+    """Users, login audit, IP blocks and the IP geolocation cache"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            email TEXT,
+            full_name TEXT,
+            is_admin BOOLEAN DEFAULT 0,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS login_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address VARCHAR(45) NOT NULL,
+            username VARCHAR(50),
+            success BOOLEAN NOT NULL DEFAULT FALSE,
+            attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            user_agent TEXT
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blocked_ips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address VARCHAR(45) NOT NULL UNIQUE,
+            blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            blocked_until TIMESTAMP NOT NULL,
+            failed_attempts INTEGER NOT NULL,
+            reason VARCHAR(100) DEFAULT 'Too many failed login attempts'
+        )
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_login_attempts_ip ON login_attempts(ip_address)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_login_attempts_time ON login_attempts(attempt_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blocked_ips_address ON blocked_ips(ip_address)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blocked_ips_until ON blocked_ips(blocked_until)')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ip_geo_cache (
+            ip_address VARCHAR(45) PRIMARY KEY,
+            country TEXT,
+            region TEXT,
+            city TEXT,
+            lat REAL,
+            lon REAL,
+            isp TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _unique_email_indexes(conn) -> List[str]:
+    """Names of UNIQUE indexes on users that cover the email column"""
+    names = []
+    for idx in conn.execute('PRAGMA index_list(users)').fetchall():
+        if not idx['unique'] or not idx['name']:
+            continue
+        columns = [row['name'] for row in conn.execute(f"PRAGMA index_info('{idx['name']}')").fetchall()]
+        if 'email' in columns:
+            names.append(idx['name'])
+    return names
+
+def _drop_unique_email_index(conn):
+    """
+    Drop a standalone UNIQUE index on users.email so placeholder/empty emails do
+    not collide until real email collection is implemented.
+    """
+    for name in _unique_email_indexes(conn):
+        columns = [row['name'] for row in conn.execute(f"PRAGMA index_info('{name}')").fetchall()]
+        # Indexes backing a column constraint (sqlite_autoindex_*) cannot be dropped; the rebuild handles those
+        if columns == ['email'] and not name.startswith('sqlite_autoindex_'):
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            logger.info(f"Dropped UNIQUE index on users.email: {name}")
+
+def _relax_users_email(conn):
+    """Rebuild users so email/full_name are nullable and email is not unique (old schemas only)"""
+    email_notnull = any(col['name'] == 'email' and int(col['notnull']) == 1
+                        for col in conn.execute('PRAGMA table_info(users)').fetchall())
+    if not email_notnull and not _unique_email_indexes(conn):
+        return
+
+    logger.warning("Rebuilding users table to relax constraints on email/full_name")
+    conn.execute('''
+        CREATE TABLE users_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            email TEXT,
+            full_name TEXT,
+            is_admin BOOLEAN DEFAULT 0,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP
+        )
+    ''')
+    # Copy data, converting empty strings to NULL for email/full_name
+    conn.execute('''
+        INSERT INTO users_new (id, username, password_hash, email, full_name, is_admin, is_active, created_at, last_login)
+        SELECT id, username, password_hash,
+               NULLIF(email, ''), NULLIF(full_name, ''),
+               is_admin, is_active, created_at, last_login
+        FROM users
+    ''')
+    conn.execute('DROP TABLE users')
+    conn.execute('ALTER TABLE users_new RENAME TO users')
+    logger.info("Users table rebuilt; email/full_name now nullable and non-unique")
+
+def _add_login_attempts_cleared(conn):
+    """Flag failed attempts that an admin unblock has forgiven, so the rate limiter stops counting them"""
+    columns = [col['name'] for col in conn.execute('PRAGMA table_info(login_attempts)').fetchall()]
+    if 'cleared' not in columns:
+        conn.execute('ALTER TABLE login_attempts ADD COLUMN cleared BOOLEAN NOT NULL DEFAULT 0')
+
+# Ordered schema steps. Never edit or reorder a released step; append a new one.
+# Each step must be safe on databases created before schema_version existed.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'create core tables', _create_core_tables),
+    (2, 'drop unique index on users.email', _drop_unique_email_index),
+    (3, 'make users.email and users.full_name nullable', _relax_users_email),
+    (4, 'add login_attempts.cleared', _add_login_attempts_cleared),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version(conn) -> int:
+    """Highest applied migration, 0 for a database without a schema_version table"""
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+def apply_migrations(connection_factory) -> Tuple[int, int]:
+    """
+    Bring the schema up to LATEST_VERSION and return (version before, version after).
+
+    An up-to-date database costs one SELECT. Otherwise every pending step runs in
+    its own BEGIN IMMEDIATE transaction together with its schema_version row, and
+    the version is re-read inside that transaction, so concurrent workers never
+    apply a step twice and a failed step leaves no partial changes behind.
+    """
+    with connection_factory() as conn:
+        start = current_version(conn)
+        if start >= LATEST_VERSION:
+            return start, start
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+
+        version = start
+        for step_version, name, step in MIGRATIONS:
+            if step_version <= version:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                version = current_version(conn)
+                if step_version <= version:
+                    conn.rollback()  # Another worker applied it while we waited for the lock
+                    continue
+                step(conn)
+                conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (step_version, name))
+                conn.commit()
+                version = step_version
+                logger.info(f"Applied schema migration {step_version}: {name}")
+            except Exception:
+                conn.rollback()
+                raise
+        return start, version
@@ -0,0 +1,132 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+class VerifierBusyError(Exception):
+    """Raised when the bcrypt queue is full and a login must be turned away"""
+
+class PasswordVerifier:
+    """
+    Runs bcrypt checks on a small dedicated thread pool so a burst of logins
+    cannot monopolise the CPU that streaming responses need. Admission is bounded:
+    once max_workers checks are running and max_queue are waiting, verify() raises
+    VerifierBusyError immediately instead of queueing more work.
+
+    Recent failed checks are remembered for a short time, keyed by an HMAC of
+    (cache_key, candidate password, stored hash), so repeating the same bad guess
+    does not cost another bcrypt round. Including the stored hash means a password
+    change invalidates the cached failures automatically.
+    """
+
+    def __init__(self, max_workers=2, max_queue=16, timeout=10.0,
+                 negative_cache_ttl=30, negative_cache_size=1024):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout  # Seconds a request thread waits for its check
+        self.negative_cache_ttl = negative_cache_ttl
+        self.negative_cache_size = negative_cache_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._negative_cache = OrderedDict()  # digest -> expires_at
+        self._cache_lock = threading.Lock()
+        self._cache_secret = os.urandom(32)  # Per-process key; digests never leave memory
+        self.stats = {'checks': 0, 'rejected_busy': 0, 'negative_cache_hits': 0}
+
+        logger.info("PasswordVerifier initialized with %d workers, queue bound %d", max_workers, max_queue)
+
+    def _digest(self, cache_key, plain_password: str, hashed_password: str) -> bytes:
+        message = '\x00'.join([repr(cache_key), plain_password, hashed_password]).encode('utf-8')
+        return hmac.new(self._cache_secret, message, hashlib.sha256).digest()
+
+    def _is_known_failure(self, digest: bytes) -> bool:
+        with self._cache_lock:
+            expires_at = self._negative_cache.get(digest)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._negative_cache[digest]
+                return False
+            return True
+
+    def _remember_failure(self, digest: bytes):
+        with self._cache_lock:
+            self._negative_cache[digest] = time.monotonic() + self.negative_cache_ttl
+            self._negative_cache.move_to_end(digest)
+            while len(self._negative_cache) > self.negative_cache_size:
+                self._negative_cache.popitem(last=False)
+
+    @staticmethod
+    def _checkpw(plain_password: str, hashed_password: str) -> bool:
+        try:
+            return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        except ValueError:
+            # Malformed stored hash
+            return False
+
+    def _run(self, fn, *args):
+        """Run one bcrypt call on the pool, waiting up to timeout; raises VerifierBusyError when saturated"""
+        if not self._slots.acquire(blocking=False):
+            with self._cache_lock:
+                self.stats['rejected_busy'] += 1
+            raise VerifierBusyError('Password verification queue is full')
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        with self._cache_lock:
+            self.stats['checks'] += 1
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise VerifierBusyError('Password verification timed out')
+
+    def hash(self, plain_password: str) -> str:
+        """
+        bcrypt-hash a new password on the worker pool, with the same admission
+        bound as verify(). Raises VerifierBusyError if the pool and its queue are full.
+        """
+        return self._run(lambda: bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8'))
+
+    def verify(self, plain_password: str, hashed_password: str, cache_key=None) -> bool:
+        """
+        Verify a password against its bcrypt hash on the worker pool.
+        Raises VerifierBusyError if the pool and its queue are full.
+        """
+        digest = None
+        if cache_key is not None and self.negative_cache_ttl > 0:
+            digest = self._digest(cache_key, plain_password, hashed_password)
+            if self._is_known_failure(digest):
+                with self._cache_lock:
+                    self.stats['negative_cache_hits'] += 1
+                return False
+
+        ok = self._run(self._checkpw, plain_password, hashed_password)
+        if not ok and digest is not None:
+            self._remember_failure(digest)
+        return ok
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_status(self) -> dict:
+        """Get verifier counters"""
+        with self._cache_lock:
+            status = dict(self.stats)
+            status['negative_cache_entries'] = len(self._negative_cache)
+        status['max_workers'] = self.max_workers
+        status['max_queue'] = self.max_queue
+        return status
@@ -0,0 +1,111 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+class ParsedPlaylist:
+    """
+    One version of an .m3u8 file split into literal text and segment names, so a
+    per-viewer copy with rewritten segment URLs can be rendered with a single join.
+    Recently rendered variants are memoised because the same viewer polls the
+    same version several times before FFmpeg writes the next one.
+    """
+
+    def __init__(self, content: str, version, max_variants=32):
+        self.version = version  # (st_mtime_ns, st_size) of the file this was parsed from
+        self.max_variants = max_variants
+        self.parts: List[str] = []  # Literal text at even indexes, segment names at odd indexes
+        self._variants = OrderedDict()  # (url_prefix, token) -> rendered playlist
+        self._lock = threading.Lock()
+
+        text = []
+        for line in content.split('\n'):
+            if line.strip().endswith('.ts'):
+                self.parts.append('\n'.join(text + ['']))
+                self.parts.append(line.strip())
+                text = ['']
+            else:
+                text.append(line)
+        self.parts.append('\n'.join(text))
+
+    @property
+    def segments(self) -> List[str]:
+        return self.parts[1::2]
+
+    def render(self, url_prefix: str, token: Optional[str]) -> str:
+        """
+        Playlist text with each segment replaced by url_prefix + segment (+ ?token=...).
+        """
+        key = (url_prefix, token)
+        with self._lock:
+            rendered = self._variants.get(key)
+            if rendered is not None:
+                self._variants.move_to_end(key)
+                return rendered
+
+        suffix = f"?token={token}" if token else ''
+        pieces = list(self.parts)
+        for i in range(1, len(pieces), 2):
+            pieces[i] = f"{url_prefix}{pieces[i]}{suffix}"
+        rendered = ''.join(pieces)
+
+        with self._lock:
+            self._variants[key] = rendered
+            while len(self._variants) > self.max_variants:
+                self._variants.popitem(last=False)
+        return rendered
+
+class PlaylistCache:
+    """
+    Parsed HLS playlists keyed by path and validated against the file's mtime and
+    size, so N viewers polling a live playlist cost one read and parse per
+    playlist update instead of one per request.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # path -> ParsedPlaylist
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, path: str) -> ParsedPlaylist:
+        """
+        Return the parsed playlist at path, re-reading it only if it changed on disk.
+        Raises OSError if the file cannot be read.
+        """
+        with open(path, 'r') as f:
+            st = os.fstat(f.fileno())
+            version = (st.st_mtime_ns, st.st_size)
+            with self._lock:
+                playlist = self._entries.get(path)
+                if playlist is not None and playlist.version == version:
+                    self._entries.move_to_end(path)
+                    self.stats['hits'] += 1
+                    return playlist
+                self.stats['misses'] += 1
+            content = f.read()
+
+        playlist = ParsedPlaylist(content, version)
+        with self._lock:
+            self._entries[path] = playlist
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return playlist
+
+    def invalidate(self, prefix: str):
+        """Forget cached playlists under a path prefix (e.g. a deleted event directory)"""
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                del self._entries[path]
+
+    def get_status(self) -> dict:
+        """Get cache counters"""
+        with self._lock:
+            status = dict(self.stats)
+            status['entries'] = len(self._entries)
+        status['max_entries'] = self.max_entries
+        return status
@@ -0,0 +1,281 @@
+import threading
+import time
+import queue
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+def _to_db_timestamp(epoch: float) -> str:
+    """Format an epoch time the way SQLite's CURRENT_TIMESTAMP does (UTC)"""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _from_db_timestamp(value) -> float:
+    """Parse a UTC timestamp stored in SQLite back into an epoch time"""
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.fromisoformat(str(value))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+class LoginRateLimiter:
+    """
+    In-memory sliding-window login limiter keyed by client IP.
+    Failed attempts and active blocks live in memory so the login path never
+    touches SQLite; every attempt and block is still written to login_attempts /
+    blocked_ips by a background writer for the admin audit views, and those tables
+    are read back at startup so blocks survive restarts.
+
+    With shared=True (several worker processes on one database) the tables are the
+    source of truth instead: writes happen immediately and counts and blocks are
+    read back from SQLite, so all workers enforce the same limit.
+    """
+
+    def __init__(self, connection_factory, max_attempts=4, window_seconds=3600,
+                 block_seconds=3600, flush_interval=1.0, shared=False):
+        self.connection_factory = connection_factory  # Returns a context manager yielding a DB connection
+        self.shared = shared
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self.block_seconds = block_seconds
+        self.flush_interval = flush_interval
+        self.failures: Dict[str, deque] = {}  # ip -> timestamps of recent failed attempts
+        self.blocks: Dict[str, float] = {}  # ip -> blocked_until (epoch seconds)
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()  # ('attempt' | 'block' | 'unblock', row)
+        self.running = True
+
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+        logger.info("LoginRateLimiter initialized: %d attempts per %d seconds", max_attempts, window_seconds)
+
+    def _recent_failures(self, ip_address: str, now: float) -> int:
+        """Count failures inside the window (caller must hold the lock)"""
+        attempts = self.failures.get(ip_address)
+        if not attempts:
+            return 0
+        cutoff = now - self.window_seconds
+        while attempts and attempts[0] <= cutoff:
+            attempts.popleft()
+        if not attempts:
+            del self.failures[ip_address]
+            return 0
+        return len(attempts)
+
+    def _enqueue(self, kind: str, row: tuple):
+        """Queue a write for the background writer, or write it now in shared mode"""
+        if not self.shared:
+            self._pending.put((kind, row))
+            return
+        try:
+            self._write_batch([(kind, row)])
+        except Exception as e:
+            logger.error(f"Error persisting rate limit record: {e}")
+
+    def _load_block(self, ip_address: str):
+        """Read an IP's active block from the shared table into memory (shared mode)"""
+        try:
+            with self.connection_factory() as conn:
+                row = conn.execute('''
+                    SELECT blocked_until FROM blocked_ips
+                    WHERE ip_address = ? AND blocked_until > CURRENT_TIMESTAMP
+                ''', (ip_address,)).fetchone()
+        except Exception as e:
+            logger.error(f"Error checking shared block for {ip_address}: {e}")
+            return
+        with self._lock:
+            if row:
+                self.blocks[ip_address] = _from_db_timestamp(row['blocked_until'])
+            else:
+                self.blocks.pop(ip_address, None)
+
+    def _shared_failed_count(self, ip_address: str) -> int:
+        """Count in-window failures recorded by every worker (shared mode)"""
+        try:
+            with self.connection_factory() as conn:
+                row = conn.execute('''
+                    SELECT COUNT(*) AS failures FROM login_attempts
+                    WHERE ip_address = ? AND success = FALSE AND NOT cleared
+                    AND attempt_time > datetime('now', ?)
+                ''', (ip_address, f'-{int(self.window_seconds)} seconds')).fetchone()
+            return row['failures']
+        except Exception as e:
+            logger.error(f"Error counting shared login failures for {ip_address}: {e}")
+            with self._lock:
+                return self._recent_failures(ip_address, time.time())
+
+    def is_blocked(self, ip_address: str) -> bool:
+        """Check whether an IP is currently blocked"""
+        if self.shared:
+            self._load_block(ip_address)
+        with self._lock:
+            blocked_until = self.blocks.get(ip_address)
+            if blocked_until is None:
+                return False
+            if blocked_until <= time.time():
+                del self.blocks[ip_address]
+                return False
+            return True
+
+    def failed_count(self, ip_address: str) -> int:
+        """Number of failed attempts from an IP within the sliding window"""
+        if self.shared:
+            return self._shared_failed_count(ip_address)
+        with self._lock:
+            return self._recent_failures(ip_address, time.time())
+
+    def record_attempt(self, ip_address: str, username, success: bool, user_agent=None) -> int:
+        """
+        Record a login attempt and queue it for the audit table.
+        Returns the number of failed attempts in the window after this one.
+        """
+        now = time.time()
+        with self._lock:
+            if not success:
+                attempts = self.failures.get(ip_address)
+                if attempts is None:
+                    # Only the newest max_attempts failures matter for the limit
+                    attempts = self.failures[ip_address] = deque(maxlen=self.max_attempts)
+                attempts.append(now)
+            count = self._recent_failures(ip_address, now)
+        self._enqueue('attempt', (ip_address, username, success, _to_db_timestamp(now), user_agent))
+        if self.shared:
+            count = self._shared_failed_count(ip_address)
+        return count
+
+    def block(self, ip_address: str, failed_attempts: int):
+        """Block an IP for the configured duration"""
+        now = time.time()
+        blocked_until = now + self.block_seconds
+        with self._lock:
+            self.blocks[ip_address] = blocked_until
+        self._enqueue('block', (ip_address, _to_db_timestamp(now), _to_db_timestamp(blocked_until),
+                                failed_attempts, f'Too many failed login attempts ({failed_attempts})'))
+        logger.warning(f"Blocked IP {ip_address} for {self.block_seconds // 3600} hours after {failed_attempts} failed attempts")
+
+    def unblock(self, ip_address: str) -> bool:
+        """
+        Lift a block and forget the IP's failure history. Its failed audit rows are
+        marked cleared so other workers and restarts stop counting them too.
+        Returns True if it was blocked.
+        """
+        with self._lock:
+            was_blocked = self.blocks.pop(ip_address, None) is not None
+            self.failures.pop(ip_address, None)
+        self._enqueue('unblock', (ip_address,))
+        return was_blocked
+
+    def prune(self):
+        """Drop expired blocks and IPs with no failures left in the window"""
+        now = time.time()
+        with self._lock:
+            for ip_address in [ip for ip, until in self.blocks.items() if until <= now]:
+                del self.blocks[ip_address]
+            for ip_address in list(self.failures.keys()):
+                self._recent_failures(ip_address, now)
+
+    def load_from_database(self):
+        """Rehydrate active blocks and in-window failures from the audit tables"""
+        now = time.time()
+        try:
+            with self.connection_factory() as conn:
+                blocks = conn.execute('''
+                    SELECT ip_address, blocked_until FROM blocked_ips
+                    WHERE blocked_until > CURRENT_TIMESTAMP
+                ''').fetchall()
+                failures = conn.execute('''
+                    SELECT ip_address, attempt_time FROM login_attempts
+                    WHERE success = FALSE AND NOT cleared
+                    AND attempt_time > datetime('now', ?)
+                    ORDER BY attempt_time ASC
+                ''', (f'-{int(self.window_seconds)} seconds',)).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading rate limit state: {e}")
+            return
+
+        with self._lock:
+            for row in blocks:
+                try:
+                    blocked_until = _from_db_timestamp(row['blocked_until'])
+                except (TypeError, ValueError):
+                    continue
+                if blocked_until > now:
+                    self.blocks[row['ip_address']] = blocked_until
+            for row in failures:
+                try:
+                    attempt_time = _from_db_timestamp(row['attempt_time'])
+                except (TypeError, ValueError):
+                    continue
+                attempts = self.failures.setdefault(row['ip_address'], deque(maxlen=self.max_attempts))
+                attempts.append(attempt_time)
+
+        logger.info(f"Rate limiter restored {len(self.blocks)} blocked IPs and failures for {len(self.failures)} IPs")
+
+    def _write_batch(self, batch):
+        """Persist a batch of queued operations in one transaction"""
+        with self.connection_factory() as conn:
+            for kind, row in batch:
+                if kind == 'attempt':
+                    conn.execute('''
+                        INSERT INTO login_attempts (ip_address, username, success, attempt_time, user_agent)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', row)
+                elif kind == 'block':
+                    conn.execute('''
+                        INSERT OR REPLACE INTO blocked_ips
+                        (ip_address, blocked_at, blocked_until, failed_attempts, reason)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', row)
+                elif kind == 'unblock':
+                    conn.execute('DELETE FROM blocked_ips WHERE ip_address = ?', row)
+                    conn.execute('''
+                        UPDATE login_attempts SET cleared = 1
+                        WHERE ip_address = ? AND success = FALSE AND NOT cleared
+                    ''', row)
+            conn.commit()
+
+    def flush(self, batch=None):
+        """Write everything queued so far (after any already-dequeued items in batch)"""
+        batch = list(batch or [])
+        while True:
+            try:
+                batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            logger.error(f"Error persisting {len(batch)} rate limit records: {e}")
+
+    def _writer_loop(self):
+        """Background writer: wait for work, then flush it in batches"""
+        while self.running:
+            try:
+                item = self._pending.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give a burst a moment to accumulate so it lands in one transaction
+            time.sleep(self.flush_interval)
+            self.flush([item])
+
+    def shutdown(self):
+        """Stop the writer and persist anything still queued"""
+        self.running = False
+        self.writer_thread.join(timeout=5)
+        self.flush()
+
+    def get_status(self) -> dict:
+        """Get limiter counters"""
+        with self._lock:
+            return {
+                'tracked_ips': len(self.failures),
+                'blocked_ips': len(self.blocks),
+                'pending_writes': self._pending.qsize()
+            }
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Production entry point: binds the listening socket once and runs WORKERS
+preforked worker processes that accept on it. Each worker imports app.py after
+the fork, so its background threads are its own; one worker is elected leader
+(see leader.py) and runs the shared background work and go2rtc upstreams,
+while the others pull live video from the leader's localhost relay.
+"""
+import os
+import signal
+import socket
+import sys
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('serve')
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', '5003'))
+WORKERS = int(os.getenv('WORKERS', str(min(os.cpu_count() or 1, 4))))
+RESTART_DELAY = 1.0  # Seconds to wait before replacing a worker that exited
+
+def run_worker(sock):
+    """Serve requests on the inherited socket until told to stop (runs in the child)"""
+    # SystemExit unwinds to spawn(), which runs app.cleanup() before the worker exits
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import app as backend
+    if backend.ASYNC_STREAMING:
+        from async_server import run_async_server
+        run_async_server(backend, wsgi_workers=backend.ASYNC_WSGI_WORKERS, sock=sock)
+    else:
+        from werkzeug.serving import make_server
+        server = make_server(HOST, PORT, backend.app, threaded=True, fd=sock.fileno())
+        logger.info(f"Worker {os.getpid()} serving on {HOST}:{PORT}")
+        server.serve_forever()
+
+def spawn(sock):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 0
+        except Exception:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            code = 1
+        finally:
+            # os._exit skips atexit, so run the app's shutdown work (write-behind flushes,
+            # FFmpeg jobs, DB pool) here; _exit still keeps the parent's state untouched
+            backend = sys.modules.get('app')
+            if backend is not None:
+                try:
+                    backend.cleanup()
+                except Exception:
+                    logger.exception(f"Worker {os.getpid()} cleanup failed")
+            os._exit(code)
+    return pid
+
+def main():
+    # Workers learn how many siblings share the database and the stream relay
+    os.environ['APP_WORKERS'] = str(WORKERS)
+
+    sock = socket.create_server((HOST, PORT), backlog=128)
+    sock.set_inheritable(True)
+    logger.info(f"Listening on {HOST}:{PORT} with {WORKERS} workers")
+
+    workers = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(WORKERS):
+        workers.add(spawn(sock))
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}; restarting")
+            time.sleep(RESTART_DELAY)
+            workers.add(spawn(sock))
+
+    sock.close()
+    logger.info("All workers stopped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import hashlib
+import io
+import json
+import uuid
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Resized variants clients may ask for; anything else is rejected so the cache stays bounded
+VARIANT_WIDTHS = (160, 320, 480, 640, 960, 1280)
+VARIANT_HEIGHTS = (90, 180, 240, 360, 480, 720)
+VARIANT_QUALITIES = (40, 50, 60, 70, 80, 90)
+VARIANT_FORMATS = {'jpeg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp')}
+DEFAULT_VARIANT_QUALITY = 70
+MAX_VARIANTS_PER_SNAPSHOT = 16
+
+def parse_variant_args(args) -> Optional[Tuple[Optional[int], Optional[int], int, str]]:
+    """
+    Read w/h/q/format from request args. Returns None for the original image, or
+    (width, height, quality, format). Raises ValueError for values outside the whitelist.
+    """
+    width, height, quality = args.get('w'), args.get('h'), args.get('q')
+    fmt = args.get('format')
+    if width is None and height is None and quality is None and fmt is None:
+        return None
+    try:
+        width = int(width) if width is not None else None
+        height = int(height) if height is not None else None
+        quality = int(quality) if quality is not None else DEFAULT_VARIANT_QUALITY
+    except ValueError:
+        raise ValueError('w, h and q must be integers')
+    if width is not None and width not in VARIANT_WIDTHS:
+        raise ValueError(f"w must be one of {', '.join(map(str, VARIANT_WIDTHS))}")
+    if height is not None and height not in VARIANT_HEIGHTS:
+        raise ValueError(f"h must be one of {', '.join(map(str, VARIANT_HEIGHTS))}")
+    if quality not in VARIANT_QUALITIES:
+        raise ValueError(f"q must be one of {', '.join(map(str, VARIANT_QUALITIES))}")
+    fmt = (fmt or 'jpeg').lower()
+    if fmt not in VARIANT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(VARIANT_FORMATS)}")
+    return width, height, quality, fmt
+
+class Snapshot:
+    """One fetched camera image with a strong ETag derived from its bytes"""
+
+    def __init__(self, camera_id: str, data: bytes, content_type: str):
+        self.camera_id = camera_id
+        self.data = data
+        self.content_type = content_type
+        self.etag = hashlib.sha1(data).hexdigest()  # Unquoted; identical images share an ETag
+        self.fetched_at = time.monotonic()
+        self.variants: Dict[tuple, 'Snapshot'] = {}  # (width, height, quality, format) -> resized copy
+        self._variant_lock = threading.Lock()
+
+    def variant(self, width: Optional[int], height: Optional[int], quality: int, fmt: str) -> 'Snapshot':
+        """
+        This image scaled down to fit width x height (aspect ratio kept, never
+        enlarged) and re-encoded. Each variant is encoded once per snapshot version.
+        """
+        key = (width, height, quality, fmt)
+        with self._variant_lock:
+            variant = self.variants.get(key)
+            if variant is None:
+                variant = self._render(width, height, quality, fmt)
+                self.variants[key] = variant
+                while len(self.variants) > MAX_VARIANTS_PER_SNAPSHOT:
+                    self.variants.pop(next(iter(self.variants)))
+        return variant
+
+    def _render(self, width, height, quality, fmt) -> 'Snapshot':
+        from PIL import Image  # Only needed once a client asks for a resized variant
+
+        image_format, content_type = VARIANT_FORMATS[fmt]
+        image = Image.open(io.BytesIO(self.data))
+        # thumbnail() lets the JPEG decoder downscale while decoding, so big frames stay cheap
+        image.thumbnail((width or image.width, height or image.height), Image.BILINEAR)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        if image_format == 'WEBP':
+            image.save(output, image_format, quality=quality, method=3)
+        else:
+            image.save(output, image_format, quality=quality)
+        variant = Snapshot(self.camera_id, output.getvalue(), content_type)
+        variant.fetched_at = self.fetched_at
+        return variant
+
+class _Flight:
+    """An upstream fetch in progress that other requests for the same camera wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot: Optional[Snapshot] = None
+        self.error: Optional[Exception] = None
+
+class SnapshotCache:
+    """
+    Latest snapshot per camera, reused for freshness seconds. Requests arriving
+    while a camera's snapshot is being fetched wait for that fetch instead of
+    starting their own, so any number of clients cost at most one upstream
+    request per camera per freshness window. If a refresh fails, a snapshot up
+    to max_stale seconds old is served instead of an error.
+
+    fetch(camera_id) returns (image bytes, content type) and raises on failure.
+    """
+
+    def __init__(self, fetch: Callable[[str], Tuple[bytes, str]], freshness=1.0, max_stale=10.0,
+                 max_entries=64, wait_timeout=15.0):
+        self.fetch = fetch
+        self.freshness = freshness
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout  # Upper bound for followers; the fetch has its own timeout
+        self._entries = OrderedDict()  # camera_id -> Snapshot
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'fetches': 0, 'coalesced': 0, 'errors': 0, 'stale_served': 0}
+
+    def _store(self, snapshot: Snapshot):
+        """Insert a snapshot and evict the least recently used ones (caller must hold the lock)"""
+        previous = self._entries.get(snapshot.camera_id)
+        if previous is not None and previous.etag == snapshot.etag:
+            # Unchanged image: keep the variants already encoded for it
+            snapshot.variants = previous.variants
+            snapshot._variant_lock = previous._variant_lock
+        self._entries[snapshot.camera_id] = snapshot
+        self._entries.move_to_end(snapshot.camera_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, camera_id: str) -> Snapshot:
+        """
+        Current snapshot for a camera, fetching it if the cached one is older than
+        the freshness window. Raises the fetch error if no usable snapshot exists.
+        """
+        with self._lock:
+            snapshot = self._entries.get(camera_id)
+            if snapshot is not None and time.monotonic() - snapshot.fetched_at < self.freshness:
+                self._entries.move_to_end(camera_id)
+                self.stats['hits'] += 1
+                return snapshot
+            flight = self._flights.get(camera_id)
+            leader = flight is None
+            if leader:
+                flight = self._flights[camera_id] = _Flight()
+                self.stats['fetches'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                raise TimeoutError(f"Timed out waiting for snapshot of {camera_id}")
+            if flight.snapshot is not None:
+                return flight.snapshot
+            raise flight.error
+
+        try:
+            data, content_type = self.fetch(camera_id)
+            flight.snapshot = Snapshot(camera_id, data, content_type)
+            with self._lock:
+                self._store(flight.snapshot)
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self.stats['errors'] += 1
+                snapshot = self._entries.get(camera_id)
+                if snapshot is not None and time.monotonic() - snapshot.fetched_at < self.max_stale:
+                    self.stats['stale_served'] += 1
+                    flight.snapshot = snapshot
+            logger.warning(f"Snapshot fetch failed for {camera_id}: {e}")
+        finally:
+            with self._lock:
+                self._flights.pop(camera_id, None)
+            flight.done.set()
+
+        if flight.snapshot is not None:
+            return flight.snapshot
+        raise flight.error
+
+    def get_status(self) -> dict:
+        """Get cache counters"""
+        with self._lock:
+            status = dict(self.stats)
+            status['entries'] = len(self._entries)
+            status['in_flight'] = len(self._flights)
+        status['freshness_seconds'] = self.freshness
+        return status
+
+# Field name of the batch's JSON errors part; '.' never appears in Frigate camera names
+BATCH_ERRORS_FIELD = '.errors'
+
+def _form_field_name(value: str) -> str:
+    """Escape a name for a Content-Disposition parameter the way browsers encode form field names"""
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+def encode_snapshot_batch(snapshots: Dict[str, Snapshot], errors: Dict[str, str]) -> Tuple[bytes, str]:
+    """
+    Pack several snapshots into one multipart/form-data body: one file part per
+    camera (field name = camera ID) plus a BATCH_ERRORS_FIELD JSON part for
+    cameras that failed. Browsers can read it directly with Response.formData().
+    Returns (body, content type).
+    """
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for camera_id, snapshot in snapshots.items():
+        extension = 'webp' if snapshot.content_type == 'image/webp' else 'jpg'
+        name = _form_field_name(camera_id)
+        chunks.append((
+            f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{name}\"; filename=\"{name}.{extension}\"\r\n"
+            f"Content-Type: {snapshot.content_type}\r\n"
+            f"ETag: \"{snapshot.etag}\"\r\n\r\n"
+        ).encode())
+        chunks.append(snapshot.data)
+        chunks.append(b"\r\n")
+    chunks.append((
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"{BATCH_ERRORS_FIELD}\"\r\n"
+        f"Content-Type: application/json\r\n\r\n"
+        f"{json.dumps(errors)}\r\n"
+        f"--{boundary}--\r\n"
+    ).encode())
+    return b''.join(chunks), f"multipart/form-data; boundary={boundary}"
@@ -0,0 +1,124 @@
+import sys
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _TimedLoader:
+    """Loader proxy that records how long a module body takes to execute"""
+
+    def __init__(self, loader, profiler: 'StartupProfiler'):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler.record_import(module.__name__, time.perf_counter() - started)
+
+class _TimingFinder(MetaPathFinder):
+    """Meta path hook that wraps every newly found module's loader in a _TimedLoader"""
+
+    def __init__(self, profiler: 'StartupProfiler'):
+        self.profiler = profiler
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, 'busy', False):
+            return None  # Let the other finders answer our own lookup below
+        self._local.busy = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.busy = False
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self.profiler)
+        return spec
+
+class StartupProfiler:
+    """
+    Records how long start-up takes: named init steps always (they are cheap to
+    time), and the execution time of every imported module once install() has
+    hooked the import system. Import times are cumulative, so a module's time
+    includes the modules it imports for the first time.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.imports: Dict[str, float] = {}
+        self.steps: List[Tuple[str, float]] = []
+        self._finder = None
+        self._lock = threading.Lock()
+
+    def install(self):
+        """Start timing imports (only modules imported from now on are measured)"""
+        if self._finder is None:
+            self._finder = _TimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder is not None:
+            sys.meta_path.remove(self._finder)
+            self._finder = None
+
+    def record_import(self, name: str, seconds: float):
+        with self._lock:
+            self.imports[name] = seconds
+
+    @contextmanager
+    def step(self, name: str):
+        """Time an init step: `with startup_profiler.step('database setup'):`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.steps.append((name, time.perf_counter() - started))
+
+    def finish(self):
+        """Mark start-up complete and stop timing imports"""
+        self.finished = time.perf_counter()
+        self.uninstall()
+
+    def report(self, top=25) -> dict:
+        """Slowest imports and every init step, in milliseconds"""
+        with self._lock:
+            imports = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:top]
+            steps = list(self.steps)
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return {
+            'total_ms': round((end - self.started) * 1000, 1),
+            'imports_ms': [[name, round(seconds * 1000, 1)] for name, seconds in imports],
+            'steps_ms': [[name, round(seconds * 1000, 1)] for name, seconds in steps]
+        }
+
+    def log_report(self, top=25):
+        report = self.report(top)
+        logger.info(f"Startup took {report['total_ms']} ms")
+        for name, ms in report['steps_ms']:
+            logger.info(f"  step   {ms:8.1f} ms  {name}")
+        for name, ms in report['imports_ms']:
+            logger.info(f"  import {ms:8.1f} ms  {name}")
+
+# Global profiler for the backend process, created on first import of this module
+startup_profiler = StartupProfiler()
@@ -1,211 +1,461 @@
+import asyncio
 import threading
 import time
-import requests
+import aiohttp
 import logging
-from typing import Dict, Set
-from datetime import datetime, timedelta
+from collections import deque
+from typing import Dict
+from urllib.parse import quote
+
+from fmp4 import FMP4Parser
 
 logger = logging.getLogger(__name__)
 
+# FORCE desktop User-Agent to prevent go2rtc mobile redirects
+UPSTREAM_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'video/mp4'
+}
+
 class StreamBuffer:
     """
     Maintains persistent connections to go2rtc streams to keep transcoding alive.
     This ensures HLS streams remain available for frontend consumption through
     Cloudflare tunnels where WebRTC is not supported.
+
+    All consumers are multiplexed on a single asyncio event loop running in one
+    background thread; the public methods are thread-safe and may be called from
+    any request thread.
+
+    Each consumer also keeps the stream's fMP4 init segment and a ring buffer of
+    its most recent GOPs (bounded per stream by bytes and seconds, and globally by
+    bytes), so new viewers can be attached as listeners and start instantly at the
+    latest keyframe instead of waiting for go2rtc to open a new session.
     """
-    
-    def __init__(self, go2rtc_host="http://172.18.0.1:1984", buffer_duration=30):
+
+    def __init__(self, go2rtc_host="http://172.18.0.1:1984", buffer_duration=30,
+                 read_chunk_size=256 * 1024, max_backoff=60,
+                 max_stream_bytes=8 * 1024 * 1024, max_stream_seconds=10,
+                 max_total_bytes=64 * 1024 * 1024):
         self.go2rtc_host = go2rtc_host
         self.buffer_duration = buffer_duration  # Keep streams alive for 30 seconds after last request
-        self.active_streams: Dict[str, dict] = {}  # stream_name -> {last_access, consumer_thread, stop_event}
-        self.cleanup_interval = 10  # Check for stale streams every 10 seconds
+        self.read_chunk_size = read_chunk_size  # Large reads keep per-chunk overhead low
+        self.max_backoff = max_backoff  # Upper bound for reconnect delay (seconds)
+        self.max_stream_bytes = max_stream_bytes  # Ring buffer cap per stream
+        self.max_stream_seconds = max_stream_seconds  # Older GOPs are dropped once a newer keyframe exists
+        self.max_total_bytes = max_total_bytes  # Ring buffer cap across all streams
+        self.total_buffered_bytes = 0
+        self.active_streams: Dict[str, dict] = {}  # stream_name -> {last_access, started, task, ring, listeners, ...}
         self.running = True
-        
-        # Start cleanup thread
-        self.cleanup_thread = threading.Thread(target=self._cleanup_loop, daemon=True)
-        self.cleanup_thread.start()
-        
+        self._lock = threading.Lock()
+        self._session = None
+
+        # Start the event loop thread
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.loop_thread.start()
+
         logger.info("StreamBuffer initialized with %d second buffer duration", buffer_duration)
-    
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Shared client session for all consumers (must be called on the loop thread).
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30),
+                headers=UPSTREAM_HEADERS,
+                read_bufsize=self.read_chunk_size
+            )
+        return self._session
+
     def ensure_stream_active(self, stream_name: str) -> bool:
         """
         Ensure a stream is actively being consumed to keep go2rtc transcoding alive.
         Returns True if stream is active, False if failed to start.
         """
         try:
+            if not self.running:
+                return False
+
             # Update last access time
-            current_time = datetime.now()
-            
-            if stream_name in self.active_streams:
-                # Stream already active, just update access time
-                self.active_streams[stream_name]['last_access'] = current_time
-                logger.debug(f"Updated access time for active stream: {stream_name}")
-                return True
-            
-            # Start new consumer for this stream
+            current_time = time.monotonic()
+
+            with self._lock:
+                stream_info = self.active_streams.get(stream_name)
+                if stream_info is not None:
+                    # Stream already active, just update access time
+                    stream_info['last_access'] = current_time
+                    logger.debug(f"Updated access time for active stream: {stream_name}")
+                    return True
+
+                # Track the active stream
+                self.active_streams[stream_name] = {
+                    'last_access': current_time,
+                    'started': current_time,
+                    'task': None,
+                    'connected': False,
+                    'reconnects': 0,
+                    'bytes_consumed': 0,
+                    'init_segment': None,
+                    'ring': deque(),  # (received_at, fragment, is_keyframe), always starting at a keyframe
+                    'ring_bytes': 0,
+                    'ring_keyframes': 0,
+                    'listeners': set(),  # Started listeners receive live fragments
+                    'pending_listeners': set()  # Listeners waiting for the next session's init segment
+                }
+
+            # Start new consumer for this stream on the event loop
             logger.info(f"Starting new consumer for stream: {stream_name}")
-            
-            # Create stop event for this consumer
-            stop_event = threading.Event()
-            
-            # Start consumer thread
-            consumer_thread = threading.Thread(
-                target=self._consume_stream,
-                args=(stream_name, stop_event),
-                daemon=True
-            )
-            consumer_thread.start()
-            
-            # Track the active stream
-            self.active_streams[stream_name] = {
-                'last_access': current_time,
-                'consumer_thread': consumer_thread,
-                'stop_event': stop_event,
-                'started': current_time
-            }
-            
-            logger.info(f"Successfully started consumer for stream: {stream_name}")
+            self.loop.call_soon_threadsafe(self._start_consumer, stream_name)
             return True
-            
+
         except Exception as e:
             logger.error(f"Failed to ensure stream active for {stream_name}: {e}")
             return False
-    
-    def _consume_stream(self, stream_name: str, stop_event: threading.Event):
+
+    def _start_consumer(self, stream_name: str):
+        """
+        Create the consumer task and its expiry timer (runs on the loop thread).
+        """
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is None or stream_info['task'] is not None:
+                return
+            stream_info['task'] = self.loop.create_task(self._consume_stream(stream_name))
+        self.loop.call_later(self.buffer_duration, self._check_expiry, stream_name)
+
+    def _check_expiry(self, stream_name: str):
+        """
+        Stop a stream that has not been accessed within buffer_duration, otherwise
+        re-arm the timer for when it would next expire (runs on the loop thread).
+        """
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is None:
+                return
+            if stream_info['listeners'] or stream_info['pending_listeners']:
+                # Viewers attached through add_listener() keep the stream alive
+                stream_info['last_access'] = time.monotonic()
+            idle = time.monotonic() - stream_info['last_access']
+            if idle < self.buffer_duration:
+                self.loop.call_later(self.buffer_duration - idle, self._check_expiry, stream_name)
+                return
+            del self.active_streams[stream_name]
+            self._clear_ring(stream_info)
+            task = stream_info['task']
+
+        if task is not None:
+            task.cancel()
+        logger.info(f"Cleaned up stale stream: {stream_name}")
+
+    async def _consume_stream(self, stream_name: str):
         """
         Continuously consume a stream to keep go2rtc transcoding active.
-        Uses MSE endpoint which is more efficient than HLS for this purpose.
+        Reconnects with exponential backoff if the upstream drops. The URL is rebuilt
+        on each attempt so a change of go2rtc_host (e.g. a new leader) takes effect.
         """
-        mse_url = f"{self.go2rtc_host}/api/stream.mp4?src={stream_name}"
-        
+        backoff = 1
+
+        logger.info(f"Starting MSE consumer for {stream_name}")
         try:
-            logger.info(f"Starting MSE consumer for {stream_name}: {mse_url}")
-            
-            # Use streaming request to keep connection alive
-            session = requests.Session()
-            
-            while not stop_event.is_set() and self.running:
+            while self.running:
+                mse_url = f"{self.go2rtc_host}/api/stream.mp4?src={quote(stream_name)}"
                 try:
-                    with session.get(mse_url, stream=True, timeout=30) as response:
+                    async with self._get_session().get(mse_url) as response:
                         response.raise_for_status()
-                        
+                        self._set_connected(stream_name, True)
                         logger.debug(f"MSE consumer connected for {stream_name}")
-                        
-                        # Consume the stream in chunks to keep it alive
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if stop_event.is_set() or not self.running:
-                                break
-                            
-                            # We don't need to store the chunks, just consume them
-                            # This keeps go2rtc transcoding active
-                            pass
-                            
-                except requests.RequestException as e:
-                    if not stop_event.is_set() and self.running:
-                        logger.warning(f"MSE consumer error for {stream_name}: {e}")
-                        # Wait before retrying
-                        if not stop_event.wait(5):  # 5 second retry delay
-                            continue
+
+                        # Consume the stream to keep it alive, buffering the latest GOPs for new viewers
+                        parser = FMP4Parser()
+                        session_started = False
+                        async for chunk in response.content.iter_chunked(self.read_chunk_size):
+                            if not chunk:
+                                continue
+                            backoff = 1
+                            self._add_bytes(stream_name, len(chunk))
+                            fragments = parser.feed(chunk)
+                            if not fragments:
+                                continue
+                            if not session_started:
+                                self._begin_session(stream_name, parser.init_segment)
+                                session_started = True
+                            self._publish(stream_name, fragments)
+
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"MSE consumer error for {stream_name}: {e}")
+
+                self._set_connected(stream_name, False)
+                # A new go2rtc session restarts timestamps, so viewers of this one must reconnect
+                self._end_session(stream_name)
+                if not self.running:
                     break
-                    
-        except Exception as e:
-            logger.error(f"MSE consumer failed for {stream_name}: {e}")
+
+                # Wait before retrying
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                with self._lock:
+                    if stream_name in self.active_streams:
+                        self.active_streams[stream_name]['reconnects'] += 1
+
+        except asyncio.CancelledError:
+            pass
         finally:
             logger.info(f"MSE consumer stopped for {stream_name}")
-            session.close()
-    
-    def _cleanup_loop(self):
-        """
-        Periodically clean up stale streams that haven't been accessed recently.
-        """
-        while self.running:
-            try:
-                current_time = datetime.now()
-                stale_streams = []
-                
-                for stream_name, stream_info in self.active_streams.items():
-                    last_access = stream_info['last_access']
-                    time_since_access = current_time - last_access
-                    
-                    if time_since_access > timedelta(seconds=self.buffer_duration):
-                        stale_streams.append(stream_name)
-                
-                # Stop stale streams
-                for stream_name in stale_streams:
-                    self._stop_stream(stream_name)
-                
-                if stale_streams:
-                    logger.info(f"Cleaned up {len(stale_streams)} stale streams: {stale_streams}")
-                
-            except Exception as e:
-                logger.error(f"Error in cleanup loop: {e}")
-            
-            # Wait before next cleanup
-            time.sleep(self.cleanup_interval)
-    
-    def _stop_stream(self, stream_name: str):
-        """
-        Stop consuming a specific stream.
+
+    def _clear_ring(self, stream_info: dict):
         """
-        try:
-            if stream_name in self.active_streams:
-                stream_info = self.active_streams[stream_name]
-                
-                # Signal the consumer thread to stop
-                stream_info['stop_event'].set()
-                
-                # Wait for thread to finish (with timeout)
-                stream_info['consumer_thread'].join(timeout=5)
-                
-                # Remove from active streams
-                del self.active_streams[stream_name]
-                
-                logger.info(f"Stopped stream consumer: {stream_name}")
-                
-        except Exception as e:
-            logger.error(f"Error stopping stream {stream_name}: {e}")
-    
+        Drop all buffered fragments for a stream (caller must hold the lock).
+        """
+        self.total_buffered_bytes -= stream_info['ring_bytes']
+        stream_info['ring'].clear()
+        stream_info['ring_bytes'] = 0
+        stream_info['ring_keyframes'] = 0
+
+    def _drop_oldest_gop(self, stream_info: dict):
+        """
+        Drop the oldest GOP, or the whole ring if it only holds one (caller must hold the lock).
+        """
+        ring = stream_info['ring']
+        if stream_info['ring_keyframes'] <= 1:
+            self._clear_ring(stream_info)
+            return
+        _, fragment, _ = ring.popleft()
+        dropped = len(fragment)
+        while ring and not ring[0][2]:
+            dropped += len(ring.popleft()[1])
+        stream_info['ring_bytes'] -= dropped
+        stream_info['ring_keyframes'] -= 1
+        self.total_buffered_bytes -= dropped
+
+    def _trim_ring(self, stream_info: dict, now: float):
+        """
+        Enforce the per-stream byte and age limits (caller must hold the lock).
+        The newest GOP is kept regardless of age since it is the only start point.
+        """
+        ring = stream_info['ring']
+        while ring and stream_info['ring_bytes'] > self.max_stream_bytes:
+            self._drop_oldest_gop(stream_info)
+        while ring and stream_info['ring_keyframes'] > 1 and now - ring[0][0] > self.max_stream_seconds:
+            self._drop_oldest_gop(stream_info)
+
+    def _trim_global(self):
+        """
+        Enforce the global byte limit by trimming the largest rings first (caller must hold the lock).
+        """
+        while self.total_buffered_bytes > self.max_total_bytes:
+            largest = max(self.active_streams.values(), key=lambda info: info['ring_bytes'], default=None)
+            if largest is None or largest['ring_bytes'] == 0:
+                break
+            self._drop_oldest_gop(largest)
+
+    def _begin_session(self, stream_name: str, init_segment: bytes):
+        """
+        Record a new upstream session's init segment and start waiting listeners (runs on the loop thread).
+        """
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is None:
+                return
+            stream_info['init_segment'] = init_segment
+            self._clear_ring(stream_info)
+            for listener in stream_info['pending_listeners']:
+                listener.start(init_segment, [])
+            stream_info['listeners'].update(stream_info['pending_listeners'])
+            stream_info['pending_listeners'].clear()
+
+    def _publish(self, stream_name: str, fragments):
+        """
+        Append fragments to the ring buffer and hand them to listeners (runs on the loop thread).
+        """
+        now = time.monotonic()
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is None:
+                return
+            ring = stream_info['ring']
+            for fragment, keyframe in fragments:
+                for listener in stream_info['listeners']:
+                    listener.offer(fragment, keyframe)
+                # The ring always starts at a keyframe so it can be replayed to a new viewer
+                if not ring and not keyframe:
+                    continue
+                ring.append((now, fragment, keyframe))
+                stream_info['ring_bytes'] += len(fragment)
+                stream_info['ring_keyframes'] += 1 if keyframe else 0
+                self.total_buffered_bytes += len(fragment)
+            self._trim_ring(stream_info, now)
+            if self.total_buffered_bytes > self.max_total_bytes:
+                self._trim_global()
+
+    def _end_session(self, stream_name: str):
+        """
+        End the current upstream session: detach its listeners and drop its buffer.
+        """
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is None:
+                return
+            listeners = list(stream_info['listeners'])
+            stream_info['listeners'].clear()
+            stream_info['init_segment'] = None
+            self._clear_ring(stream_info)
+        for listener in listeners:
+            listener.end()
+
+    def add_listener(self, stream_name: str, listener) -> bool:
+        """
+        Attach a viewer to a stream's live output. The listener must provide
+        start(init_segment, fragments), offer(fragment, is_keyframe) and end().
+        If the stream already has an init segment the listener is started at once
+        with the buffered fragments from the latest keyframe onward; otherwise it
+        is started when the next upstream session delivers its init segment.
+        Returns False if the stream could not be activated.
+        """
+        if not self.ensure_stream_active(stream_name):
+            return False
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is None:
+                return False
+            if stream_info['init_segment'] is None:
+                stream_info['pending_listeners'].add(listener)
+                return True
+            ring = list(stream_info['ring'])
+            start = max((i for i, entry in enumerate(ring) if entry[2]), default=len(ring))
+            listener.start(stream_info['init_segment'], [fragment for _, fragment, _ in ring[start:]])
+            stream_info['listeners'].add(listener)
+            return True
+
+    def remove_listener(self, stream_name: str, listener):
+        """
+        Detach a viewer; the stream then expires normally once it stops being accessed.
+        """
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is None:
+                return
+            stream_info['listeners'].discard(listener)
+            stream_info['pending_listeners'].discard(listener)
+            stream_info['last_access'] = time.monotonic()
+
+    def _set_connected(self, stream_name: str, connected: bool):
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is not None:
+                stream_info['connected'] = connected
+
+    def _add_bytes(self, stream_name: str, count: int):
+        with self._lock:
+            stream_info = self.active_streams.get(stream_name)
+            if stream_info is not None:
+                stream_info['bytes_consumed'] += count
+
+    async def _shutdown(self):
+        """
+        Cancel all consumers and close the HTTP session (runs on the loop thread).
+        """
+        with self._lock:
+            tasks = [info['task'] for info in self.active_streams.values() if info['task'] is not None]
+            listeners = []
+            for info in self.active_streams.values():
+                listeners.extend(info['listeners'] | info['pending_listeners'])
+                self._clear_ring(info)
+            self.active_streams.clear()
+
+        for listener in listeners:
+            listener.end()
+
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
     def stop_all_streams(self):
         """
         Stop all active stream consumers.
         """
+        if not self.running:
+            return
         logger.info("Stopping all stream consumers...")
         self.running = False
-        
-        # Stop all active streams
-        stream_names = list(self.active_streams.keys())
-        for stream_name in stream_names:
-            self._stop_stream(stream_name)
-        
+
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+            future.result(timeout=5)
+        except Exception as e:
+            logger.error(f"Error stopping stream consumers: {e}")
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout=5)
+
         logger.info("All stream consumers stopped")
-    
+
     def get_status(self) -> dict:
         """
         Get status of all active streams.
         """
-        current_time = datetime.now()
+        current_time = time.monotonic()
+        with self._lock:
+            streams = {}
+            for name, info in self.active_streams.items():
+                ring = info['ring']
+                streams[name] = dict(info)
+                streams[name]['ring_fragments'] = len(ring)
+                streams[name]['ring_seconds'] = ring[-1][0] - ring[0][0] if ring else 0
+                streams[name]['listener_count'] = len(info['listeners']) + len(info['pending_listeners'])
+            total_buffered_bytes = self.total_buffered_bytes
+
         status = {
-            'active_streams': len(self.active_streams),
+            'active_streams': len(streams),
             'buffer_duration': self.buffer_duration,
+            'memory': {
+                'buffered_bytes': total_buffered_bytes,
+                'max_total_bytes': self.max_total_bytes,
+                'max_stream_bytes': self.max_stream_bytes,
+                'max_stream_seconds': self.max_stream_seconds
+            },
             'streams': {}
         }
-        
-        for stream_name, stream_info in self.active_streams.items():
-            last_access = stream_info['last_access']
-            started = stream_info['started']
-            time_since_access = current_time - last_access
-            uptime = current_time - started
-            
+
+        for stream_name, stream_info in streams.items():
+            task = stream_info['task']
             status['streams'][stream_name] = {
-                'last_access_seconds_ago': time_since_access.total_seconds(),
-                'uptime_seconds': uptime.total_seconds(),
-                'thread_alive': stream_info['consumer_thread'].is_alive()
+                'last_access_seconds_ago': current_time - stream_info['last_access'],
+                'uptime_seconds': current_time - stream_info['started'],
+                'consumer_alive': task is not None and not task.done(),
+                'connected': stream_info['connected'],
+                'reconnects': stream_info['reconnects'],
+                'bytes_consumed': stream_info['bytes_consumed'],
+                'init_cached': stream_info['init_segment'] is not None,
+                'buffered_bytes': stream_info['ring_bytes'],
+                'buffered_fragments': stream_info['ring_fragments'],
+                'buffered_keyframes': stream_info['ring_keyframes'],
+                'buffered_seconds': stream_info['ring_seconds'],
+                'listeners': stream_info['listener_count']
             }
-        
+
         return status
 
 # Global stream buffer instance
 stream_buffer = None
+stream_buffer_options = {}
+
+def configure_stream_buffer(**options):
+    """
+    Set the StreamBuffer constructor options used when the global instance is created.
+    """
+    stream_buffer_options.update(options)
 
 def get_stream_buffer() -> StreamBuffer:
     """
@@ -213,7 +463,7 @@ def get_stream_buffer() -> StreamBuffer:
     """
     global stream_buffer
     if stream_buffer is None:
-        stream_buffer = StreamBuffer()
+        stream_buffer = StreamBuffer(**stream_buffer_options)
     return stream_buffer
 
 def shutdown_stream_buffer():
@@ -223,4 +473,4 @@ def shutdown_stream_buffer():
     global stream_buffer
     if stream_buffer is not None:
         stream_buffer.stop_all_streams()
-        stream_buffer = None 
\ No newline at end of file
+        stream_buffer = None
@@ -0,0 +1,300 @@
+import asyncio
+import threading
+import time
+import queue
+import logging
+from collections import deque
+from typing import List, Optional
+
+from stream_buffer import StreamBuffer, get_stream_buffer
+
+logger = logging.getLogger(__name__)
+
+class _Subscriber:
+    """
+    One viewer's bounded fragment queue. A viewer that falls behind has its backlog
+    dropped and resumes at the next keyframe instead of stalling the stream consumer.
+    """
+
+    def __init__(self, max_queue: int):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.waiting_for_keyframe = True  # New viewers must start decoding on a keyframe
+        self.dropped = 0
+        self.joined = time.monotonic()
+        self.init_segment: Optional[bytes] = None
+        self.primed: List[bytes] = []  # Buffered GOP handed over when the viewer joined
+        self.ready = threading.Event()
+
+    def start(self, init_segment: bytes, fragments: List[bytes]):
+        """Called by StreamBuffer with the init segment and the buffered fragments from the latest keyframe"""
+        self.init_segment = init_segment
+        self.primed = fragments
+        if fragments:
+            # The primed fragments already start on a keyframe
+            self.waiting_for_keyframe = False
+        self.ready.set()
+
+    def offer(self, fragment: bytes, keyframe: bool):
+        if self.waiting_for_keyframe:
+            if not keyframe:
+                return
+            self.waiting_for_keyframe = False
+        try:
+            self.queue.put_nowait(fragment)
+        except queue.Full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+            if keyframe:
+                self.queue.put_nowait(fragment)
+            else:
+                self.waiting_for_keyframe = True
+
+    def end(self):
+        """Signal end of stream, making room for the sentinel if the queue is full"""
+        self.ready.set()
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+class _LoopQueue:
+    """
+    Bounded fragment queue filled from the StreamBuffer thread and drained by a
+    coroutine on another event loop. It has the put_nowait/get_nowait interface
+    _Subscriber expects; wakeups are coalesced so a burst of fragments costs one
+    cross-thread call rather than one per fragment.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.maxsize = maxsize
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._changed = asyncio.Event()
+        self._wake_pending = False
+
+    def put_nowait(self, item):
+        with self._lock:
+            if len(self._items) >= self.maxsize:
+                raise queue.Full
+            self._items.append(item)
+        self.notify()
+
+    def get_nowait(self):
+        with self._lock:
+            if not self._items:
+                raise queue.Empty
+            return self._items.popleft()
+
+    def notify(self):
+        """Wake the consuming coroutine (callable from any thread)"""
+        with self._lock:
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # Consumer loop already closed
+            pass
+
+    def _wake(self):
+        with self._lock:
+            self._wake_pending = False
+        self._changed.set()
+
+    async def wait_until(self, predicate, timeout: float) -> bool:
+        """Wait on the consumer loop until predicate() is true or timeout elapses"""
+        deadline = self.loop.time() + timeout
+        while not predicate():
+            self._changed.clear()
+            if predicate():
+                break
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return predicate()
+        return True
+
+    async def get(self, timeout: float):
+        """Next item, raising queue.Empty if none arrives within timeout"""
+        with self._lock:
+            has_items = bool(self._items)
+        if not has_items and not await self.wait_until(lambda: bool(self._items), timeout):
+            raise queue.Empty
+        return self.get_nowait()
+
+class _AsyncSubscriber(_Subscriber):
+    """A _Subscriber whose queue is drained by a coroutine on the given event loop"""
+
+    def __init__(self, max_queue: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(max_queue)
+        self.queue = _LoopQueue(loop, max_queue)
+
+    def start(self, init_segment: bytes, fragments: List[bytes]):
+        super().start(init_segment, fragments)
+        self.queue.notify()
+
+class StreamSubscription:
+    """
+    A viewer's handle on a shared stream. iter_chunks() yields the init segment, the
+    buffered fragments from the latest keyframe, then live fragments, and detaches
+    the viewer when the generator is closed.
+    """
+
+    def __init__(self, fanout: 'StreamFanout', stream_name: str, subscriber: _Subscriber, idle_timeout: float):
+        self.fanout = fanout
+        self.stream_name = stream_name
+        self.subscriber = subscriber
+        self.idle_timeout = idle_timeout
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Wait until the init segment is available (False if the upstream ended or timed out)"""
+        self.subscriber.ready.wait(timeout)
+        return self.subscriber.init_segment is not None
+
+    def iter_chunks(self):
+        try:
+            yield self.subscriber.init_segment
+            primed, self.subscriber.primed = self.subscriber.primed, []
+            for fragment in primed:
+                yield fragment
+            while True:
+                try:
+                    fragment = self.subscriber.queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    logger.warning(f"No data from shared upstream {self.stream_name} for {self.idle_timeout}s")
+                    break
+                if fragment is None:
+                    break
+                yield fragment
+        finally:
+            self.close()
+
+    def close(self):
+        self.fanout.unsubscribe(self)
+
+class AsyncStreamSubscription(StreamSubscription):
+    """
+    StreamSubscription for asyncio servers: waiting and iteration happen on the
+    server's event loop, so a viewer holds no thread while it streams.
+    """
+
+    async def wait_ready_async(self, timeout: float) -> bool:
+        await self.subscriber.queue.wait_until(self.subscriber.ready.is_set, timeout)
+        return self.subscriber.init_segment is not None
+
+    async def iter_chunks_async(self):
+        try:
+            yield self.subscriber.init_segment
+            primed, self.subscriber.primed = self.subscriber.primed, []
+            for fragment in primed:
+                yield fragment
+            while True:
+                try:
+                    fragment = await self.subscriber.queue.get(self.idle_timeout)
+                except queue.Empty:
+                    logger.warning(f"No data from shared upstream {self.stream_name} for {self.idle_timeout}s")
+                    break
+                if fragment is None:
+                    break
+                yield fragment
+        finally:
+            self.close()
+
+class StreamFanout:
+    """
+    Attaches viewers to the StreamBuffer consumer for their stream so every viewer
+    of a camera shares one upstream go2rtc connection and starts from its buffered GOP.
+    """
+
+    def __init__(self, stream_buffer: StreamBuffer, client_queue_size=32, idle_timeout=30.0):
+        self.stream_buffer = stream_buffer
+        self.client_queue_size = client_queue_size
+        self.idle_timeout = idle_timeout
+        self.subscriptions = set()
+        self._lock = threading.Lock()
+
+        logger.info("StreamFanout initialized (client queue %d fragments)", client_queue_size)
+
+    def subscribe(self, stream_name: str) -> StreamSubscription:
+        """
+        Join the shared stream for stream_name, activating its consumer if needed.
+        """
+        subscriber = _Subscriber(self.client_queue_size)
+        subscription = StreamSubscription(self, stream_name, subscriber, self.idle_timeout)
+        return self._attach(subscription)
+
+    def subscribe_async(self, stream_name: str, loop: asyncio.AbstractEventLoop) -> AsyncStreamSubscription:
+        """
+        Like subscribe(), for a viewer served by a coroutine running on loop.
+        """
+        subscriber = _AsyncSubscriber(self.client_queue_size, loop)
+        subscription = AsyncStreamSubscription(self, stream_name, subscriber, self.idle_timeout)
+        return self._attach(subscription)
+
+    def _attach(self, subscription: StreamSubscription) -> StreamSubscription:
+        with self._lock:
+            self.subscriptions.add(subscription)
+        if not self.stream_buffer.add_listener(subscription.stream_name, subscription.subscriber):
+            subscription.subscriber.end()
+        return subscription
+
+    def unsubscribe(self, subscription: StreamSubscription):
+        with self._lock:
+            if subscription not in self.subscriptions:
+                return
+            self.subscriptions.discard(subscription)
+        self.stream_buffer.remove_listener(subscription.stream_name, subscription.subscriber)
+
+    def get_status(self) -> dict:
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+        streams = {}
+        for subscription in subscriptions:
+            info = streams.setdefault(subscription.stream_name, {'subscribers': 0, 'dropped_fragments': 0})
+            info['subscribers'] += 1
+            info['dropped_fragments'] += subscription.subscriber.dropped
+        return {
+            'subscribers': len(subscriptions),
+            'streams': streams
+        }
+
+    def shutdown(self):
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.subscriber.end()
+
+# Global stream fanout instance
+stream_fanout = None
+
+def get_stream_fanout() -> StreamFanout:
+    """
+    Get the global stream fanout instance, creating it if necessary.
+    """
+    global stream_fanout
+    if stream_fanout is None:
+        stream_fanout = StreamFanout(get_stream_buffer())
+    return stream_fanout
+
+def shutdown_stream_fanout():
+    """
+    Shutdown the global stream fanout instance.
+    """
+    global stream_fanout
+    if stream_fanout is not None:
+        stream_fanout.shutdown()
+        stream_fanout = None
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from aiohttp import web
+
+from stream_fanout import StreamFanout
+
+logger = logging.getLogger(__name__)
+
+class StreamRelay:
+    """
+    Serves the leader worker's shared streams to follower workers on localhost,
+    using the same /api/stream.mp4?src=<name> interface as go2rtc. Followers point
+    their StreamBuffer at the relay instead of go2rtc, so go2rtc sees a single
+    connection per camera no matter how many worker processes have viewers.
+    Runs on the StreamBuffer's event loop.
+    """
+
+    def __init__(self, fanout: StreamFanout, host='127.0.0.1', port=5004, ready_timeout=60):
+        self.fanout = fanout
+        self.host = host
+        self.port = port
+        self.ready_timeout = ready_timeout
+        self.loop = fanout.stream_buffer.loop
+        self._runner = None
+
+    def start(self):
+        """Start listening (thread-safe; blocks until the socket is bound)"""
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(timeout=10)
+        logger.info(f"Stream relay listening on {self.host}:{self.port}")
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/api/stream.mp4', self._handle_stream)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port, reuse_address=True).start()
+
+    async def _handle_stream(self, request: web.Request):
+        stream_name = request.query.get('src')
+        if not stream_name:
+            return web.Response(status=400, text='src is required')
+
+        subscription = self.fanout.subscribe_async(stream_name, self.loop)
+        if not await subscription.wait_ready_async(self.ready_timeout):
+            subscription.close()
+            return web.Response(status=503, text='stream unavailable')
+
+        response = web.StreamResponse(status=200, headers={'Content-Type': 'video/mp4'})
+        try:
+            await response.prepare(request)
+            async for chunk in subscription.iter_chunks_async():
+                await response.write(chunk)
+        except ConnectionResetError:
+            logger.debug(f"Relay client for {stream_name} disconnected")
+        finally:
+            subscription.close()
+        return response
+
+    def stop(self):
+        if self._runner is not None and self.loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self.loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Error stopping stream relay: {e}")
+            self._runner = None
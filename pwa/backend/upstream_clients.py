@@ -0,0 +1,153 @@
+import threading
+import time
+import logging
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+class UpstreamClient:
+    """
+    Keep-alive HTTP client for one upstream service (Frigate, go2rtc, the FFmpeg
+    service, ...). All calls share a requests Session whose connection pool keeps
+    up to pool_size idle connections open, so repeated calls skip the TCP
+    handshake. Connection failures are retried with backoff for every method;
+    read errors and 502/503/504 responses only for idempotent methods.
+
+    Paths are joined to base_url; absolute URLs are used as given.
+    """
+
+    def __init__(self, name: str, base_url: str, pool_size=10, connect_timeout=3.0, read_timeout=10.0,
+                 retries=2, backoff_factor=0.2):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}), raise_on_status=False)
+        # Callers never wait for a pooled connection; overflow connections are opened and discarded
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'errors': 0, 'retries': 0, 'peak_in_flight': 0, 'total_seconds': 0.0}
+
+    def url(self, path: str) -> str:
+        """Absolute URL for a path on this upstream"""
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, timeout=None, **kwargs) -> requests.Response:
+        """
+        Send a request through the pool. timeout is the read timeout in seconds
+        (the connect timeout stays at the client's setting); pass a tuple to set both.
+        """
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif not isinstance(timeout, tuple):
+            timeout = (min(self.connect_timeout, timeout), timeout)
+
+        with self._lock:
+            self.in_flight += 1
+            self.stats['requests'] += 1
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.in_flight)
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.stats['total_seconds'] += time.monotonic() - started
+
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            with self._lock:
+                self.stats['retries'] += len(retries.history)
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        """Close every pooled connection"""
+        self.session.close()
+
+    def _pool_status(self) -> dict:
+        """Connection counters from the urllib3 pools behind the session"""
+        opened = served = idle = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+        return {'connections_opened': opened, 'requests_served': served, 'idle_connections': idle}
+
+    def get_status(self) -> dict:
+        """Get request counters and connection pool usage"""
+        with self._lock:
+            status = dict(self.stats)
+            status['in_flight'] = self.in_flight
+        status['base_url'] = self.base_url
+        status['pool_size'] = self.pool_size
+        status.update(self._pool_status())
+        return status
+
+class UpstreamRegistry:
+    """Named UpstreamClients shared by the whole process"""
+
+    def __init__(self):
+        self.clients: Dict[str, UpstreamClient] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, base_url: str, **options) -> UpstreamClient:
+        """Create (or replace) the client for an upstream"""
+        client = UpstreamClient(name, base_url, **options)
+        with self._lock:
+            previous = self.clients.get(name)
+            self.clients[name] = client
+        if previous is not None:
+            previous.close()
+        logger.info(f"Registered upstream {name} at {client.base_url} (pool size {client.pool_size})")
+        return client
+
+    def get(self, name: str) -> UpstreamClient:
+        with self._lock:
+            return self.clients[name]
+
+    def __getitem__(self, name: str) -> UpstreamClient:
+        return self.get(name)
+
+    def close(self):
+        """Close every client's connections"""
+        with self._lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            client.close()
+
+    def get_status(self) -> dict:
+        """Get status of every registered upstream"""
+        with self._lock:
+            clients = list(self.clients.items())
+        return {name: client.get_status() for name, client in clients}
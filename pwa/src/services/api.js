@@ -17,7 +17,7 @@ class ApiService {
     localStorage.removeItem('auth_token');
   }
 
-  async request(endpoint, options = {}) {
+  async request(endpoint, { raw = false, ...options } = {}) {
     const url = `${API_BASE_URL}${endpoint}`;
     const config = {
       headers: {
@@ -64,8 +64,8 @@ class ApiService {
 
       // Handle different response types
       const contentType = response.headers.get('Content-Type');
-      if (contentType && contentType.includes('image/')) {
-        return response; // Return the response object for blob handling
+      if (raw || (contentType && contentType.includes('image/'))) {
+        return response; // Return the response object for blob/formData handling
       } else {
         return await response.json();
       }